@@ -0,0 +1,74 @@
+"""
+Etapas del pipeline que dependen de la API, servidas por replay_server
+"""
+
+import datetime
+
+import pytest
+
+from mecoda_minka.mecoda_minka import df_taxon
+
+import campaign_filters
+import minka_api
+import update_biodiverciutat
+import update_biomarato25
+from minka_api import map_concurrent
+from obs_stream import get_page_dfs
+from replay_server import load_api_cache
+
+DAYS = [
+    (datetime.date(2025, 5, 3) + datetime.timedelta(days=i)).strftime("%Y-%m-%d")
+    for i in range(30)
+]
+
+update_biomarato25.access_token = None
+# el replay no tiene /users: las consultas van sin not_user_id
+campaign_filters._user_ids = []
+# el árbol taxonómico de mecoda ya trae la columna marine; así no se descarga
+update_biomarato25._taxon_tree_cache = df_taxon
+
+
+def bench_species_pages(run_bench):
+    run_bench(update_biomarato25.get_marine_species, 417)
+
+
+def _day_metrics():
+    # sin los checkpoints de update_main_metrics_by_day, que responderían sin
+    # ir a la API
+    observations = update_biomarato25.get_observations_per_day(417, DAYS)
+    results = map_concurrent(
+        lambda day: update_biomarato25._fetch_day_totals(417, day), DAYS
+    )
+    return observations, results
+
+
+def bench_day_metrics(run_bench):
+    run_bench(_day_metrics)
+
+
+@pytest.mark.parametrize("http2", [False, True], ids=["requests", "httpx_http2"])
+def bench_day_metrics_transport(run_bench, api_server, monkeypatch, http2):
+    # 61 peticiones de recuento pequeñas al mismo host. El replay habla
+    # HTTP/1.1 sin TLS, así que httpx no negocia HTTP/2 ni multiplexa aquí: se
+    # compara el coste de cada cliente y las conexiones que abre (en
+    # extra_info["connections"]; con la API real y HTTP/2 sería una)
+    if http2:
+        pytest.importorskip("h2")
+    monkeypatch.setattr(minka_api, "HTTP2", http2)
+    run_bench(_day_metrics)
+    # keep-alive: las conexiones se reutilizan entre peticiones
+    assert api_server.connections < api_server.total_requests()
+
+
+@pytest.fixture(scope="module")
+def replay_obs():
+    # las observaciones del replay hacen de {id}_obs.csv descargado
+    return get_page_dfs(load_api_cache()["observations"])[0]
+
+
+def bench_users_leaderboard(run_bench, replay_obs):
+    run_bench(update_biomarato25.get_participation_df, 417, replay_obs)
+
+
+def bench_users_leaderboard_species_per_user(run_bench):
+    run_bench(update_biodiverciutat.get_participation_df, 233)
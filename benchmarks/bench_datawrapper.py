@@ -0,0 +1,77 @@
+"""
+Publicación en Datawrapper contra el servidor local: solo se suben los CSV
+que el manifiesto marca como modificados, se publican todos los gráficos de
+cada uno y, si no ha cambiado nada, no se hace ninguna petición.
+"""
+
+import json
+
+import pandas as pd
+import pytest
+
+import datawrapper_publish
+import output_writer
+from conftest import LATENCY
+from datawrapper_server import start_datawrapper_server
+
+CHARTS = {
+    "metrics.csv": "AbC12",
+    "users.csv": ["dEf34", "GhI56"],
+    "species.csv": "JkL78",
+}
+
+
+@pytest.fixture(scope="module")
+def api_server():
+    charts = [
+        c for ids in CHARTS.values() for c in ([ids] if isinstance(ids, str) else ids)
+    ]
+    server = start_datawrapper_server(latency=LATENCY, charts=charts)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def outputs(api_server, monkeypatch, tmp_path):
+    """
+    Escribe los CSV dos veces como dos ejecuciones del pipeline; en la
+    segunda solo cambia users.csv. Devuelve una función que escribe el
+    manifiesto de la segunda ejecución (cambiando users.csv o no).
+    """
+    monkeypatch.setattr(datawrapper_publish, "DATAWRAPPER_API", api_server.url)
+    charts_path = tmp_path / "charts.json"
+    charts_path.write_text(
+        json.dumps({str(tmp_path / path): ids for path, ids in CHARTS.items()})
+    )
+
+    def tables(users):
+        return {
+            "metrics.csv": pd.DataFrame({"day": ["2025-05-03"], "obs": [10]}),
+            "users.csv": pd.DataFrame({"participant": ["a", "b"], "obs": users}),
+            "species.csv": pd.DataFrame({"taxon_id": [1, 2], "obs": [3, 4]}),
+        }
+
+    def run(users):
+        monkeypatch.setattr(output_writer, "_files", {})
+        for path, df in tables(users).items():
+            output_writer.write_csv(df, str(tmp_path / path))
+        manifest_path = str(tmp_path / "changes.json")
+        output_writer.write_manifest(manifest_path)
+        return manifest_path, str(charts_path)
+
+    run([1, 2])
+    return run
+
+
+def bench_datawrapper_publish_changed(run_bench, api_server, outputs, tmp_path):
+    manifest_path, charts_path = outputs([5, 2])
+    run_bench(datawrapper_publish.publish_changed, manifest_path, charts_path, "x")
+    users = (tmp_path / "users.csv").read_bytes()
+    assert api_server.uploads == {"dEf34": users, "GhI56": users}
+    assert api_server.published == {"dEf34", "GhI56"}
+
+
+def bench_datawrapper_publish_unchanged(run_bench, api_server, outputs):
+    manifest_path, charts_path = outputs([1, 2])
+    run_bench(datawrapper_publish.publish_changed, manifest_path, charts_path, "x")
+    assert api_server.total_requests() == 0
@@ -0,0 +1,58 @@
+"""
+Descarga de fotos de photo_sync contra el servidor local de fotos: galería
+nueva (todo se descarga) y sincronización sin cambios (nada que pedir, o 304
+con revalidate). El número de fotos se ajusta con BENCH_PHOTOS.
+"""
+
+import os
+import tempfile
+
+import pandas as pd
+import pytest
+
+import photo_sync
+from conftest import LATENCY
+from photo_server import start_photo_server
+
+PHOTOS = int(os.getenv("BENCH_PHOTOS", "300"))
+
+
+@pytest.fixture(scope="module")
+def api_server():
+    # una de cada 10 fotos se corta a mitad la primera vez
+    server = start_photo_server(latency=LATENCY, interrupt=range(0, PHOTOS, 10))
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def refs(api_server, monkeypatch):
+    monkeypatch.setattr(photo_sync, "PHOTO_HOST", api_server.url)
+    # varias fotos por observación y algunas repetidas en otra observación
+    return pd.DataFrame(
+        {
+            "id": [i // 3 for i in range(PHOTOS)] + [PHOTOS, PHOTOS + 1],
+            "photos_id": list(range(PHOTOS)) + [0, 1],
+            "extension": "jpg",
+        }
+    )
+
+
+def _sync_until_done(refs, photos_dir):
+    # las descargas cortadas se reanudan en la siguiente pasada
+    while photo_sync.sync_photos(refs, photos_dir)["errors"]:
+        pass
+
+
+def bench_photo_sync_fresh(run_bench, refs):
+    run_bench(lambda: _sync_until_done(refs, tempfile.mkdtemp(prefix="photos")))
+
+
+def bench_photo_sync_unchanged(run_bench, refs, tmp_path):
+    _sync_until_done(refs, str(tmp_path))
+    run_bench(photo_sync.sync_photos, refs, str(tmp_path))
+
+
+def bench_photo_sync_revalidate(run_bench, refs, tmp_path):
+    _sync_until_done(refs, str(tmp_path))
+    run_bench(lambda: photo_sync.sync_photos(refs, str(tmp_path), revalidate=True))
@@ -0,0 +1,154 @@
+"""
+get_list_users, get_marine_count, la descarga de observaciones, la mezcla
+de CSV, la clasificación incremental y la reconciliación de ids sobre una campaña sintética. El tamaño se ajusta con BENCH_SCALE_OBS / BENCH_SCALE_USERS
+(10× BioMARató: BENCH_SCALE_OBS=1000000 BENCH_SCALE_USERS=10000).
+"""
+
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pytest
+
+import campaign_filters
+import checkpoints
+import minka_api
+import obs_stream
+import reconcile
+import update_biomarato25
+from conftest import LATENCY
+from leaderboard import Leaderboard
+from output_writer import write_csv
+from replay_server import start_server
+from schema import apply_obs_schema, read_obs
+from synthetic import SyntheticCampaign
+
+SCALE_OBS = int(os.getenv("BENCH_SCALE_OBS", "100000"))
+SCALE_USERS = int(os.getenv("BENCH_SCALE_USERS", "10000"))
+
+
+@pytest.fixture(scope="module")
+def campaign():
+    return SyntheticCampaign(SCALE_OBS, SCALE_USERS)
+
+
+@pytest.fixture(scope="module")
+def api_server(campaign):
+    server = start_server(campaign, latency=LATENCY)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope="module")
+def tables(campaign, tmp_path_factory):
+    prefix = str(tmp_path_factory.mktemp("synthetic") / "417")
+    campaign.write_tables(prefix)
+    return prefix
+
+
+def bench_scale_list_users(run_bench, api_server, monkeypatch, tables):
+    monkeypatch.setattr(update_biomarato25, "API_PATH", api_server.url)
+    monkeypatch.setattr(update_biomarato25, "access_token", None, raising=False)
+    monkeypatch.setattr(campaign_filters, "_user_ids", [])
+    # como {id}_obs.csv del proyecto, que solo tiene las de grado research
+    df_obs = read_obs(f"{tables}_obs.csv")
+    df_obs = df_obs[df_obs["quality_grade"] == "research"]
+    run_bench(update_biomarato25.get_list_users, 417, df_obs)
+
+
+def bench_scale_marine_count(run_bench, campaign, tables):
+    df_obs = read_obs(f"{tables}_obs.csv")
+    df_filtered = pd.merge(
+        df_obs, campaign.taxa[["taxon_id", "marine"]], on="taxon_id", how="left"
+    )
+    run_bench(update_biomarato25.get_marine_count, df_filtered)
+
+
+def bench_scale_obs_load_merge_write(run_bench, campaign, tables, tmp_path):
+    # las últimas 1000 observaciones como actualizadas
+    df_new = campaign.obs_frame().head(1000)
+    target = tmp_path / "obs.csv"
+
+    def load_merge_write():
+        df_obs = read_obs(f"{tables}_obs.csv")
+        old_obs = df_obs[-df_obs["id"].isin(df_new["id"].to_list())]
+        df_updated = apply_obs_schema(
+            pd.concat([old_obs, df_new], ignore_index=True)
+        ).sort_values(by="id", ascending=False)
+        target.unlink(missing_ok=True)
+        write_csv(df_updated, target)
+
+    run_bench(load_merge_write)
+
+
+@pytest.mark.parametrize("shards", [0, 4])
+def bench_scale_stream_obs(run_bench, api_server, monkeypatch, tmp_path, shards):
+    # los 10 primeros días de la campaña, en una sola paginación o en tramos
+    # de ids descargados a la vez
+    monkeypatch.setattr(minka_api, "API_PATH", api_server.url)
+
+    def download():
+        # sin checkpoints de la ronda anterior
+        monkeypatch.setattr(checkpoints, "CHECKPOINT_DIR", tempfile.mkdtemp())
+        obs_stream.stream_obs(
+            str(tmp_path / "obs.csv"),
+            str(tmp_path / "photos.csv"),
+            shards=shards,
+            created_d2="2025-05-12",
+        )
+
+    run_bench(download)
+
+
+@pytest.mark.parametrize("delta", [0, 1000], ids=["full", "delta"])
+def bench_scale_leaderboard(run_bench, tables, delta):
+    # toda la campaña desde cero o con el estado guardado sin las delta
+    # observaciones más recientes
+    df_obs = read_obs(f"{tables}_obs.csv")
+    name = f"bench_scale_{delta}"
+    if delta:
+        newest = df_obs["id"].nlargest(delta)
+        base = Leaderboard()
+        base.sync(df_obs[~df_obs["id"].isin(newest)])
+        base.save(name)
+    run_bench(lambda: Leaderboard.load(name).sync(df_obs))
+
+
+def bench_scale_reconcile(run_bench, api_server, monkeypatch, tables):
+    # la misma consulta que bench_scale_stream_obs, solo con los ids
+    monkeypatch.setattr(minka_api, "API_PATH", api_server.url)
+
+    def diff():
+        local = reconcile.local_ids(f"{tables}_obs.csv")
+        return reconcile.diff_ids(
+            local, reconcile.remote_ids({"created_d2": "2025-05-12"})
+        )
+
+    run_bench(diff)
+
+
+def bench_scale_update_obs(run_bench, api_server, monkeypatch, tmp_path):
+    # los 10 primeros días sin sus 1000 observaciones más nuevas: la
+    # reconciliación da esos ids y solo se piden ellos
+    monkeypatch.setattr(minka_api, "API_PATH", api_server.url)
+    monkeypatch.setattr(checkpoints, "CHECKPOINT_DIR", tempfile.mkdtemp())
+    params = {"created_d2": "2025-05-12"}
+    base = tmp_path / "base"
+    base.mkdir()
+    obs_stream.stream_obs(str(base / "x_obs.csv"), str(base / "x_photos.csv"), **params)
+    df_obs = read_obs(base / "x_obs.csv")
+    newest = df_obs["id"].nlargest(1000).to_numpy()
+    reconcile.drop_ids(str(base / "x_obs.csv"), str(base / "x_photos.csv"), newest)
+
+    def update():
+        for name in os.listdir(base):
+            shutil.copyfile(base / name, tmp_path / name)
+        obs_stream.update_obs(
+            str(tmp_path / "x_obs.csv"),
+            str(tmp_path / "x_photos.csv"),
+            newest,
+            **params,
+        )
+
+    run_bench(update)
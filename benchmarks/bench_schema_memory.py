@@ -0,0 +1,75 @@
+"""
+Pico de memoria (RSS) al cargar un {id}_obs.csv con tipos por defecto y con
+los tipos compactos de schema.py.
+
+El CSV se replica hasta llegar a --rows filas para simular las tablas de
+BioMARató (~94k observaciones). Cada carga se mide en un proceso aparte.
+
+    python benchmarks/bench_schema_memory.py --rows 94000
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOADERS = {
+    "baseline": "import schema, pandas as pd; df = pd.DataFrame()",
+    "default": "import pandas as pd; df = pd.read_csv(path)",
+    "schema": "from schema import read_obs; df = read_obs(path)",
+}
+
+
+def build_csv(source, rows, path):
+    df = pd.read_csv(source)
+    reps = max(1, -(-rows // len(df)))
+    big = pd.concat([df] * reps, ignore_index=True).head(rows)
+    big["id"] = range(1, len(big) + 1)
+    big.to_csv(path, index=False)
+    return len(big)
+
+
+def peak_rss_mb(loader, path):
+    code = (
+        f"import resource, sys; sys.path.insert(0, {ROOT!r}); path = {path!r}; "
+        f"{loader}; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "
+        "df.memory_usage(deep=True).sum())"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    peak, frame = out.stdout.split()
+    # ru_maxrss está en KB en Linux
+    return int(peak) / 1024, int(frame) / 1024**2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--source", default=os.path.join(ROOT, "data/biodiverciutat25/233_obs.csv")
+    )
+    parser.add_argument("--rows", type=int, default=94000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "obs.csv")
+        rows = build_csv(args.source, args.rows, path)
+        print(f"Filas: {rows}")
+
+        results = {}
+        for name, loader in LOADERS.items():
+            results[name] = peak_rss_mb(loader, path)
+            rss, frame = results[name]
+            print(f"{name:>8}: pico RSS {rss:8.1f} MB, DataFrame {frame:8.1f} MB")
+
+        base = results["baseline"][0]
+        ratio = (results["default"][0] - base) / (results["schema"][0] - base)
+        print(f"Pico RSS sobre el intérprete {ratio:.1f}x menor con schema")
+        ratio = results["default"][1] / results["schema"][1]
+        print(f"DataFrame {ratio:.1f}x más pequeño con schema")
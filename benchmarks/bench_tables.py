@@ -0,0 +1,103 @@
+"""
+Etapas locales del pipeline sobre las tablas de data/ y las páginas de
+observaciones guardadas en data/api_cache.
+
+bench_get_dfs comprueba además que get_page_dfs da las mismas tablas que
+get_obs + get_dfs de mecoda-minka (versión fijada en requirements.txt).
+"""
+
+import os
+
+import mecoda_minka
+import pandas as pd
+from mecoda_minka.mecoda_minka import df_taxon
+from pandas.testing import assert_frame_equal
+
+import update_biomarato25
+from obs_stream import get_page_dfs, iter_converted_pages
+from output_writer import write_csv
+from replay_server import load_api_cache
+from schema import (
+    OBS_DTYPES,
+    PHOTOS_DTYPES,
+    apply_obs_schema,
+    apply_photos_schema,
+    read_obs,
+)
+
+OBS_PATH = "data/biodiverciutat25/233_obs.csv"
+
+_observations = load_api_cache()["observations"]
+PAGES = [_observations[i : i + 200] for i in range(0, len(_observations), 200)]
+
+
+def _with_marine(df_obs):
+    df_filtered = df_obs[df_obs["taxon_id"].notnull()].copy()
+    return pd.merge(
+        df_filtered, df_taxon[["taxon_id", "marine"]], on="taxon_id", how="left"
+    )
+
+
+def bench_marine_count(run_bench):
+    df_filtered = _with_marine(read_obs(OBS_PATH))
+    run_bench(update_biomarato25.get_marine_count, df_filtered)
+
+
+def bench_taxonomy_merge(run_bench):
+    df_obs = read_obs(OBS_PATH)
+    run_bench(_with_marine, df_obs)
+
+
+def bench_page_dfs(run_bench):
+    def flatten():
+        return [get_page_dfs(page) for page in PAGES]
+
+    run_bench(flatten)
+
+
+def bench_get_dfs(run_bench, api_server, monkeypatch):
+    # get_obs descarga del servidor de replay; hasta 1000 observaciones no
+    # consulta ninguna otra URL
+    monkeypatch.setattr(mecoda_minka.mecoda_minka, "API_PATH", api_server.url)
+    observations = mecoda_minka.get_obs(id_project=233, num_max=1000)
+    df_obs, df_photos = run_bench(mecoda_minka.get_dfs, observations)
+
+    ids = set(df_obs["id"])
+    page = [result for result in _observations if result["id"] in ids]
+    page_obs, page_photos = get_page_dfs(page)
+    expected_obs = apply_obs_schema(df_obs.reindex(columns=list(OBS_DTYPES)))
+    assert_frame_equal(
+        page_obs.reset_index(drop=True),
+        expected_obs.sort_values("id", ascending=False, ignore_index=True),
+    )
+    expected_photos = apply_photos_schema(
+        df_photos.reindex(columns=list(PHOTOS_DTYPES))
+    )
+    assert_frame_equal(
+        page_photos.sort_values(["id", "photos_id"], ignore_index=True),
+        expected_photos.sort_values(["id", "photos_id"], ignore_index=True),
+    )
+
+
+def bench_page_dfs_processes(run_bench):
+    def flatten():
+        return list(iter_converted_pages(PAGES, processes=os.cpu_count()))
+
+    run_bench(flatten)
+
+
+def bench_obs_load_merge_write(run_bench, tmp_path):
+    df_new = pd.concat([get_page_dfs(page)[0] for page in PAGES], ignore_index=True)
+    target = tmp_path / "obs.csv"
+
+    def load_merge_write():
+        # como update_obs: sustituye las observaciones actualizadas
+        df_obs = read_obs(OBS_PATH)
+        old_obs = df_obs[-df_obs["id"].isin(df_new["id"].to_list())]
+        df_updated = apply_obs_schema(
+            pd.concat([old_obs, df_new], ignore_index=True)
+        ).sort_values(by="id", ascending=False)
+        target.unlink(missing_ok=True)
+        write_csv(df_updated, target)
+
+    run_bench(load_merge_write)
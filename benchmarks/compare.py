@@ -0,0 +1,83 @@
+"""
+Compara dos ejecuciones guardadas en benchmarks/.results: tiempo medio,
+número de peticiones y de conexiones y pico de memoria de cada benchmark.
+
+    python benchmarks/compare.py                 # las dos últimas
+    python benchmarks/compare.py 0003 0007       # por número de ejecución
+    python benchmarks/compare.py --threshold 0.2 # falla si algo empeora >20%
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".results")
+
+METRICS = {
+    "mean_s": lambda b: b["stats"]["mean"],
+    "requests": lambda b: b["extra_info"].get("requests"),
+    "connections": lambda b: b["extra_info"].get("connections"),
+    "peak_memory_mb": lambda b: b["extra_info"].get("peak_memory_mb"),
+}
+
+
+def saved_runs(results_dir=RESULTS_DIR):
+    return sorted(
+        glob.glob(os.path.join(results_dir, "*", "*.json")),
+        key=os.path.basename,
+    )
+
+
+def find_run(prefix, runs):
+    for path in runs:
+        if os.path.basename(path).startswith(prefix):
+            return path
+    raise SystemExit(f"No hay ninguna ejecución {prefix} en {RESULTS_DIR}")
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    return {
+        b["name"]: {metric: get(b) for metric, get in METRICS.items()}
+        for b in data["benchmarks"]
+    }
+
+
+def compare(old, new, threshold=None):
+    regressions = []
+    print(f"{'benchmark':45} {'métrica':15} {'antes':>12} {'ahora':>12} {'cambio':>8}")
+    for name in sorted(set(old) | set(new)):
+        for metric in METRICS:
+            before = old.get(name, {}).get(metric)
+            after = new.get(name, {}).get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            print(f"{name:45} {metric:15} {before:12.4g} {after:12.4g} {change:+8.1%}")
+            if threshold is not None and change > threshold:
+                regressions.append((name, metric, change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("runs", nargs="*", help="números de ejecución (0001, ...)")
+    parser.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args()
+
+    runs = saved_runs()
+    if args.runs:
+        paths = [find_run(prefix, runs) for prefix in args.runs[-2:]]
+    else:
+        paths = runs[-2:]
+    if len(paths) < 2:
+        raise SystemExit("Hacen falta dos ejecuciones guardadas para comparar")
+
+    print(f"{os.path.basename(paths[0])}\n  -> {os.path.basename(paths[1])}\n")
+    regressions = compare(load(paths[0]), load(paths[1]), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regresiones por encima de {args.threshold:.0%}")
+        sys.exit(1)
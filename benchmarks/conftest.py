@@ -0,0 +1,87 @@
+"""
+Arranca el servidor de replay antes de importar los scripts, para que
+minka_api lea MINKA_API_PATH apuntando a él.
+
+    cd benchmarks
+    BENCH_LATENCY=0.05 python -m pytest
+    python compare.py            # compara las dos últimas ejecuciones guardadas
+"""
+
+import os
+import tempfile
+import tracemalloc
+
+import pytest
+
+from replay_server import ROOT, start_server
+
+LATENCY = float(os.getenv("BENCH_LATENCY", "0.02"))
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "3"))
+
+_server = None
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    global _server
+    _server = start_server(latency=LATENCY)
+    os.environ["MINKA_API_PATH"] = _server.url
+    # caché HTTP vacía en cada sesión: la primera ronda descarga y las
+    # siguientes reciben 304
+    os.environ.setdefault("MINKA_HTTP_CACHE", tempfile.mkdtemp(prefix="http_cache"))
+    # y sin las clasificaciones guardadas por los scripts
+    os.environ.setdefault("LEADERBOARD_DIR", tempfile.mkdtemp(prefix="leaderboards"))
+    # los scripts usan rutas relativas a la raíz del repositorio
+    os.chdir(ROOT)
+
+
+def pytest_unconfigure(config):
+    if _server is not None:
+        _server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def replay_api():
+    return _server
+
+
+@pytest.fixture
+def api_server(replay_api):
+    """
+    Servidor cuyas peticiones se cuentan; bench_scale.py lo sustituye por el
+    de la campaña sintética
+    """
+    return replay_api
+
+
+@pytest.fixture
+def run_bench(benchmark, api_server):
+    """
+    Ejecuta func una vez midiendo peticiones, conexiones y pico de memoria
+    (se guardan en extra_info) y después la cronometra
+    """
+
+    # importado aquí: minka_api lee MINKA_API_PATH al importarse
+    from minka_api import clear_memo
+
+    def run(func, *args):
+        # cada ronda empieza sin la memoria de peticiones de la anterior
+        clear_memo()
+        api_server.reset_requests()
+        tracemalloc.start()
+        try:
+            func(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["requests"] = api_server.total_requests()
+        benchmark.extra_info["requests_by_endpoint"] = dict(api_server.requests)
+        # el servidor de Datawrapper no cuenta conexiones
+        benchmark.extra_info["connections"] = getattr(api_server, "connections", None)
+        benchmark.extra_info["peak_memory_mb"] = round(peak / 1024**2, 2)
+        benchmark.extra_info["latency"] = LATENCY
+        return benchmark.pedantic(
+            func, args=args, setup=clear_memo, rounds=ROUNDS, iterations=1
+        )
+
+    return run
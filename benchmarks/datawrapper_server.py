@@ -0,0 +1,113 @@
+"""
+Servidor local que imita la API de Datawrapper (PUT /v3/charts/{id}/data y
+POST /v3/charts/{id}/publish) para probar datawrapper_publish sin red.
+
+Guarda los últimos datos subidos a cada gráfico y los gráficos publicados.
+Sin "Authorization: Bearer ..." responde 401; a gráficos fuera de charts
+(si se indica), 404.
+
+    python benchmarks/datawrapper_server.py --port 8767
+    DATAWRAPPER_API_PATH=http://127.0.0.1:8767/v3 DATAWRAPPER_API_TOKEN=x \\
+        python datawrapper_publish.py
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PATH_RE = re.compile(r"^/v3/charts/(\w+)/(data|publish)$")
+
+
+class DatawrapperHandler(BaseHTTPRequestHandler):
+    def _handle(self, method):
+        server = self.server
+        time.sleep(server.latency)
+        match = PATH_RE.match(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        expected = {"data": "PUT", "publish": "POST"}
+        if not match or expected[match.group(2)] != method:
+            self.send_error(404)
+            return
+        chart_id, action = match.groups()
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self.send_error(401)
+            return
+        if server.charts is not None and chart_id not in server.charts:
+            self.send_error(404)
+            return
+
+        with server.lock:
+            server.requests[action] += 1
+            if action == "data":
+                server.uploads[chart_id] = body
+            else:
+                server.published.add(chart_id)
+
+        if action == "data":
+            self.send_response(204)
+            self.end_headers()
+            return
+        data = json.dumps({"data": {"id": chart_id}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DatawrapperServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, charts=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), DatawrapperHandler)
+        self.latency = latency
+        self.charts = None if charts is None else set(charts)
+        self.requests = Counter()
+        self.uploads = {}
+        self.published = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v3"
+
+    def reset_requests(self):
+        with self.lock:
+            self.requests.clear()
+            self.uploads.clear()
+            self.published.clear()
+
+    def total_requests(self):
+        return sum(self.requests.values())
+
+
+def start_datawrapper_server(latency=0.0, charts=None, port=0) -> DatawrapperServer:
+    server = DatawrapperServer(latency, charts, port=port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = DatawrapperServer(args.latency, port=args.port)
+    print(f"Sirviendo Datawrapper en {server.url}")
+    server.serve_forever()
@@ -0,0 +1,132 @@
+"""
+Servidor local que imita el de las fotos de Minka
+(/attachments/local_photos/files/{photos_id}/medium.{ext}) para probar
+photo_sync sin red.
+
+El contenido de cada foto es fijo (sale del photos_id) y se sirve con ETag,
+If-None-Match (304) y Range (206). Los photos_id de interrupt se cortan a
+mitad la primera vez que se piden, para probar la reanudación.
+
+    python benchmarks/photo_server.py --port 8766
+    MINKA_PHOTO_URL=http://127.0.0.1:8766/attachments/local_photos/files/ \\
+        python photo_sync.py data/biomarato25/417_photos.csv
+"""
+
+import argparse
+import hashlib
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PHOTO_PATH = "/attachments/local_photos/files/"
+PATH_RE = re.compile(rf"^{PHOTO_PATH}(\d+)/medium\.(\w+)$")
+RANGE_RE = re.compile(r"^bytes=(\d+)-$")
+
+
+def photo_bytes(photos_id, size=None) -> bytes:
+    """
+    Contenido fijo de una foto, de 20 a 80 KB
+    """
+    seed = hashlib.sha256(str(photos_id).encode()).digest()
+    size = size or 20_000 + int.from_bytes(seed[:2], "big") % 60_000
+    block = hashlib.sha512(seed).digest()
+    return (block * (size // len(block) + 1))[:size]
+
+
+class PhotoHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        match = PATH_RE.match(self.path)
+        if not match:
+            self.send_error(404)
+            return
+        photos_id = int(match.group(1))
+        data = photo_bytes(photos_id)
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+
+        with server.lock:
+            server.requests["photos"] += 1
+            interrupted = photos_id in server.interrupt
+            server.interrupt.discard(photos_id)
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        start = 0
+        range_match = RANGE_RE.match(self.headers.get("Range", ""))
+        if range_match:
+            start = int(range_match.group(1))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+            )
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if interrupted:
+            # se corta la conexión a mitad del cuerpo
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PhotoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, interrupt=(), host="127.0.0.1", port=0):
+        super().__init__((host, port), PhotoHandler)
+        self.latency = latency
+        self.interrupt = set(interrupt)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{PHOTO_PATH}"
+
+    def reset_requests(self):
+        with self.lock:
+            self.requests.clear()
+
+    def total_requests(self):
+        return sum(self.requests.values())
+
+
+def start_photo_server(latency=0.0, interrupt=(), port=0) -> PhotoServer:
+    server = PhotoServer(latency, interrupt, port=port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = PhotoServer(args.latency, port=args.port)
+    print(f"Sirviendo fotos en {server.url}")
+    server.serve_forever()
@@ -0,0 +1,319 @@
+"""
+Servidor local que imita los endpoints de la API de Minka que usan los
+scripts, a partir de las respuestas guardadas en data/api_cache.
+
+Las respuestas guardadas no conservan la URL, así que se agrupan por tipo
+(observations, species_counts, observers, identifiers) y se sirven como un
+único conjunto, paginado con page/per_page e id_below/id_above. Cada
+respuesta puede retrasarse para simular la latencia real y lleva ETag, así
+que las peticiones condicionales reciben 304. Habla HTTP/1.1 con keep-alive,
+como la API, y cuenta las conexiones abiertas para ver cuánto las reutiliza
+cada cliente.
+
+    python benchmarks/replay_server.py --port 8765 --latency 0.05
+    MINKA_API_PATH=http://127.0.0.1:8765/v1 python update_biodiverciutat.py
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(ROOT, "data", "api_cache")
+
+DEFAULT_PER_PAGE = {"observations": 30}
+
+
+def _kind(result):
+    if "observed_on" in result:
+        return "observations"
+    if "taxon" in result and "count" in result:
+        return "species_counts"
+    if "observation_count" in result:
+        return "observers"
+    if "user_id" in result and "count" in result:
+        return "identifiers"
+    return None
+
+
+def _taxa(observations, species_counts):
+    taxa = {}
+    for taxon in [o.get("taxon") for o in observations] + [
+        s["taxon"] for s in species_counts
+    ]:
+        if taxon and taxon.get("id"):
+            taxa[taxon["id"]] = {
+                "id": taxon["id"],
+                "name": taxon.get("name"),
+                "rank": taxon.get("rank"),
+                "ancestry": taxon.get("ancestry"),
+            }
+    return taxa
+
+
+def load_api_cache(cache_dir=CACHE_DIR) -> dict:
+    """
+    Junta todas las respuestas guardadas en {endpoint: [resultados]}, sin
+    repetidos
+    """
+    keys = {
+        "observations": lambda r: r["id"],
+        "species_counts": lambda r: r["taxon"]["id"],
+        "observers": lambda r: r["user_id"],
+        "identifiers": lambda r: r["user_id"],
+    }
+    found = {kind: {} for kind in keys}
+    for path in sorted(glob.glob(os.path.join(cache_dir, "*.json"))):
+        with open(path) as f:
+            data = json.load(f)
+        for result in data.get("results") or []:
+            kind = _kind(result)
+            if kind:
+                found[kind].setdefault(keys[kind](result), result)
+
+    dataset = {kind: list(results.values()) for kind, results in found.items()}
+    dataset["observations"].sort(key=lambda r: r["id"], reverse=True)
+    dataset["species_counts"].sort(key=lambda r: -r["count"])
+    dataset["observers"].sort(key=lambda r: -r["observation_count"])
+    dataset["identifiers"].sort(key=lambda r: -r["count"])
+    dataset["taxa"] = _taxa(dataset["observations"], dataset["species_counts"])
+    return dataset
+
+
+def _param(query, name, cast=str, default=None):
+    values = query.get(name)
+    if not values or values[0] == "":
+        return default
+    return cast(values[0])
+
+
+def _user_species(observations, user_login):
+    counts = Counter(
+        o["taxon"]["id"]
+        for o in observations
+        if (o.get("user") or {}).get("login") == user_login and o.get("taxon")
+    )
+    return [{"count": n, "taxon": {"id": taxon_id}} for taxon_id, n in counts.items()]
+
+
+def paginate(results, endpoint, query, total=None):
+    per_page = _param(query, "per_page", int, DEFAULT_PER_PAGE.get(endpoint, 500))
+    page = _param(query, "page", int, 1)
+    start = (page - 1) * per_page
+    return {
+        "total_results": len(results) if total is None else total,
+        "page": page,
+        "per_page": per_page,
+        "results": results[start : start + per_page],
+    }
+
+
+def select(dataset, endpoint, query):
+    """
+    Resultados que corresponden a una consulta, antes de paginar
+    """
+    if endpoint == "observations":
+        results = dataset["observations"]
+        id_below = _param(query, "id_below", int)
+        id_above = _param(query, "id_above", int)
+        user_login = _param(query, "user_login")
+        created_d1 = _param(query, "created_d1", default="")[:10]
+        created_d2 = _param(query, "created_d2", default="9999")[:10]
+        updated_since = _param(query, "updated_since", default="")[:10]
+        ids = _param(query, "id")
+        if ids is not None:
+            wanted = {int(i) for i in ids.split(",")}
+            results = [r for r in results if r["id"] in wanted]
+        if updated_since:
+            results = [
+                r for r in results if (r.get("updated_at") or "")[:10] >= updated_since
+            ]
+        if id_below is not None:
+            results = [r for r in results if r["id"] < id_below]
+        if id_above is not None:
+            results = [r for r in results if r["id"] > id_above]
+        if user_login is not None:
+            results = [
+                r for r in results if (r.get("user") or {}).get("login") == user_login
+            ]
+        if created_d1 or created_d2 != "9999":
+            results = [
+                r
+                for r in results
+                if created_d1 <= (r.get("created_at") or "")[:10] <= created_d2
+            ]
+        if _param(query, "order") == "asc":
+            results = results[::-1]
+        return results
+    if endpoint == "species_counts" and _param(query, "user_login"):
+        return _user_species(dataset["observations"], _param(query, "user_login"))
+    return dataset[endpoint]
+
+
+def taxon_response(dataset, taxon_id):
+    taxa = dataset["taxa"]
+    taxon = taxa.get(taxon_id)
+    if taxon is None:
+        return {"total_results": 0, "results": []}
+    ancestors = [
+        taxa[int(i)]
+        for i in (taxon.get("ancestry") or "").split("/")
+        if i.isdigit() and int(i) in taxa
+    ]
+    return {"total_results": 1, "results": [{**taxon, "ancestors": ancestors}]}
+
+
+def histogram_response(counts):
+    """
+    /observations/histogram?interval=day a partir de {día: observaciones}
+    """
+    days = {day: counts[day] for day in sorted(counts)}
+    return {
+        "total_results": len(days),
+        "page": 1,
+        "per_page": len(days),
+        "results": {"day": days},
+    }
+
+
+class CachedDataset:
+    """
+    Respuestas a partir de load_api_cache(). Cualquier objeto con endpoints,
+    response() y taxon() sirve como dataset (ver synthetic.py)
+    """
+
+    endpoints = [
+        "observations",
+        "species_counts",
+        "observers",
+        "identifiers",
+        "histogram",
+    ]
+
+    def __init__(self, data):
+        self.data = data
+
+    def sizes(self):
+        return {k: len(v) for k, v in self.data.items()}
+
+    def response(self, endpoint, query):
+        if endpoint == "histogram":
+            created_d1 = _param(query, "created_d1", default="")[:10]
+            created_d2 = _param(query, "created_d2", default="9999")[:10]
+            days = (o.get("created_at", "")[:10] for o in self.data["observations"])
+            return histogram_response(
+                Counter(day for day in days if day and created_d1 <= day <= created_d2)
+            )
+        body = paginate(select(self.data, endpoint, query), endpoint, query)
+        if endpoint == "observations" and _param(query, "only_id") == "true":
+            body["results"] = [{"id": r["id"]} for r in body["results"]]
+        return body
+
+    def taxon(self, taxon_id):
+        return taxon_response(self.data, taxon_id)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    # con HTTP/1.0 se cerraría la conexión tras cada respuesta
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p and p != "v1"]
+
+        if parts[:1] == ["taxa"] and len(parts) == 2 and parts[1].isdigit():
+            endpoint = "taxa"
+            body = server.dataset.taxon(int(parts[1]))
+        elif parts == ["observations"] or (
+            len(parts) == 2
+            and parts[0] == "observations"
+            and parts[1] in server.dataset.endpoints
+        ):
+            endpoint = parts[-1]
+            body = server.dataset.response(endpoint, query)
+        else:
+            self.send_error(404)
+            return
+
+        with server.lock:
+            server.requests[endpoint] += 1
+        data = json.dumps(body).encode()
+        # ETag como el de la API: con If-None-Match igual se responde 304
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, dataset, latency=0.0, host="127.0.0.1", port=0):
+        super().__init__((host, port), ReplayHandler)
+        if isinstance(dataset, dict):
+            dataset = CachedDataset(dataset)
+        self.dataset = dataset
+        self.latency = latency
+        self.requests = Counter()
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reset_requests(self):
+        with self.lock:
+            self.requests.clear()
+            self.connections = 0
+
+    def total_requests(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+
+def start_server(dataset=None, latency=0.0, port=0) -> ReplayServer:
+    """
+    Arranca el servidor en un hilo; server.url es el valor de MINKA_API_PATH
+    """
+    server = ReplayServer(dataset or load_api_cache(), latency, port=port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ReplayServer(load_api_cache(), args.latency, port=args.port)
+    print(f"Sirviendo {server.dataset.sizes()} en {server.url}")
+    server.serve_forever()
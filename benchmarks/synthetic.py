@@ -0,0 +1,461 @@
+"""
+Campañas sintéticas para probar los scripts por encima del volumen real
+(~94k observaciones en BioMARató).
+
+Las observaciones se guardan por columnas (numpy) y las respuestas de la API
+se construyen solo para la página pedida, así que 1M de observaciones caben en
+memoria. Las especies se toman del árbol taxonómico de mecoda, con su
+ancestry y su columna marine, para que get_page_dfs las resuelva igual que
+las reales. La popularidad de especies y participantes sigue una ley de Zipf.
+
+    # tablas {prefix}_obs.csv / _photos.csv
+    python benchmarks/synthetic.py --obs 1000000 --users 10000 --out /tmp/sim/417
+
+    # API local
+    python benchmarks/synthetic.py --obs 1000000 --users 10000 --serve --port 8765
+    MINKA_API_PATH=http://127.0.0.1:8765/v1 python update_biomarato25.py
+"""
+
+import argparse
+import datetime
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from mecoda_minka import ICONIC_TAXON
+from mecoda_minka.mecoda_minka import df_taxon
+
+from obs_stream import _taxon_columns
+from output_writer import write_csv
+from photo_store import PHOTO_URL, write_photos
+from replay_server import ReplayServer, _param, histogram_response, paginate
+from schema import OBS_DTYPES, apply_obs_schema, apply_photos_schema
+
+LICENSES = np.array(["cc-by", "cc-by-nc", "cc-by-sa", "cc0"], dtype=object)
+LICENSE_NAMES = {
+    "cc-by": "CC BY",
+    "cc-by-nc": "CC BY-NC",
+    "cc-by-sa": "CC BY-SA",
+    "cc0": "CC0",
+}
+GRADES = np.array(["research", "needs_id", "casual"], dtype=object)
+PLACES = np.array(
+    [
+        "Barcelona, Catalunya, Espanya",
+        "Tarragona, Catalunya, Espanya",
+        "Girona, Catalunya, Espanya",
+        "Platja de Garbet, Girona, España",
+        "l'Ametlla de Mar, Tarragona, España",
+    ],
+    dtype=object,
+)
+
+
+def _zipf_weights(n, exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _iconic_id(ancestry):
+    iconic = [int(i) for i in ancestry.split("/") if int(i) in ICONIC_TAXON]
+    return iconic[-1] if iconic else None
+
+
+class SyntheticCampaign:
+    endpoints = [
+        "observations",
+        "species_counts",
+        "observers",
+        "identifiers",
+        "histogram",
+    ]
+
+    def __init__(
+        self,
+        n_obs=100_000,
+        n_users=1_000,
+        n_species=3_000,
+        start="2025-05-03",
+        days=120,
+        seed=0,
+        first_id=1_000_000,
+    ):
+        rng = np.random.default_rng(seed)
+        self.n_obs = n_obs
+        self.n_users = n_users
+        self.start = datetime.date.fromisoformat(start)
+
+        # especies reales (con ancestry) del árbol de mecoda
+        species = df_taxon[df_taxon["rank"] == "species"].dropna(subset=["ancestry"])
+        self.taxa = species.sample(
+            min(n_species, len(species)), random_state=seed
+        ).reset_index(drop=True)
+        self.taxa["iconic_taxon_id"] = self.taxa["ancestry"].map(_iconic_id)
+        self.n_species = len(self.taxa)
+        self._taxon_dicts = [
+            {
+                "id": int(row.taxon_id),
+                "name": row.taxon_name,
+                "rank": row.rank,
+                "ancestry": row.ancestry,
+                "iconic_taxon_id": (
+                    None if pd.isna(row.iconic_taxon_id) else int(row.iconic_taxon_id)
+                ),
+            }
+            for row in self.taxa.itertuples()
+        ]
+
+        self.logins = np.array([f"user{i:05d}" for i in range(n_users)], dtype=object)
+        self.user_ids = np.arange(1, n_users + 1)
+        n_identifiers = max(1, n_users // 20)
+
+        # ids crecientes con la fecha de creación
+        self.ids = np.arange(first_id, first_id + n_obs)
+        self.created = np.sort(rng.integers(0, days, n_obs)).astype(np.int32)
+        self.observed = np.maximum(self.created - rng.integers(0, 3, n_obs), 0)
+        self.seconds = rng.integers(6 * 3600, 20 * 3600, n_obs)
+        self.obs_taxon = rng.choice(
+            self.n_species, n_obs, p=_zipf_weights(self.n_species, 1.1)
+        )
+        self.obs_user = rng.choice(n_users, n_obs, p=_zipf_weights(n_users, 1.2))
+        self.obs_identifier = rng.choice(n_identifiers, n_obs)
+        self.grade = rng.choice(3, n_obs, p=[0.8, 0.15, 0.05])
+        self.license = rng.choice(len(LICENSES), n_obs, p=[0.4, 0.4, 0.15, 0.05])
+        self.app = rng.random(n_obs) < 0.6
+        self.place = rng.integers(0, len(PLACES), n_obs)
+        self.latitude = rng.uniform(40.5, 42.8, n_obs).round(7)
+        self.longitude = rng.uniform(0.2, 3.3, n_obs).round(7)
+        self.n_photos = rng.integers(1, 4, n_obs)
+        self.first_photo = np.concatenate([[0], np.cumsum(self.n_photos)[:-1]]) + 1
+
+        self._aggregates = {}
+        self._lock = threading.Lock()
+
+    def sizes(self):
+        return {
+            "observations": self.n_obs,
+            "photos": int(self.n_photos.sum()),
+            "users": self.n_users,
+            "species": self.n_species,
+        }
+
+    # consultas
+
+    def _day(self, value):
+        return (datetime.date.fromisoformat(value[:10]) - self.start).days
+
+    def _mask(self, query):
+        mask = np.ones(self.n_obs, dtype=bool)
+        grade = _param(query, "quality_grade")
+        if grade is not None:
+            mask &= GRADES[self.grade] == grade
+        created_d1 = _param(query, "created_d1")
+        created_d2 = _param(query, "created_d2")
+        if created_d1 is not None:
+            mask &= self.created >= self._day(created_d1)
+        if created_d2 is not None:
+            mask &= self.created <= self._day(created_d2)
+        user_login = _param(query, "user_login")
+        if user_login is not None:
+            mask &= self.logins[self.obs_user] == user_login
+        # updated_at es el día de creación
+        updated_since = _param(query, "updated_since")
+        if updated_since is not None:
+            mask &= self.created >= self._day(updated_since)
+        ids = _param(query, "id")
+        if ids is not None:
+            mask &= np.isin(self.ids, [int(i) for i in ids.split(",")])
+        id_below = _param(query, "id_below", int)
+        id_above = _param(query, "id_above", int)
+        if id_below is not None:
+            mask &= self.ids < id_below
+        if id_above is not None:
+            mask &= self.ids > id_above
+        return mask
+
+    def _aggregate(self, endpoint, query):
+        """
+        (orden, valores) de species_counts/observers/identifiers; se guardan
+        porque cada página repite la misma consulta
+        """
+        filters = tuple(
+            sorted(
+                (k, v[0])
+                for k, v in query.items()
+                if k not in ("page", "per_page", "order", "order_by")
+            )
+        )
+        key = (endpoint, filters)
+        with self._lock:
+            if key in self._aggregates:
+                return self._aggregates[key]
+
+        mask = self._mask(query)
+        if endpoint == "species_counts":
+            counts = np.bincount(self.obs_taxon[mask], minlength=self.n_species)
+            values = (counts,)
+        elif endpoint == "observers":
+            users = self.obs_user[mask]
+            counts = np.bincount(users, minlength=self.n_users)
+            pairs = np.unique(
+                users.astype(np.int64) * self.n_species + self.obs_taxon[mask]
+            )
+            species = np.bincount(pairs // self.n_species, minlength=self.n_users)
+            values = (counts, species)
+        else:
+            # como la API, sin las identificaciones en observaciones propias
+            mask &= self.obs_identifier != self.obs_user
+            counts = np.bincount(self.obs_identifier[mask], minlength=self.n_users)
+            values = (counts,)
+        present = np.flatnonzero(counts)
+        order = present[np.argsort(-counts[present], kind="stable")]
+
+        with self._lock:
+            self._aggregates[key] = (order, values)
+        return order, values
+
+    def _taxon_dict(self, t):
+        return self._taxon_dicts[t]
+
+    def _user_dict(self, u):
+        return {"id": int(self.user_ids[u]), "login": self.logins[u]}
+
+    def observation(self, i):
+        created = self.start + datetime.timedelta(days=int(self.created[i]))
+        observed = self.start + datetime.timedelta(days=int(self.observed[i]))
+        seconds = int(self.seconds[i])
+        clock = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+        license_code = LICENSES[self.license[i]]
+        login = self.logins[self.obs_user[i]]
+        identifiers = [self.obs_user[i], self.obs_identifier[i]]
+        extension = "jpeg" if self.ids[i] % 2 else "jpg"
+        return {
+            "id": int(self.ids[i]),
+            "created_at": f"{created}T{clock}+02:00",
+            "updated_at": f"{created}T{clock}+02:00",
+            "observed_on": str(observed),
+            "time_observed_at": f"{observed}T{clock}+02:00",
+            "taxon": self._taxon_dict(self.obs_taxon[i]),
+            "location": f"{self.latitude[i]},{self.longitude[i]}",
+            "obscured": False,
+            "place_guess": PLACES[self.place[i]],
+            "quality_grade": GRADES[self.grade[i]],
+            "user": self._user_dict(self.obs_user[i]),
+            "license_code": license_code,
+            "identifications_count": len(identifiers),
+            "identifications": [{"user": self._user_dict(u)} for u in identifiers],
+            "num_identification_agreements": len(identifiers),
+            "num_identification_disagreements": 0,
+            "oauth_application_id": 2 if self.app[i] else None,
+            "observation_photos": [
+                {
+                    "photo": {
+                        "id": int(photo_id),
+                        "license_code": license_code,
+                        "url": f"{PHOTO_URL}{photo_id}/square.{extension}",
+                        "attribution": f"(c) {login}, some rights reserved "
+                        f"({LICENSE_NAMES[license_code]})",
+                    }
+                }
+                for photo_id in range(
+                    self.first_photo[i], self.first_photo[i] + self.n_photos[i]
+                )
+            ],
+        }
+
+    def response(self, endpoint, query):
+        if endpoint == "observations":
+            indices = np.flatnonzero(self._mask(query))
+            if _param(query, "order") != "asc":
+                indices = indices[::-1]
+            body = paginate(indices, endpoint, query)
+            if _param(query, "only_id") == "true":
+                body["results"] = [{"id": int(self.ids[i])} for i in body["results"]]
+            else:
+                body["results"] = [self.observation(i) for i in body["results"]]
+            return body
+        if endpoint == "histogram":
+            counts = np.bincount(self.created[self._mask(query)])
+            return histogram_response(
+                {
+                    str(self.start + datetime.timedelta(days=day)): int(n)
+                    for day, n in enumerate(counts)
+                    if n
+                }
+            )
+
+        order, values = self._aggregate(endpoint, query)
+        body = paginate(order, endpoint, query)
+        results = []
+        for i in body["results"]:
+            if endpoint == "species_counts":
+                results.append(
+                    {"count": int(values[0][i]), "taxon": self._taxon_dict(i)}
+                )
+            elif endpoint == "observers":
+                results.append(
+                    {
+                        "user_id": int(self.user_ids[i]),
+                        "observation_count": int(values[0][i]),
+                        "species_count": int(values[1][i]),
+                        "user": self._user_dict(i),
+                    }
+                )
+            else:
+                results.append(
+                    {
+                        "user_id": int(self.user_ids[i]),
+                        "count": int(values[0][i]),
+                        "user": self._user_dict(i),
+                    }
+                )
+        body["results"] = results
+        return body
+
+    def taxon(self, taxon_id):
+        tree = df_taxon.set_index("taxon_id")
+        if taxon_id not in tree.index:
+            return {"total_results": 0, "results": []}
+        row = tree.loc[taxon_id]
+        ancestors = [
+            {
+                "id": int(i),
+                "name": tree.at[int(i), "taxon_name"],
+                "rank": tree.at[int(i), "rank"],
+            }
+            for i in str(row["ancestry"]).split("/")
+            if i.isdigit() and int(i) in tree.index
+        ]
+        return {
+            "total_results": 1,
+            "results": [
+                {
+                    "id": taxon_id,
+                    "name": row["taxon_name"],
+                    "rank": row["rank"],
+                    "ancestors": ancestors,
+                }
+            ],
+        }
+
+    # tablas
+
+    def obs_frame(self) -> pd.DataFrame:
+        """
+        {id}_obs.csv de la campaña, con las columnas de schema.OBS_DTYPES
+        """
+        taxa = self.taxa
+        ranks = _taxon_columns(taxa["ancestry"]).to_numpy()[self.obs_taxon]
+        created = pd.Timestamp(self.start) + pd.to_timedelta(self.created, unit="D")
+        observed = pd.Timestamp(self.start) + pd.to_timedelta(self.observed, unit="D")
+        clock = pd.to_datetime(self.seconds, unit="s").strftime("%H:%M:%S")
+        logins = self.logins[self.obs_user]
+        df_obs = pd.DataFrame(
+            {
+                "id": self.ids,
+                "created_at": created.strftime("%Y-%m-%d"),
+                "updated_at": created.strftime("%Y-%m-%d"),
+                "observed_on": observed.strftime("%Y-%m-%d"),
+                "observed_on_time": clock,
+                "iconic_taxon": taxa["iconic_taxon_id"]
+                .map(ICONIC_TAXON)
+                .to_numpy()[self.obs_taxon],
+                "taxon_id": taxa["taxon_id"].to_numpy()[self.obs_taxon],
+                "taxon_rank": "species",
+                "taxon_name": taxa["taxon_name"].to_numpy()[self.obs_taxon],
+                "latitude": self.latitude,
+                "longitude": self.longitude,
+                "obscured": False,
+                "place_name": PLACES[self.place],
+                "quality_grade": GRADES[self.grade],
+                "user_id": self.user_ids[self.obs_user],
+                "user_login": logins,
+                "license_obs": LICENSES[self.license],
+                "identifications_count": 2,
+                "identifiers": logins + ", " + self.logins[self.obs_identifier],
+                "num_identification_agreements": 2,
+                "num_identification_disagreements": 0,
+                "device": np.where(self.app, "app", "web"),
+            }
+        )
+        for j, rank in enumerate(
+            ["kingdom", "phylum", "class", "order", "family", "genus"]
+        ):
+            df_obs[rank] = ranks[:, j]
+        df_obs = df_obs.iloc[::-1].reset_index(drop=True)
+        return apply_obs_schema(df_obs[list(OBS_DTYPES)])
+
+    def photos_frame(self) -> pd.DataFrame:
+        rows = np.repeat(np.arange(self.n_obs), self.n_photos)
+        photos_id = np.arange(1, len(rows) + 1)
+        extension = np.where(self.ids[rows] % 2, "jpeg", "jpg").astype(object)
+        license_code = LICENSES[self.license[rows]]
+        logins = self.logins[self.obs_user[rows]]
+        ids = self.ids[rows]
+        df_photos = pd.DataFrame(
+            {
+                "id": ids,
+                "photos_id": photos_id,
+                "iconic_taxon": self.taxa["iconic_taxon_id"]
+                .map(ICONIC_TAXON)
+                .to_numpy()[self.obs_taxon[rows]],
+                "taxon_name": self.taxa["taxon_name"].to_numpy()[self.obs_taxon[rows]],
+                "photos_medium_url": PHOTO_URL
+                + photos_id.astype(str).astype(object)
+                + "/medium."
+                + extension,
+                "user_login": logins,
+                "latitude": self.latitude[rows],
+                "longitude": self.longitude[rows],
+                "license_photo": license_code,
+                "attribution": "(c) "
+                + logins
+                + ", some rights reserved ("
+                + pd.Series(license_code).map(LICENSE_NAMES).to_numpy()
+                + ")",
+                "path": ids.astype(str).astype(object)
+                + "_"
+                + photos_id.astype(str).astype(object)
+                + "."
+                + extension,
+            }
+        )
+        df_photos = df_photos.sort_values(
+            ["id", "photos_id"], ascending=[False, True], kind="stable"
+        )
+        return apply_photos_schema(df_photos.reset_index(drop=True))
+
+    def write_tables(self, prefix):
+        """
+        Escribe {prefix}_obs.csv y {prefix}_photos.csv como los scripts
+        """
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        write_csv(self.obs_frame(), f"{prefix}_obs.csv")
+        write_photos(self.photos_frame(), f"{prefix}_photos.csv")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--obs", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--species", type=int, default=5_000)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="prefijo de las tablas, p.ej. /tmp/sim/417")
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    campaign = SyntheticCampaign(
+        args.obs, args.users, args.species, days=args.days, seed=args.seed
+    )
+    print(f"Campaña sintética: {campaign.sizes()}")
+    if args.out:
+        campaign.write_tables(args.out)
+        print(f"Tablas en {args.out}_*.csv")
+    if args.serve:
+        server = ReplayServer(campaign, args.latency, port=args.port)
+        print(f"Sirviendo en {server.url}")
+        server.serve_forever()
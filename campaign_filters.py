@@ -0,0 +1,125 @@
+"""
+Filtro de participantes excluidos (equipo, entidades organizadoras) de las
+métricas de BioMARató.
+
+Los logins se resuelven a user_id una sola vez y se guardan en
+data/excluded_user_ids.json. Las consultas a la API llevan not_user_id, así
+que los totales ya vienen sin ellos, y las tablas locales se filtran con
+drop_excluded.
+"""
+
+import json
+import os
+import threading
+
+import pandas as pd
+
+from minka_api import API_PATH, get_json
+from output_writer import write_bytes
+
+EXCLUDE_USERS = [
+    "xasalva",
+    "bertinhaco",
+    "andrea",
+    "laurabiomar",
+    "guillermoalvarez_fecdas",
+    "mediambient_ajelprat",
+    "fecdas_mediambient",
+    "planctondiving",
+    "marinagm",
+    "CEM",
+    "jaume-piera",
+    "sonialinan",
+    "adrisoacha",
+    "anellides",
+    "irodero",
+    "manelsalvador",
+    "sara_riera",
+    "anomalia",
+    "amaliacardenas",
+    "aluna",
+    "carlosrodero",
+    "lydia",
+    "elibonfill",
+    "marinatorresgi",
+    "meri",
+    "monyant",
+    "ura4dive",
+    "lauracoro",
+    "pirotte_",
+    "oceanicos",
+    "abril",
+    "alba_barrera",
+    "amb_platges",
+    "daniel_palacios",
+    "davidpiquer",
+    "laiamanyer",
+    "rogerpuig",
+    "guillemdavila",
+    # vanessa,
+    # teresa,
+]
+
+USER_IDS_PATH = "data/excluded_user_ids.json"
+
+_user_ids = None
+_lock = threading.Lock()
+
+
+def _resolve(login):
+    try:
+        results = get_json(f"{API_PATH}/users/{login}")["results"]
+        return results[0]["id"] if results else None
+    except Exception as e:
+        print(f"No se ha podido resolver el usuario {login}: {e}")
+        return None
+
+
+def exclude_user_ids(logins=EXCLUDE_USERS, path=USER_IDS_PATH) -> list:
+    """
+    user_id de los logins excluidos; solo se consultan los que no están en
+    el fichero
+    """
+    global _user_ids
+    with _lock:
+        if _user_ids is not None:
+            return _user_ids
+        known = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                known = json.load(f)
+        resolved = {}
+        for login in logins:
+            if login not in known:
+                user_id = _resolve(login)
+                if user_id is not None:
+                    resolved[login] = user_id
+        if resolved:
+            known.update(resolved)
+            data = json.dumps(known, indent=2, sort_keys=True) + "\n"
+            write_bytes(data.encode(), path)
+        _user_ids = sorted(known[login] for login in logins if login in known)
+        return _user_ids
+
+
+def exclude_params(params=None) -> dict:
+    """
+    params de una consulta a la API sin las observaciones de los excluidos
+    """
+    params = dict(params or {})
+    user_ids = exclude_user_ids()
+    if user_ids:
+        params["not_user_id"] = ",".join(map(str, user_ids))
+    return params
+
+
+def drop_excluded(df: pd.DataFrame, column="user_login") -> pd.DataFrame:
+    """
+    Quita las filas de los excluidos, por login (user_login, participant) o
+    por user_id
+    """
+    if column == "user_id":
+        excluded = exclude_user_ids()
+    else:
+        excluded = EXCLUDE_USERS
+    return df[~df[column].isin(excluded)]
@@ -0,0 +1,114 @@
+"""
+Checkpoints de las etapas de un script para poder reanudar una ejecución
+fallida.
+
+Cada resultado se guarda en .checkpoints/{run_id}/{etapa}-{huella}.pkl, donde
+run_id es GITHUB_RUN_ID (el mismo en los reintentos de un workflow) y la
+huella sale de las entradas de la etapa y del commit; las etapas que
+dependen de los datasets descargados llevan entre sus entradas
+data_fingerprint() de esos datasets. Al terminar bien se
+borra el directorio de la ejecución; una ejecución nueva empieza limpia.
+
+Fuera de Actions cada ejecución tiene un run_id nuevo; para reanudar una
+ejecución local fallida hay que indicarlo con CHECKPOINT_RUN_ID.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+from sidecar import dataset_info
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", ".checkpoints")
+RUN_ID = (
+    os.getenv("CHECKPOINT_RUN_ID")
+    or os.getenv("GITHUB_RUN_ID")
+    or f"local-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+)
+
+
+def run_dir():
+    return os.path.join(CHECKPOINT_DIR, RUN_ID)
+
+
+def fingerprint(*inputs) -> str:
+    data = json.dumps(
+        [os.getenv("GITHUB_SHA"), *inputs], sort_keys=True, default=str
+    ).encode()
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def data_fingerprint(*paths) -> list:
+    """
+    sha256 de cada dataset de paths (de sus metadatos), None si no existe
+    """
+    return [(dataset_info(path) or {}).get("sha256") for path in paths]
+
+
+def _path(stage, inputs):
+    return os.path.join(run_dir(), f"{stage}-{fingerprint(stage, *inputs)}.pkl")
+
+
+def part_path(stage, *inputs, suffix=""):
+    """
+    Ruta para ficheros parciales de una etapa (p.ej. CSV a medio descargar)
+    """
+    os.makedirs(run_dir(), exist_ok=True)
+    return os.path.join(run_dir(), f"{stage}-{fingerprint(stage, *inputs)}{suffix}")
+
+
+def load(stage, *inputs, default=None):
+    path = _path(stage, inputs)
+    if not os.path.exists(path):
+        return default
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save(value, stage, *inputs):
+    path = _path(stage, inputs)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(value, f)
+    os.replace(tmp, path)
+
+
+def discard(stage, *inputs):
+    path = _path(stage, inputs)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def cached(stage, inputs, func):
+    """
+    Devuelve el resultado guardado de la etapa o lo calcula con func() y lo
+    guarda. Si func() lanza una excepción no se guarda nada.
+    """
+    path = _path(stage, inputs)
+    if os.path.exists(path):
+        print(f"Reanudando {stage} {inputs} desde checkpoint")
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    value = func()
+    save(value, stage, *inputs)
+    return value
+
+
+def start_run():
+    """
+    Borra los checkpoints de otras ejecuciones
+    """
+    print(f"Checkpoints de la ejecución {RUN_ID} (CHECKPOINT_RUN_ID para reanudar)")
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return
+    for name in os.listdir(CHECKPOINT_DIR):
+        if name != RUN_ID:
+            shutil.rmtree(os.path.join(CHECKPOINT_DIR, name), ignore_errors=True)
+
+
+def finish_run():
+    shutil.rmtree(run_dir(), ignore_errors=True)
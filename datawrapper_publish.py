@@ -0,0 +1,113 @@
+"""
+Sube a Datawrapper los CSV que han cambiado en esta ejecución y republica
+sus gráficos.
+
+La relación fichero -> gráfico está en datawrapper_charts.json:
+
+    {
+        "data/biomarato25/417_main_metrics_per_day.csv": "AbC12",
+        "data/biomarato25/417_users.csv": ["dEf34", "GhI56"]
+    }
+
+Solo se tocan los gráficos cuyos ficheros aparecen como modificados en el
+manifiesto de output_writer (changes.json). Sin DATAWRAPPER_API_TOKEN o sin
+datawrapper_charts.json no se hace nada.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from output_writer import MANIFEST_PATH
+
+DATAWRAPPER_API = os.getenv("DATAWRAPPER_API_PATH", "https://api.datawrapper.de/v3")
+CHARTS_PATH = os.getenv("DATAWRAPPER_CHARTS", "datawrapper_charts.json")
+
+
+def load_charts(path=CHARTS_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        charts = json.load(f)
+    return {
+        os.path.normpath(csv_path): [ids] if isinstance(ids, str) else list(ids)
+        for csv_path, ids in charts.items()
+    }
+
+
+def changed_charts(manifest, charts):
+    """
+    Devuelve [(chart_id, csv_path)] de los gráficos con datos modificados
+    """
+    pending = []
+    for csv_path in manifest.get("changed", []):
+        for chart_id in charts.get(os.path.normpath(csv_path), []):
+            pending.append((chart_id, csv_path))
+    return pending
+
+
+def publish_chart(session, chart_id, csv_path, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    with open(csv_path, "rb") as f:
+        data = f.read()
+    response = session.put(
+        f"{DATAWRAPPER_API}/charts/{chart_id}/data",
+        data=data,
+        headers={**headers, "Content-Type": "text/csv"},
+        timeout=60,
+    )
+    response.raise_for_status()
+    response = session.post(
+        f"{DATAWRAPPER_API}/charts/{chart_id}/publish", headers=headers, timeout=60
+    )
+    response.raise_for_status()
+    return chart_id
+
+
+def publish_changed(
+    manifest_path=MANIFEST_PATH, charts_path=CHARTS_PATH, token=None, max_workers=8
+):
+    token = token or os.getenv("DATAWRAPPER_API_TOKEN")
+    charts = load_charts(charts_path)
+    if not token or not charts:
+        print("Datawrapper: sin token o sin gráficos configurados, no se publica")
+        return []
+    if not os.path.exists(manifest_path):
+        print(f"Datawrapper: no existe {manifest_path}, no se publica")
+        return []
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    pending = changed_charts(manifest, charts)
+    if not pending:
+        print("Datawrapper: ningún gráfico con datos nuevos")
+        return []
+
+    published = []
+    errors = 0
+    session = requests.Session()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(publish_chart, session, chart_id, csv_path, token): (
+                chart_id,
+                csv_path,
+            )
+            for chart_id, csv_path in pending
+        }
+        for future in as_completed(futures):
+            chart_id, csv_path = futures[future]
+            try:
+                published.append(future.result())
+                print(f"Datawrapper: publicado {chart_id} ({csv_path})")
+            except Exception as e:
+                errors += 1
+                print(f"Datawrapper: error publicando {chart_id} ({csv_path}): {e}")
+
+    print(f"Datawrapper: {len(published)} gráficos publicados, {errors} errores")
+    return published
+
+
+if __name__ == "__main__":
+    publish_changed()
@@ -0,0 +1,257 @@
+"""
+Recuentos exactos de especies y participantes distintos por día a partir de
+las observaciones guardadas ({id}_obs.csv), sin consultar la API.
+
+Por cada día (created_at) se guarda cuántas observaciones hay de cada
+taxon_id y de cada user_id. El acumulado de un día son los ids vistos hasta
+ese día y las ventanas móviles suman y restan los días que entran y salen;
+ninguna consulta vuelve a recorrer las filas. Las especies son taxones hoja
+(leaf_taxa.py), como species_counts con created_d2=día en las métricas
+principales: un taxón deja de contar cuando aparece un descendiente suyo.
+
+El estado se guarda junto a las clasificaciones, en
+LEADERBOARD_DIR/{nombre}_distinct.pkl, y sync() solo aplica las
+observaciones nuevas, cambiadas o desaparecidas desde la ejecución anterior.
+
+    python distinct_counts.py data/biodiverciutat25/233_obs.csv --window 7
+"""
+
+import argparse
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from leaderboard import LEADERBOARD_DIR, observation_delta
+from leaf_taxa import ancestor_pairs
+from schema import read_obs
+
+FIELDS = {"species": "taxon_id", "participants": "user_id"}
+
+# Al cambiar lo que se guarda, los estados anteriores se descartan
+STATE_VERSION = 1
+
+
+class DistinctCounts:
+    def __init__(self, df_obs=None):
+        self.obs = pd.DataFrame(
+            {
+                "day": pd.Series(dtype=object),
+                "taxon_id": pd.Series(dtype="Int64"),
+                "user_id": pd.Series(dtype="Int64"),
+            },
+            index=pd.Index([], dtype="int64", name="id"),
+        )
+        self.observations = {}
+        # nombre -> día -> {id: observaciones}
+        self.sets = {name: {} for name in FIELDS}
+        self.cursor = None
+        if df_obs is not None:
+            self.update(df_obs)
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls(read_obs(path))
+
+    @staticmethod
+    def path(name):
+        return os.path.join(LEADERBOARD_DIR, f"{name}_distinct.pkl")
+
+    @classmethod
+    def load(cls, name):
+        """
+        Estado guardado de name o unos recuentos vacíos
+        """
+        path = cls.path(name)
+        if os.path.exists(path):
+            try:
+                state = pd.read_pickle(path)
+                if state.get("version") == STATE_VERSION:
+                    return state["counts"]
+            except Exception as e:
+                print(f"Error leyendo {path}: {e}")
+        return cls()
+
+    def save(self, name):
+        os.makedirs(LEADERBOARD_DIR, exist_ok=True)
+        path = self.path(name)
+        tmp = f"{path}.tmp"
+        pd.to_pickle({"version": STATE_VERSION, "counts": self}, tmp)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _project(df_obs):
+        """
+        Día, taxón y usuario de cada observación
+        """
+        rows = pd.DataFrame(
+            {
+                "day": df_obs["created_at"].astype(str).to_numpy(),
+                "taxon_id": df_obs["taxon_id"].astype("Int64").to_numpy(),
+                "user_id": df_obs["user_id"].astype("Int64").to_numpy(),
+            },
+            index=pd.Index(df_obs["id"].to_numpy(dtype="int64"), name="id"),
+        )
+        return rows[~rows.index.duplicated(keep="last")]
+
+    def _contribute(self, rows, sign):
+        for day, n in rows["day"].value_counts().items():
+            value = self.observations.get(day, 0) + sign * int(n)
+            if value:
+                self.observations[day] = value
+            else:
+                self.observations.pop(day, None)
+        for name, column in FIELDS.items():
+            valid = rows[rows[column].notna()]
+            for (day, value), n in valid.groupby(["day", column]).size().items():
+                ids = self.sets[name].setdefault(day, Counter())
+                ids[int(value)] += sign * int(n)
+                if not ids[int(value)]:
+                    del ids[int(value)]
+                if not ids:
+                    del self.sets[name][day]
+
+    def update(self, df_obs: pd.DataFrame, removed=()):
+        """
+        Aplica las observaciones de df_obs (nuevas o cambiadas) y quita las de
+        ids removed
+        """
+        rows = self._project(df_obs)
+        ids = np.union1d(rows.index.to_numpy(), np.asarray(removed, dtype="int64"))
+        positions = self.obs.index.get_indexer(ids)
+        old = self.obs.iloc[positions[positions >= 0]]
+        if len(old):
+            self._contribute(old, -1)
+            self.obs = self.obs.drop(old.index)
+        if len(rows):
+            self._contribute(rows, 1)
+            self.obs = pd.concat([self.obs, rows]) if len(self.obs) else rows
+        return self
+
+    def sync(self, df_obs: pd.DataFrame) -> int:
+        """
+        Deja los recuentos iguales a los de df_obs aplicando solo las
+        diferencias. Devuelve cuántas observaciones se han aplicado o quitado.
+        """
+        delta, removed, self.cursor = observation_delta(
+            self.obs.index, self.cursor, df_obs
+        )
+        self.update(delta, removed)
+        print(f"Recuentos por día: {len(delta)} aplicadas, {len(removed)} quitadas")
+        return len(delta) + len(removed)
+
+    def merge(self, other):
+        """
+        Une los recuentos de otro proyecto (sin duplicar ids)
+        """
+        for day, n in other.observations.items():
+            self.observations[day] = self.observations.get(day, 0) + n
+        for name in FIELDS:
+            for day, ids in other.sets[name].items():
+                self.sets[name].setdefault(day, Counter()).update(ids)
+        return self
+
+    def days(self, start=None, end=None):
+        known = sorted(self.observations)
+        if not known:
+            return []
+        dates = pd.date_range(start or known[0], end or known[-1], freq="D")
+        return list(dates.strftime("%Y-%m-%d"))
+
+    def _ids(self, name, day):
+        ids = self.sets[name].get(day)
+        return np.array(sorted(ids), dtype=np.int64) if ids else np.array([], np.int64)
+
+    @staticmethod
+    def _covers(name, universe):
+        """
+        (posición del taxón, posición de su ancestro) dentro de universe; los
+        participantes no tienen ancestros
+        """
+        empty = np.array([], dtype=np.int64)
+        if name != "species" or not len(universe):
+            return empty, empty
+        pairs = ancestor_pairs(universe)
+        parent = np.searchsorted(universe, pairs["ancestor_id"].to_numpy())
+        parent = np.minimum(parent, len(universe) - 1)
+        inside = universe[parent] == pairs["ancestor_id"].to_numpy()
+        child = np.searchsorted(universe, pairs["taxon_id"].to_numpy())
+        return child[inside], parent[inside]
+
+    def rolling(self, name, days, window):
+        """
+        Ids distintos en los últimos window días, para cada día. En especies
+        solo cuentan los taxones de los que no hay ningún descendiente en la
+        ventana
+        """
+        sets = [self._ids(name, day) for day in days]
+        if not any(len(ids) for ids in sets):
+            return np.zeros(len(days), dtype=np.int64)
+        universe = np.unique(np.concatenate(sets))
+        child, parent = self._covers(name, universe)
+        counts = np.zeros(len(universe), dtype=np.int32)
+        # taxones presentes que descienden de cada taxón
+        covered = np.zeros(len(universe), dtype=np.int32)
+        result = np.zeros(len(days), dtype=np.int64)
+        for i, ids in enumerate(sets):
+            positions = np.searchsorted(universe, ids)
+            entering = positions[counts[positions] == 0]
+            counts[positions] += 1
+            np.add.at(covered, parent[np.isin(child, entering)], 1)
+            if i >= window:
+                positions = np.searchsorted(universe, sets[i - window])
+                counts[positions] -= 1
+                leaving = positions[counts[positions] == 0]
+                np.add.at(covered, parent[np.isin(child, leaving)], -1)
+            result[i] = np.count_nonzero((counts > 0) & (covered == 0))
+        return result
+
+    def cumulative(self, name, days):
+        """
+        Ids distintos desde el primer día hasta cada día
+        """
+        return self.rolling(name, days, len(days))
+
+    def daily_table(self, window=7, start=None, end=None) -> pd.DataFrame:
+        """
+        Por día: observaciones, especies y participantes acumulados, nuevos
+        (lo que sube el acumulado) y en la ventana móvil
+        """
+        days = self.days(start, end)
+        table = pd.DataFrame(
+            {
+                "date": days,
+                "observations": np.cumsum(
+                    [self.observations.get(day, 0) for day in days]
+                ).astype(np.int64),
+            }
+        )
+        for name in FIELDS:
+            total = self.cumulative(name, days)
+            table[name] = total
+            table[f"new_{name}"] = np.diff(total, prepend=0)
+            table[f"{name}_{window}d"] = self.rolling(name, days, window)
+        return table
+
+
+def sync_distinct_counts(name, df_obs: pd.DataFrame) -> DistinctCounts:
+    """
+    Carga el estado de name, lo sincroniza con df_obs y lo guarda
+    """
+    counts = DistinctCounts.load(name)
+    counts.sync(df_obs)
+    counts.save(name)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="{id}_obs.csv de uno o más proyectos")
+    parser.add_argument("--window", type=int, default=7)
+    args = parser.parse_args()
+
+    counts = DistinctCounts()
+    for path in args.paths:
+        counts.merge(DistinctCounts.from_csv(path))
+    print(counts.daily_table(args.window).to_string(index=False))
@@ -0,0 +1,143 @@
+"""
+Caché de respuestas de la API en disco para peticiones condicionales.
+
+Por cada petición canónica (url, params ordenados y si lleva token) se guarda
+el cuerpo en {clave}.body y en {clave}.json los validadores (ETag,
+Last-Modified) y el sha256 del cuerpo. La siguiente vez se envían
+If-None-Match / If-Modified-Since y un 304 se sirve desde el disco. Si el
+endpoint no da validadores, se compara el sha256 del cuerpo descargado para
+saber si ha cambiado.
+
+MINKA_HTTP_CACHE="" desactiva la caché.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_DIR = os.getenv("MINKA_HTTP_CACHE", ".http_cache")
+# Entradas sin usar durante más días que esto se borran con prune()
+MAX_AGE_DAYS = 7
+
+
+def enabled():
+    return bool(CACHE_DIR)
+
+
+def request_key(url, params=None, headers=None) -> str:
+    """
+    Clave de la petición canónica: page=1 es lo mismo que no indicar página
+    """
+    items = sorted(
+        (str(k), str(v))
+        for k, v in (params or {}).items()
+        if v is not None and not (k == "page" and str(v) == "1")
+    )
+    auth = bool(headers and headers.get("Authorization"))
+    data = json.dumps([url, items, auth]).encode()
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def _paths(key):
+    base = os.path.join(CACHE_DIR, key)
+    return f"{base}.json", f"{base}.body"
+
+
+def load(key):
+    """
+    Metadatos de la entrada o None si no hay
+    """
+    meta_path, body_path = _paths(key)
+    if not os.path.exists(meta_path) or not os.path.exists(body_path):
+        return None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except ValueError:
+        return None
+    meta["key"] = key
+    return meta
+
+
+def validators(entry) -> dict:
+    """
+    Cabeceras condicionales para la petición
+    """
+    headers = {}
+    if entry is None:
+        return headers
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def read_body(entry) -> bytes:
+    meta_path, body_path = _paths(entry["key"])
+    with open(body_path, "rb") as f:
+        body = f.read()
+    # la fecha de modificación marca el último uso, para prune()
+    os.utime(meta_path)
+    return body
+
+
+def _write(path, data):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store(key, url, response, entry=None) -> bool:
+    """
+    Guarda una respuesta 200. Devuelve True si el cuerpo es igual al que ya
+    estaba guardado (aunque el servidor no diera validadores).
+    """
+    body = response.content
+    digest = hashlib.sha256(body).hexdigest()
+    meta = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": digest,
+    }
+    meta_path, body_path = _paths(key)
+    unchanged = entry is not None and entry.get("sha256") == digest
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    if not unchanged:
+        _write(body_path, body)
+    # los metadatos después del cuerpo: si existen, el cuerpo es válido
+    _write(meta_path, json.dumps(meta).encode())
+    return unchanged
+
+
+def remove(key):
+    """
+    Borra la entrada de key (p.ej. un cuerpo guardado que no es válido)
+    """
+    for path in _paths(key):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def prune(max_age_days=MAX_AGE_DAYS):
+    """
+    Borra las entradas que no se han usado en max_age_days días
+    """
+    if not enabled() or not os.path.isdir(CACHE_DIR):
+        return
+    limit = time.time() - max_age_days * 86400
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        meta_path = os.path.join(CACHE_DIR, name)
+        if os.path.getmtime(meta_path) < limit:
+            os.remove(meta_path)
+            body_path = meta_path[: -len(".json")] + ".body"
+            if os.path.exists(body_path):
+                os.remove(body_path)
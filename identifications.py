@@ -0,0 +1,117 @@
+"""
+Identificaciones por usuario a partir de la columna identifiers de las
+observaciones guardadas ({id}_obs.csv), sin consultar
+/observations/identifiers.
+
+Como la API, se cuentan las observaciones de otros usuarios que cada uno ha
+identificado: las identificaciones en observaciones propias no cuentan y
+varias identificaciones de un usuario en la misma observación cuentan una
+vez. Con reconcile (o MINKA_RECONCILE_IDENTIFICATIONS=1 en los scripts) se
+comparan los recuentos con los de la API.
+
+    python identifications.py data/biomarato25/417_obs.csv --reconcile 417
+"""
+
+import argparse
+import math
+import os
+
+import pandas as pd
+
+from minka_api import API_PATH, get_json, get_total_results, map_concurrent
+from schema import read_obs
+
+COLUMNS = ["user_login", "identificacions"]
+
+# Comprueba los recuentos locales contra /observations/identifiers
+RECONCILE = os.getenv("MINKA_RECONCILE_IDENTIFICATIONS", "0") == "1"
+
+
+def explode_identifiers(df_obs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Un par (id de la observación, login del identificador) por fila, sin las
+    del propio observador ni repetidos
+    """
+    identifiers = df_obs["identifiers"].astype(object)
+    present = identifiers.notna()
+    pairs = pd.DataFrame(
+        {
+            "id": df_obs.loc[present, "id"].to_numpy(),
+            "observer": df_obs.loc[present, "user_login"].astype(object).to_numpy(),
+            "user_login": identifiers[present].str.split(", ").to_numpy(),
+        }
+    ).explode("user_login")
+    pairs = pairs[pairs["user_login"].notna() & (pairs["user_login"] != "")]
+    pairs = pairs[pairs["user_login"] != pairs["observer"]]
+    return pairs[["id", "user_login"]].drop_duplicates(ignore_index=True)
+
+
+def count_identifications(df_obs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Observaciones identificadas por usuario, de más a menos
+    """
+    pairs = explode_identifiers(df_obs)
+    counts = pairs.groupby("user_login", sort=False).size()
+    df = counts.rename("identificacions").reset_index()
+    return df.sort_values(
+        ["identificacions", "user_login"],
+        ascending=[False, True],
+        kind="mergesort",
+        ignore_index=True,
+    )[COLUMNS]
+
+
+def get_api_identifications(proj_id, params=None, headers=None) -> pd.DataFrame:
+    """
+    Recuentos de /observations/identifiers, todas las páginas
+    """
+    url = f"{API_PATH}/observations/identifiers"
+    params = {"project_id": proj_id, **(params or {})}
+    pages = math.ceil(get_total_results(url, params, headers) / 500)
+
+    def get_page(page):
+        return get_json(url, {**params, "page": page}, headers)["results"]
+
+    rows = [
+        {"user_login": result["user"]["login"], "identificacions": result["count"]}
+        for results in map_concurrent(get_page, range(1, pages + 1))
+        for result in results
+    ]
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def reconcile(local: pd.DataFrame, api: pd.DataFrame) -> pd.DataFrame:
+    """
+    Usuarios cuyo recuento local no coincide con el de la API
+    """
+    df = pd.merge(
+        local, api, on="user_login", how="outer", suffixes=("_local", "_api")
+    ).fillna(0)
+    df = df[df["identificacions_local"] != df["identificacions_api"]]
+    print(f"Identificadores con recuento distinto al de la API: {len(df)}")
+    return df.astype({"identificacions_local": int, "identificacions_api": int})
+
+
+def check_identifications(local, proj_id, params=None, headers=None):
+    """
+    Con RECONCILE informa de las diferencias entre local (user_login,
+    identificacions) y la API para proj_id y params
+    """
+    if not RECONCILE:
+        return
+    differences = reconcile(local, get_api_identifications(proj_id, params, headers))
+    if len(differences):
+        print(differences.head(20).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="{id}_obs.csv")
+    parser.add_argument("--reconcile", type=int, metavar="PROJECT_ID")
+    args = parser.parse_args()
+
+    local = count_identifications(read_obs(args.path))
+    print(local.head(20).to_string(index=False))
+    if args.reconcile:
+        api = get_api_identifications(args.reconcile, {"quality_grade": "research"})
+        print(reconcile(local, api).to_string(index=False))
@@ -0,0 +1,235 @@
+"""
+Métricas de la ejecución: peticiones por endpoint (latencia, bytes,
+decodificación JSON, reintentos, aciertos de caché, peticiones repetidas
+evitadas) y duración de cada etapa del script.
+
+Al terminar se escribe run_report.json (RUN_REPORT) y, si PROMETHEUS_TEXTFILE
+está definido, las mismas métricas en formato de texto de Prometheus.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+REPORT_PATH = os.getenv("RUN_REPORT", "run_report.json")
+PROMETHEUS_PATH = os.getenv("PROMETHEUS_TEXTFILE")
+
+# Límites (segundos) del histograma de latencia; los percentiles del informe
+# se estiman con él, sin guardar cada latencia
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+ENDPOINTS = ["species_counts", "observers", "identifiers", "observations", "taxa"]
+
+_lock = threading.Lock()
+_endpoints = {}
+_stages = {}
+_started = time.monotonic()
+
+
+def endpoint_name(url) -> str:
+    """
+    /v1/observations/species_counts -> species_counts, /v1/taxa/123 -> taxa
+    """
+    parts = [p for p in urlsplit(url).path.split("/") if p]
+    for part in reversed(parts):
+        if part in ENDPOINTS:
+            return part
+    return parts[-1] if parts else urlsplit(url).netloc
+
+
+def _endpoint(url):
+    name = endpoint_name(url)
+    if name not in _endpoints:
+        _endpoints[name] = {
+            "requests": 0,
+            "errors": 0,
+            "retries": 0,
+            "bytes": 0,
+            "latency_seconds": 0.0,
+            "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+            "decode_seconds": 0.0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "deduplicated": 0,
+        }
+    return _endpoints[name]
+
+
+def _current_stages():
+    return [name for name, stage in _stages.items() if stage["running"]]
+
+
+def record_request(url, latency, status=None, nbytes=0):
+    with _lock:
+        metrics = _endpoint(url)
+        metrics["requests"] += 1
+        metrics["errors"] += status is None or status >= 400
+        metrics["bytes"] += nbytes
+        metrics["latency_seconds"] += latency
+        metrics["latency_buckets"][bisect_left(LATENCY_BUCKETS, latency)] += 1
+        for name in _current_stages():
+            _stages[name]["requests"] += 1
+
+
+def record_decode(url, seconds):
+    with _lock:
+        _endpoint(url)["decode_seconds"] += seconds
+
+
+def record_retry(url):
+    with _lock:
+        _endpoint(url)["retries"] += 1
+
+
+def record_cache(url, hit):
+    with _lock:
+        _endpoint(url)["cache_hits" if hit else "cache_misses"] += 1
+
+
+def record_dedup(url):
+    with _lock:
+        _endpoint(url)["deduplicated"] += 1
+
+
+@contextmanager
+def stage(name):
+    """
+    Mide una etapa del script:
+
+        with stage("main_metrics_per_day"):
+            ...
+    """
+    with _lock:
+        info = _stages.setdefault(
+            name, {"seconds": 0.0, "requests": 0, "running": False}
+        )
+        info["running"] = True
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        with _lock:
+            info["seconds"] += time.monotonic() - start
+            info["running"] = False
+
+
+def _percentile(buckets, q):
+    """
+    Percentil q del histograma, interpolando dentro del intervalo como
+    histogram_quantile de Prometheus
+    """
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(buckets):
+        if cumulative + count >= rank and count:
+            if i == len(LATENCY_BUCKETS):
+                # por encima del último límite
+                return LATENCY_BUCKETS[-1]
+            lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+            upper = LATENCY_BUCKETS[i]
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+    return LATENCY_BUCKETS[-1]
+
+
+def report() -> dict:
+    with _lock:
+        endpoints = {}
+        for name, metrics in sorted(_endpoints.items()):
+            buckets = metrics["latency_buckets"]
+            lookups = metrics["cache_hits"] + metrics["cache_misses"]
+            endpoints[name] = dict(metrics, latency_buckets=list(buckets))
+            endpoints[name].update(
+                {
+                    "latency_p50": _percentile(buckets, 0.50),
+                    "latency_p95": _percentile(buckets, 0.95),
+                    "cache_hit_ratio": (
+                        metrics["cache_hits"] / lookups if lookups else None
+                    ),
+                }
+            )
+        stages = {
+            name: {"seconds": info["seconds"], "requests": info["requests"]}
+            for name, info in _stages.items()
+        }
+    return {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "total_seconds": time.monotonic() - _started,
+        "latency_buckets": LATENCY_BUCKETS,
+        "endpoints": endpoints,
+        "stages": stages,
+    }
+
+
+def prometheus_text(data) -> str:
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP minka_{name} {help_text}")
+        lines.append(f"# TYPE minka_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"minka_{name}{{{label_text}}} {value}")
+
+    endpoints = data["endpoints"]
+    for key, kind, help_text in [
+        ("requests", "counter", "Peticiones a la API"),
+        ("errors", "counter", "Peticiones con error o sin respuesta"),
+        ("retries", "counter", "Reintentos"),
+        ("bytes", "counter", "Bytes recibidos"),
+        ("decode_seconds", "counter", "Tiempo decodificando JSON"),
+        ("cache_hits", "counter", "Respuestas servidas desde caché"),
+        ("cache_misses", "counter", "Consultas a caché sin acierto"),
+        ("deduplicated", "counter", "Peticiones repetidas resueltas en memoria"),
+    ]:
+        samples = [({"endpoint": ep}, m[key]) for ep, m in endpoints.items()]
+        metric(f"http_{key}_total", kind, help_text, samples)
+
+    lines.append("# HELP minka_http_latency_seconds Latencia de las peticiones")
+    lines.append("# TYPE minka_http_latency_seconds histogram")
+    for ep, m in endpoints.items():
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ["+Inf"], m["latency_buckets"]):
+            cumulative += count
+            lines.append(
+                f'minka_http_latency_seconds_bucket{{endpoint="{ep}",le="{bound}"}} '
+                f"{cumulative}"
+            )
+        lines.append(
+            f'minka_http_latency_seconds_sum{{endpoint="{ep}"}} {m["latency_seconds"]}'
+        )
+        lines.append(
+            f'minka_http_latency_seconds_count{{endpoint="{ep}"}} {m["requests"]}'
+        )
+
+    metric(
+        "stage_seconds",
+        "gauge",
+        "Duración de cada etapa",
+        [({"stage": name}, s["seconds"]) for name, s in data["stages"].items()],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def write_report(path=REPORT_PATH, prometheus_path=PROMETHEUS_PATH):
+    data = report()
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    if prometheus_path:
+        with open(prometheus_path, "w") as f:
+            f.write(prometheus_text(data))
+
+    deduplicated = sum(m["deduplicated"] for m in data["endpoints"].values())
+    print(f"Peticiones repetidas evitadas: {deduplicated}")
+    slowest = sorted(data["stages"].items(), key=lambda s: -s[1]["seconds"])
+    for name, info in slowest:
+        print(f"{name}: {info['seconds']:.1f} s, {info['requests']} peticiones")
+    return data
@@ -0,0 +1,236 @@
+"""
+Clasificación de participantes (observaciones, especies distintas e
+identificaciones por usuario) mantenida de forma incremental.
+
+Se guarda, por observación, lo que aporta a la clasificación (usuario,
+taxón e identificadores) y por usuario contadores: observaciones, especies e
+identificaciones. En cada ejecución sync() solo aplica las observaciones
+nuevas o cambiadas desde la anterior (updated_at no anterior al cursor, o id
+desconocido) y quita las que ya no están: primero se resta lo que aportaban
+y después se suma lo nuevo, así que aplicar dos veces la misma observación
+no cambia nada. Las especies son taxones hoja (leaf_taxa.py), como en
+species_counts, y se recuentan solo para los usuarios de esas observaciones.
+
+El estado se guarda en LEADERBOARD_DIR/{nombre}.pkl (caché de la acción de
+GitHub); si falta, la primera sincronización lo construye con todas.
+
+    python leaderboard.py data/biodiverciutat25/233_obs.csv --top 10
+"""
+
+import argparse
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from identifications import explode_identifiers
+from leaf_taxa import leaf_counts
+from schema import read_obs
+
+LEADERBOARD_DIR = os.getenv("LEADERBOARD_DIR", ".leaderboards")
+# Al cambiar lo que se guarda, los estados anteriores se descartan
+STATE_VERSION = 2
+
+COLUMNS = ["participant", "observacions", "espècies", "identificacions"]
+
+
+def _apply(counter: Counter, counts: pd.Series, sign):
+    """
+    Suma (o resta) counts al contador; quita las claves que quedan a 0
+    """
+    for key, n in counts.items():
+        value = counter[key] + sign * int(n)
+        if value:
+            counter[key] = value
+        else:
+            del counter[key]
+
+
+def observation_delta(known: pd.Index, cursor, df_obs: pd.DataFrame):
+    """
+    Lo que hay que aplicar para pasar de un estado con las observaciones
+    known, sincronizado hasta cursor, a df_obs: (filas nuevas o cambiadas,
+    ids que ya no están, nuevo cursor)
+    """
+    ids = df_obs["id"].to_numpy(dtype="int64")
+    removed = np.setdiff1d(known.to_numpy(), ids)
+    changed = known.get_indexer(ids) < 0
+    updated_at = df_obs["updated_at"].astype(object)
+    present = updated_at.notna().to_numpy()
+    if cursor is not None:
+        # updated_at es un día: las del mismo día se vuelven a aplicar
+        recent = updated_at.where(present, "").astype(str) >= cursor
+        changed |= recent.to_numpy() | ~present
+    else:
+        changed[:] = True
+    if present.any():
+        latest = updated_at[present].astype(str).max()
+        cursor = max(latest, cursor or latest)
+    return df_obs[changed], removed, cursor
+
+
+class Leaderboard:
+    def __init__(self):
+        self.obs = pd.DataFrame(
+            {
+                "user_login": pd.Series(dtype=object),
+                "taxon_id": pd.Series(dtype="Int64"),
+                "identifiers": pd.Series(dtype=object),
+            },
+            index=pd.Index([], dtype="int64", name="id"),
+        )
+        self.observations = Counter()
+        self.species = Counter()
+        self.identifications = Counter()
+        self.cursor = None
+
+    @staticmethod
+    def path(name):
+        return os.path.join(LEADERBOARD_DIR, f"{name}.pkl")
+
+    @classmethod
+    def load(cls, name):
+        """
+        Estado guardado de name o una clasificación vacía
+        """
+        path = cls.path(name)
+        if os.path.exists(path):
+            try:
+                state = pd.read_pickle(path)
+                if state.get("version") == STATE_VERSION:
+                    return state["leaderboard"]
+            except Exception as e:
+                print(f"Error leyendo {path}: {e}")
+        return cls()
+
+    def save(self, name):
+        os.makedirs(LEADERBOARD_DIR, exist_ok=True)
+        path = self.path(name)
+        tmp = f"{path}.tmp"
+        pd.to_pickle({"version": STATE_VERSION, "leaderboard": self}, tmp)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _project(df_obs):
+        """
+        Lo que cada observación aporta a la clasificación
+        """
+        rows = pd.DataFrame(
+            {
+                "user_login": df_obs["user_login"].astype(object).to_numpy(),
+                "taxon_id": df_obs["taxon_id"].astype("Int64").to_numpy(),
+                "identifiers": df_obs["identifiers"].astype(object).to_numpy(),
+            },
+            index=pd.Index(df_obs["id"].to_numpy(dtype="int64"), name="id"),
+        )
+        return rows[~rows.index.duplicated(keep="last")]
+
+    def _contribute(self, rows, sign):
+        rows = rows[rows["user_login"].notna()]
+        _apply(self.observations, rows.groupby("user_login").size(), sign)
+        identified = explode_identifiers(rows.reset_index())
+        _apply(self.identifications, identified.groupby("user_login").size(), sign)
+
+    def update(self, df_obs: pd.DataFrame, removed=()):
+        """
+        Aplica las observaciones de df_obs (nuevas o cambiadas) y quita las de
+        ids removed
+        """
+        rows = self._project(df_obs)
+        ids = np.union1d(rows.index.to_numpy(), np.asarray(removed, dtype="int64"))
+        positions = self.obs.index.get_indexer(ids)
+        old = self.obs.iloc[positions[positions >= 0]]
+        if len(old):
+            self._contribute(old, -1)
+            self.obs = self.obs.drop(old.index)
+        if len(rows):
+            self._contribute(rows, 1)
+            self.obs = pd.concat([self.obs, rows]) if len(self.obs) else rows
+        self._count_species(pd.concat([old["user_login"], rows["user_login"]]))
+        return self
+
+    def _count_species(self, logins):
+        """
+        Vuelve a contar las especies de logins con todas sus observaciones:
+        una observación nueva puede hacer que otro taxón deje de ser hoja
+        """
+        logins = pd.unique(logins.dropna())
+        if not len(logins):
+            return
+        mine = self.obs[self.obs["user_login"].isin(logins)]
+        counts = leaf_counts(mine["user_login"], mine["taxon_id"])
+        for login in logins:
+            if counts.get(login):
+                self.species[login] = int(counts[login])
+            else:
+                self.species.pop(login, None)
+
+    def sync(self, df_obs: pd.DataFrame) -> int:
+        """
+        Deja la clasificación igual a la de df_obs (todas las observaciones
+        del proyecto) aplicando solo las diferencias. Devuelve cuántas
+        observaciones se han aplicado o quitado.
+        """
+        delta, removed, self.cursor = observation_delta(
+            self.obs.index, self.cursor, df_obs
+        )
+        self.update(delta, removed)
+        print(f"Clasificación: {len(delta)} aplicadas, {len(removed)} quitadas")
+        return len(delta) + len(removed)
+
+    def table(self) -> pd.DataFrame:
+        """
+        Participantes (usuarios con observaciones) y sus totales
+        """
+        logins = list(self.observations)
+        return pd.DataFrame(
+            {
+                "participant": logins,
+                "observacions": [self.observations[u] for u in logins],
+                "espècies": [self.species[u] for u in logins],
+                "identificacions": [self.identifications[u] for u in logins],
+            },
+            columns=COLUMNS,
+        )
+
+    def identifications_table(self) -> pd.DataFrame:
+        """
+        Identificaciones de todos los usuarios, participen o no
+        """
+        return pd.DataFrame(
+            list(self.identifications.items()),
+            columns=["user_login", "identificacions"],
+        )
+
+    def top(self, k=None, by="observacions") -> pd.DataFrame:
+        """
+        Los k primeros según by; los empates se ordenan por participante
+        """
+        df = self.table().sort_values(
+            [by, "participant"], ascending=[False, True], kind="mergesort"
+        )
+        df = df.reset_index(drop=True)
+        return df if k is None else df.head(k)
+
+
+def sync_leaderboard(name, df_obs: pd.DataFrame) -> Leaderboard:
+    """
+    Carga el estado de name, lo sincroniza con df_obs y lo guarda
+    """
+    leaderboard = Leaderboard.load(name)
+    leaderboard.sync(df_obs)
+    leaderboard.save(name)
+    return leaderboard
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="{id}_obs.csv")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--by", default="observacions", choices=COLUMNS[1:])
+    args = parser.parse_args()
+
+    leaderboard = Leaderboard()
+    leaderboard.sync(read_obs(args.path))
+    print(leaderboard.top(args.top, args.by).to_string(index=False))
@@ -0,0 +1,61 @@
+"""
+Taxones hoja, la definición de especie de species_counts en la API: cuenta
+cada taxón observado (de cualquier rango) salvo los que son ancestro de otro
+taxón observado del mismo conjunto. Un género deja de contar en cuanto
+aparece una de sus especies; una observación de género sin especies suyas
+cuenta como una más.
+
+La ascendencia sale del árbol taxonómico de mecoda, el mismo que usa get_dfs.
+Los taxones que no están en el árbol cuentan siempre como hoja.
+"""
+
+import numpy as np
+import pandas as pd
+
+# ancestry ("1/2/4") de cada taxon_id
+_ancestry = None
+
+
+def _get_ancestry() -> pd.Series:
+    global _ancestry
+    if _ancestry is None:
+        from mecoda_minka.mecoda_minka import df_taxon
+
+        df_taxon = df_taxon.drop_duplicates("taxon_id").set_index("taxon_id")
+        _ancestry = df_taxon["ancestry"].dropna().astype(str)
+    return _ancestry
+
+
+def ancestor_pairs(taxon_ids) -> pd.DataFrame:
+    """
+    (taxon_id, ancestor_id) de cada taxón de taxon_ids
+    """
+    ids = pd.unique(pd.Series(taxon_ids).dropna().astype("int64"))
+    ancestry = _get_ancestry().reindex(ids).dropna()
+    ancestors = pd.to_numeric(ancestry.str.split("/").explode(), errors="coerce")
+    ancestors = ancestors[ancestors.notna()]
+    return pd.DataFrame(
+        {
+            "taxon_id": ancestors.index.to_numpy(dtype="int64"),
+            "ancestor_id": ancestors.to_numpy(dtype="int64"),
+        }
+    )
+
+
+def leaf_counts(groups, taxon_ids) -> pd.Series:
+    """
+    Taxones hoja distintos de cada grupo, como species_counts filtrando por
+    el grupo (municipio, usuario…)
+    """
+    taxa = pd.DataFrame(
+        {"group": np.asarray(groups, dtype=object), "taxon_id": taxon_ids}
+    )
+    taxa = taxa.dropna().astype({"taxon_id": "int64"}).drop_duplicates()
+    # (grupo, taxón) que es ancestro de otro taxón observado en el grupo
+    covered = taxa.merge(ancestor_pairs(taxa["taxon_id"]), on="taxon_id")
+    covered = covered[["group", "ancestor_id"]].drop_duplicates()
+    covered = covered.rename(columns={"ancestor_id": "taxon_id"})
+    covered["covered"] = True
+    taxa = taxa.merge(covered, on=["group", "taxon_id"], how="left")
+    leaves = taxa[taxa["covered"].isna()]
+    return leaves.groupby("group").size()
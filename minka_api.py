@@ -0,0 +1,321 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+import http_cache
+from instrumentation import (
+    record_cache,
+    record_decode,
+    record_dedup,
+    record_request,
+    record_retry,
+)
+
+API_PATH = os.getenv("MINKA_API_PATH", "https://api.minka-sdg.org/v1")
+
+# Sesión compartida por todos los scripts
+SESSION = requests.Session()
+
+# MINKA_HTTP2=1: las peticiones a la API van por httpx con HTTP/2, todas
+# multiplexadas en una conexión por host (opcional: pip install "httpx[http2]")
+HTTP2 = os.getenv("MINKA_HTTP2", "0") == "1"
+
+# Límites del control de concurrencia por host
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = int(os.getenv("MINKA_MAX_CONCURRENCY", "16"))
+INITIAL_CONCURRENCY = 3
+TARGET_P95_LATENCY = 2.0  # segundos
+MAX_ERROR_RATE = 0.05
+
+
+class RetryableStatus(Exception):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code} for {response.url}")
+        self.response = response
+
+
+class ConcurrencyController:
+    """
+    Límite de peticiones simultáneas a un host con AIMD: sube de uno en uno
+    mientras el p95 de latencia y la tasa de errores de la última ventana
+    estén dentro del objetivo, y se divide por dos con un 429 o un 5xx
+    """
+
+    def __init__(
+        self,
+        initial=INITIAL_CONCURRENCY,
+        minimum=MIN_CONCURRENCY,
+        maximum=MAX_CONCURRENCY,
+        target_latency=TARGET_P95_LATENCY,
+        window=20,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.window = window
+        self.in_flight = 0
+        self._latencies = deque(maxlen=window)
+        self._errors = deque(maxlen=window)
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        # tras un 429 con Retry-After todos los hilos esperan
+        wait = self._paused_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def release(self, latency, status=None, retry_after=None):
+        with self._cond:
+            self.in_flight -= 1
+            overloaded = status is None or status == 429 or status >= 500
+            if overloaded:
+                self.limit = max(self.minimum, self.limit / 2)
+                self._latencies.clear()
+                self._errors.clear()
+                if retry_after:
+                    self._paused_until = time.monotonic() + retry_after
+            else:
+                self._latencies.append(latency)
+                self._errors.append(status >= 400)
+                if len(self._latencies) == self.window:
+                    p95 = sorted(self._latencies)[int(0.95 * (self.window - 1))]
+                    error_rate = sum(self._errors) / len(self._errors)
+                    if p95 <= self.target_latency and error_rate <= MAX_ERROR_RATE:
+                        self.limit = min(self.maximum, self.limit + 1)
+                    self._latencies.clear()
+                    self._errors.clear()
+            self._cond.notify_all()
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(url) -> ConcurrencyController:
+    host = urlsplit(url).netloc
+    with _controllers_lock:
+        if host not in _controllers:
+            _controllers[host] = ConcurrencyController()
+        return _controllers[host]
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+_http2_client = None
+_http2_lock = threading.Lock()
+
+
+def get_http2_client():
+    global _http2_client
+    with _http2_lock:
+        if _http2_client is None:
+            import httpx
+
+            _http2_client = httpx.Client(http2=True, timeout=60)
+        return _http2_client
+
+
+def _send(url, params, headers):
+    if HTTP2:
+        # httpx envía los None como parámetros vacíos; requests los omite
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
+        return get_http2_client().get(url, params=params, headers=headers)
+    return SESSION.get(url, params=params, headers=headers, timeout=60)
+
+
+def _get(url, params=None, headers=None):
+    controller = get_controller(url)
+    controller.acquire()
+    start = time.monotonic()
+    try:
+        response = _send(url, params, headers)
+    except Exception:
+        latency = time.monotonic() - start
+        controller.release(latency)
+        record_request(url, latency)
+        raise
+    latency = time.monotonic() - start
+    controller.release(latency, response.status_code, _retry_after(response))
+    record_request(url, latency, response.status_code, len(response.content))
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableStatus(response)
+    # httpx también lanza con un 304
+    if response.status_code >= 400:
+        response.raise_for_status()
+    return response
+
+
+# Memoria de la ejecución: clave canónica -> Future con el JSON. Una misma
+# petición se hace una sola vez aunque la pidan varios hilos a la vez. Se
+# guardan las MEMO_SIZE más recientes.
+MEMO_SIZE = 2048
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def clear_memo():
+    with _memo_lock:
+        _memo.clear()
+
+
+class IncompleteResponse(ValueError):
+    def __init__(self, url, field):
+        super().__init__(f"API response missing '{field}' for {url}")
+
+
+def get_json(
+    url, params=None, headers=None, max_retries=3, memo=True, required="results"
+):
+    """
+    GET con reintentos y espera exponencial; devuelve el JSON de la respuesta.
+    Las respuestas se guardan en http_cache y se piden de nuevo de forma
+    condicional. Una respuesta sin el campo required se reintenta y no se
+    guarda.
+
+    Con memo=True una petición ya hecha (o en curso) en esta ejecución
+    devuelve el mismo objeto, que no debe modificarse. Las páginas que solo
+    se recorren una vez van con memo=False para no acumularlas en memoria;
+    tampoco se guardan en http_cache: su cursor id_below cambia en cuanto
+    llegan observaciones nuevas y casi nunca se repiten.
+    """
+    if not memo:
+        return _fetch_json(url, params, headers, max_retries, required, cache=False)
+
+    key = http_cache.request_key(url, params, headers)
+    with _memo_lock:
+        future = _memo.get(key)
+        owner = future is None
+        if owner:
+            future = _memo[key] = Future()
+            if len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+        else:
+            _memo.move_to_end(key)
+    if not owner:
+        record_dedup(url)
+        json_data = future.result()
+        if required in json_data:
+            return json_data
+        # la guardada trae otros campos (p.ej. results sin total_results)
+        return _fetch_json(url, params, headers, max_retries, required)
+
+    try:
+        json_data = _fetch_json(url, params, headers, max_retries, required)
+    except Exception as e:
+        with _memo_lock:
+            _memo.pop(key, None)
+        future.set_exception(e)
+        raise
+    future.set_result(json_data)
+    return json_data
+
+
+def _fetch_json(url, params, headers, max_retries, required="results", cache=True):
+    cache = cache and http_cache.enabled()
+    if cache:
+        key = http_cache.request_key(url, params, headers)
+    for attempt in range(max_retries):
+        try:
+            entry = http_cache.load(key) if cache else None
+            request_headers = {**(headers or {}), **http_cache.validators(entry)}
+            response = _get(url, params, request_headers)
+            cached = response.status_code == 304 and entry is not None
+            # sin cambios: solo ha viajado la cabecera
+            body = http_cache.read_body(entry) if cached else response.content
+            start = time.monotonic()
+            json_data = json.loads(body)
+            record_decode(url, time.monotonic() - start)
+            if required not in json_data:
+                if cached:
+                    http_cache.remove(key)
+                raise IncompleteResponse(url, required)
+            if cached:
+                record_cache(url, True)
+            elif cache:
+                record_cache(url, http_cache.store(key, url, response, entry))
+            return json_data
+        except Exception as e:
+            if attempt < max_retries - 1:
+                record_retry(url)
+                print(
+                    f"API request failed (attempt {attempt + 1}): {e}, retrying after delay..."
+                )
+                retry_after = None
+                if isinstance(e, RetryableStatus):
+                    retry_after = _retry_after(e.response)
+                time.sleep(retry_after or 2**attempt)
+            else:
+                print(f"API request failed after {max_retries} attempts: {e}")
+                raise
+
+
+def get_total_results(url, params=None, headers=None, max_retries=3):
+    """
+    total_results de una consulta; reintenta si la respuesta no lo trae
+    """
+    json_data = get_json(url, params, headers, max_retries, required="total_results")
+    return json_data["total_results"]
+
+
+# Un único pool para todas las etapas: el límite real lo pone el controlador
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY)
+
+
+def map_concurrent(func, items):
+    """
+    Aplica func a cada elemento en el pool compartido y devuelve los
+    resultados en el mismo orden. No debe llamarse desde dentro de func.
+    """
+    return list(_executor.map(func, items))
+
+
+def iter_observation_pages(params, headers=None, per_page=200):
+    """
+    Recorre /observations por id descendente (id_below como cursor) y
+    devuelve los resultados de cada página sin acumularlos. Solo para en una
+    página vacía: la API puede dar menos de per_page por página.
+    """
+    params = dict(params)
+    params.update({"order_by": "id", "order": "desc", "per_page": per_page})
+    while True:
+        results = get_json(f"{API_PATH}/observations", params, headers, memo=False)[
+            "results"
+        ]
+        if not results:
+            break
+        yield results
+        params["id_below"] = results[-1]["id"]
+
+
+def observation_id_range(params, headers=None):
+    """
+    (total, id mínimo, id máximo) de las observaciones que cumplen params, o
+    None si no hay ninguna
+    """
+    url = f"{API_PATH}/observations"
+    ends = []
+    for order in ["asc", "desc"]:
+        query = {**params, "order_by": "id", "order": order, "per_page": 1}
+        json_data = get_json(url, query, headers, memo=False)
+        if not json_data["results"]:
+            return None
+        ends.append(json_data["results"][0]["id"])
+    return json_data["total_results"], ends[0], ends[1]
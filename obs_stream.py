@@ -0,0 +1,516 @@
+import functools
+import math
+import multiprocessing
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from mecoda_minka import ICONIC_TAXON
+
+import checkpoints
+from minka_api import (
+    iter_observation_pages,
+    map_concurrent,
+    observation_id_range,
+)
+from output_writer import replace_file
+from photo_store import keep_paths, kept_paths, write_photos
+from schema import (
+    OBS_DTYPES,
+    PHOTOS_DTYPES,
+    apply_obs_schema,
+    apply_photos_schema,
+    read_obs,
+    read_photos,
+)
+from sidecar import merge, summarise, write_dataset, write_sidecar
+
+TAXON_RANKS = ["kingdom", "phylum", "class", "order", "family", "genus"]
+
+# Campos de cada resultado de /observations que usa get_page_dfs
+RESULT_FIELDS = [
+    "id",
+    "created_at",
+    "updated_at",
+    "observed_on",
+    "time_observed_at",
+    "iconic_taxon_id",
+    "location",
+    "obscured",
+    "place_guess",
+    "quality_grade",
+    "license_code",
+    "identifications_count",
+    "num_identification_agreements",
+    "num_identification_disagreements",
+    "oauth_application_id",
+]
+TAXON_FIELDS = ["id", "rank", "name", "ancestry", "iconic_taxon_id"]
+PHOTO_FIELDS = ["id", "url", "license_code", "attribution"]
+
+# Procesos para convertir las páginas en paralelo; con 0 se convierten en el
+# proceso principal
+PROCESSES = int(os.getenv("MINKA_PROCESSES", "0"))
+
+# Tramos de ids que se descargan a la vez; con 0 o 1 la descarga es una
+# sola paginación
+SHARDS = int(os.getenv("MINKA_SHARDS", "0"))
+
+# Ids por consulta id=… al pedir solo las observaciones nuevas
+ID_BATCH = 200
+
+# Los procesos de conversión no se crean con fork: el proceso principal ya
+# tiene hilos (pool de minka_api, sesión HTTP) y un fork con hilos en marcha
+# puede bloquear a los hijos
+MP_CONTEXT = multiprocessing.get_context("forkserver")
+
+# rank y nombre de cada taxon_id, del mismo árbol que usa get_dfs. df_taxon
+# no es API pública de mecoda-minka: la versión está fijada en
+# requirements.txt y bench_get_dfs compara get_page_dfs con get_dfs
+_taxon_lookup = None
+
+
+def _get_taxon_lookup():
+    global _taxon_lookup
+    if _taxon_lookup is None:
+        from mecoda_minka.mecoda_minka import df_taxon
+
+        df_taxon = df_taxon.drop_duplicates("taxon_id").set_index("taxon_id")
+        _taxon_lookup = (df_taxon["rank"], df_taxon["taxon_name"])
+    return _taxon_lookup
+
+
+def _taxon_columns(ancestry: pd.Series) -> pd.DataFrame:
+    """
+    kingdom…genus a partir de taxon_ancestry ("1/2/..."), como hace get_dfs
+    """
+    ranks, names = _get_taxon_lookup()
+    ids = pd.to_numeric(ancestry.str.split("/").explode(), errors="coerce")
+    ids = ids[ids.notna() & (ids != 1)]
+    levels = pd.DataFrame({"rank": ids.map(ranks), "name": ids.map(names)})
+    levels = levels[levels["rank"].isin(TAXON_RANKS)].rename_axis("row")
+    # si un rango aparece dos veces en la ascendencia gana el último
+    levels = levels.reset_index().drop_duplicates(["row", "rank"], keep="last")
+    wide = levels.pivot(index="row", columns="rank", values="name")
+    return wide.reindex(index=ancestry.index, columns=TAXON_RANKS)
+
+
+def _utc_date(values):
+    dates = pd.to_datetime(pd.Series(values), errors="coerce", utc=True).dt.date
+    return dates.astype(str).where(dates.notna())
+
+
+def _madrid_time(values):
+    times = pd.to_datetime(pd.Series(values), errors="coerce", utc=True)
+    times = times.dt.tz_convert("Europe/Madrid").dt.time
+    return times.astype(str).where(times.notna())
+
+
+def _location(result):
+    location = result.get("location")
+    if location:
+        try:
+            lat, lon = map(float, location.split(","))
+            return lat, lon
+        except ValueError:
+            pass
+    return None, None
+
+
+def get_page_dfs(results):
+    """
+    Convierte una página de /observations en los DataFrames de observaciones
+    y fotos, con las mismas columnas que get_dfs pero sin crear objetos
+    Observation
+    """
+    obs_rows = []
+    photo_rows = []
+    for result in results:
+        taxon = result.get("taxon") or {}
+        user = result.get("user") or {}
+        iconic_id = taxon.get("iconic_taxon_id") or result.get("iconic_taxon_id")
+        latitude, longitude = _location(result)
+        identifiers = [
+            ident["user"]["login"]
+            for ident in result.get("identifications") or []
+            if (ident.get("user") or {}).get("login")
+        ]
+        place_guess = result.get("place_guess")
+        row = {
+            "id": result["id"],
+            "created_at": result.get("created_at"),
+            "updated_at": result.get("updated_at"),
+            "observed_on": result.get("observed_on"),
+            "observed_on_time": result.get("time_observed_at"),
+            "iconic_taxon": ICONIC_TAXON.get(iconic_id),
+            "taxon_id": taxon.get("id"),
+            "taxon_rank": taxon.get("rank"),
+            "taxon_name": taxon.get("name"),
+            "latitude": latitude,
+            "longitude": longitude,
+            "obscured": result.get("obscured"),
+            "place_name": (
+                place_guess.replace("\r\n", " ").strip() if place_guess else None
+            ),
+            "quality_grade": result.get("quality_grade"),
+            "user_id": user.get("id"),
+            "user_login": user.get("login"),
+            "license_obs": result.get("license_code") or "C",
+            "identifications_count": result.get("identifications_count"),
+            "identifiers": ", ".join(identifiers) if identifiers else None,
+            "num_identification_agreements": result.get(
+                "num_identification_agreements"
+            ),
+            "num_identification_disagreements": result.get(
+                "num_identification_disagreements"
+            ),
+            "device": "app" if result.get("oauth_application_id") == 2 else "web",
+            "taxon_ancestry": taxon.get("ancestry"),
+        }
+        obs_rows.append(row)
+
+        for obs_photo in result.get("observation_photos") or []:
+            photo = obs_photo.get("photo") or {}
+            url = photo.get("url")
+            if not url:
+                continue
+            medium_url = url.replace("/square", "/medium")
+            photo_rows.append(
+                {
+                    "id": row["id"],
+                    "photos_id": photo.get("id"),
+                    "iconic_taxon": row["iconic_taxon"],
+                    "taxon_name": row["taxon_name"],
+                    "photos_medium_url": medium_url,
+                    "user_login": row["user_login"],
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "license_photo": photo.get("license_code"),
+                    "attribution": photo.get("attribution"),
+                    "path": f"{row['id']}_{photo.get('id')}.{medium_url.split('.')[-1]}",
+                }
+            )
+
+    df_obs = pd.DataFrame(obs_rows)
+    if not df_obs.empty:
+        for col in ["created_at", "updated_at", "observed_on"]:
+            df_obs[col] = _utc_date(df_obs[col])
+        df_obs["observed_on_time"] = _madrid_time(df_obs["observed_on_time"])
+        taxon_columns = _taxon_columns(df_obs.pop("taxon_ancestry"))
+        df_obs = pd.concat([df_obs, taxon_columns], axis=1)
+        df_obs = df_obs.sort_values(by="id", ascending=False)
+    df_obs = apply_obs_schema(df_obs.reindex(columns=list(OBS_DTYPES)))
+
+    df_photos = pd.DataFrame(photo_rows, columns=list(PHOTOS_DTYPES))
+    copyright_mask = df_photos["license_photo"].isna() & df_photos[
+        "attribution"
+    ].str.contains("all rights reserved", na=False)
+    df_photos.loc[copyright_mask, "license_photo"] = "C"
+    df_photos = apply_photos_schema(df_photos)
+
+    return df_obs, df_photos
+
+
+def slim_result(result):
+    """
+    Solo los campos que usa get_page_dfs: cada resultado completo ocupa
+    ~25 KB al pasarlo a otro proceso
+    """
+    taxon = result.get("taxon")
+    user = result.get("user")
+    slim = {field: result.get(field) for field in RESULT_FIELDS}
+    slim["taxon"] = taxon and {field: taxon.get(field) for field in TAXON_FIELDS}
+    slim["user"] = user and {"id": user.get("id"), "login": user.get("login")}
+    slim["identifications"] = [
+        {"user": {"login": (ident.get("user") or {}).get("login")}}
+        for ident in result.get("identifications") or []
+    ]
+    slim["observation_photos"] = [
+        {"photo": {field: (p.get("photo") or {}).get(field) for field in PHOTO_FIELDS}}
+        for p in result.get("observation_photos") or []
+    ]
+    return slim
+
+
+def convert_page(results):
+    """
+    Página de /observations -> (obs, fotos)
+    """
+    return get_page_dfs(results)
+
+
+def iter_converted_pages(pages, processes=PROCESSES, pool=None):
+    """
+    Convierte las páginas a medida que llegan y las devuelve en orden como
+    (último id, obs, fotos). Con processes > 0 la conversión se
+    reparte entre procesos (los de pool si se pasa uno) mientras se siguen
+    descargando páginas; como mucho hay 2 páginas por proceso pendientes.
+    """
+    if not processes:
+        for results in pages:
+            yield (results[-1]["id"], *convert_page(results))
+        return
+
+    if pool is None:
+        with ProcessPoolExecutor(
+            processes, initializer=_get_taxon_lookup, mp_context=MP_CONTEXT
+        ) as pool:
+            yield from iter_converted_pages(pages, processes, pool)
+        return
+
+    pending = deque()
+    for results in pages:
+        slim = [slim_result(result) for result in results]
+        pending.append((results[-1]["id"], pool.submit(convert_page, slim)))
+        if len(pending) >= 2 * processes:
+            last_id, future = pending.popleft()
+            yield (last_id, *future.result())
+    while pending:
+        last_id, future = pending.popleft()
+        yield (last_id, *future.result())
+
+
+def _append(df, path):
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    df.to_csv(path, index=False, mode="w" if new else "a", header=new)
+
+
+def _concat(paths, target):
+    """
+    Une CSV con la misma cabecera en el orden dado
+    """
+    header = None
+    with open(target, "w") as out:
+        for path in paths:
+            with open(path) as f:
+                line = f.readline()
+                if not line:
+                    continue
+                if header is None:
+                    header = line
+                    out.write(header)
+                shutil.copyfileobj(f, out)
+
+
+def _install(part, path, stats):
+    # se copia para que el parcial siga disponible si la ejecución se reanuda
+    shutil.copyfile(part, f"{path}.part")
+    replace_file(f"{path}.part", path, rows=stats["rows"])
+    write_sidecar(path, stats)
+
+
+def _part_paths(key):
+    return [
+        checkpoints.part_path("stream_obs", *key, suffix=suffix)
+        for suffix in ["_obs.csv", "_photos.csv"]
+    ]
+
+
+def _stream_range(
+    key, params, headers=None, processes=PROCESSES, pool=None, paths=None
+):
+    """
+    Descarga las observaciones de params (por id descendente) a los
+    parciales de key, con checkpoint después de cada página. Las fotos de
+    paths conservan su path guardado. Devuelve los parciales y el estado
+    (totales).
+    """
+    parts = _part_paths(key)
+    state = checkpoints.load("stream_obs", *key)
+    if state is None or not all(os.path.exists(p) for p in parts):
+        state = {"id_below": None, "total_obs": 0, "total_photos": 0, "done": False}
+        state["sizes"] = [0, 0]
+        # metadatos de obs y fotos (sidecar.py), sin volver a leer los CSV
+        state["stats"] = [summarise(pd.DataFrame())] * 2
+    elif not state["done"]:
+        print(f"Reanudando descarga de {key[0]}: {state['total_obs']} obs")
+    # descarta lo escrito después del último checkpoint
+    for part, size in zip(parts, state["sizes"]):
+        with open(part, "a") as f:
+            f.truncate(size)
+
+    page_params = dict(params)
+    if state["id_below"] is not None:
+        page_params["id_below"] = state["id_below"]
+
+    if not state["done"]:
+        pages = iter_observation_pages(page_params, headers)
+        for last_id, df_obs, df_photos in iter_converted_pages(pages, processes, pool):
+            if paths is not None:
+                df_photos = keep_paths(df_photos, paths)
+            for df, part in zip([df_obs, df_photos], parts):
+                _append(df, part)
+            state["id_below"] = last_id
+            state["total_obs"] += len(df_obs)
+            state["total_photos"] += len(df_photos)
+            state["stats"] = [
+                merge(stats, summarise(df))
+                for stats, df in zip(state["stats"], [df_obs, df_photos])
+            ]
+            state["sizes"] = [os.path.getsize(p) for p in parts]
+            checkpoints.save(state, "stream_obs", *key)
+            print(f"Number of elements: {state['total_obs']}")
+        state["done"] = True
+        checkpoints.save(state, "stream_obs", *key)
+    return parts, state
+
+
+def shard_params(params, shards, headers=None, per_page=200):
+    """
+    Reparte el rango de ids de params en hasta shards tramos [id_above,
+    id_below), de mayor a menor id. Con pocas observaciones hay menos tramos.
+    """
+    id_range = observation_id_range(params, headers)
+    if id_range is None:
+        return []
+    total, min_id, max_id = id_range
+    shards = max(1, min(shards, math.ceil(total / per_page)))
+    step = math.ceil((max_id - min_id + 1) / shards)
+    bounds = [
+        (min_id - 1 + i * step, min(min_id + (i + 1) * step, max_id + 1))
+        for i in range(shards)
+    ]
+    return [
+        {**params, "id_above": above, "id_below": below}
+        for above, below in reversed(bounds)
+    ]
+
+
+def _stream_shards(key, params, shards, headers=None, processes=PROCESSES, paths=None):
+    """
+    Descarga los tramos de ids a la vez (el límite de peticiones lo pone el
+    controlador de minka_api) y los une en los parciales de key en orden de
+    id. Cada tramo tiene su checkpoint: si uno falla se reintenta una vez y,
+    si vuelve a fallar, al reanudar solo se repite lo que le faltaba.
+    """
+    # el reparto se guarda para que al reanudar los tramos sean los mismos
+    plan = checkpoints.cached(
+        "stream_obs_plan", key, lambda: shard_params(params, shards, headers)
+    )
+    print(f"Descargando {key[0]} en {len(plan)} tramos de ids")
+
+    pool = None
+    if processes:
+        pool = ProcessPoolExecutor(
+            processes, initializer=_get_taxon_lookup, mp_context=MP_CONTEXT
+        )
+
+    def run(shard):
+        try:
+            return _stream_range(key + (shard,), shard, headers, processes, pool, paths)
+        except Exception as e:
+            print(f"Error en el tramo {shard['id_above']}-{shard['id_below']}: {e}")
+            return e
+
+    try:
+        results = map_concurrent(run, plan)
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                results[i] = _stream_range(
+                    key + (plan[i],), plan[i], headers, processes, pool, paths
+                )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    parts = _part_paths(key)
+    for i, part in enumerate(parts):
+        _concat([shard_parts[i] for shard_parts, _ in results], part)
+    state = {
+        "total_obs": sum(state["total_obs"] for _, state in results),
+        "total_photos": sum(state["total_photos"] for _, state in results),
+        "stats": [
+            functools.reduce(merge, [state["stats"][i] for _, state in results])
+            for i in range(2)
+        ],
+    }
+    return parts, state
+
+
+def stream_obs(
+    path_obs, path_photos, headers=None, processes=PROCESSES, shards=SHARDS, **params
+):
+    """
+    Descarga las observaciones que cumplen params página a página y las va
+    añadiendo a path_obs y path_photos. Solo hay una página en memoria; los
+    ficheros se sustituyen al terminar la descarga. Las fotos ya guardadas
+    conservan su path (photo_store.kept_paths).
+
+    Los parciales y el cursor se guardan como checkpoint después de cada
+    página: si la ejecución se reanuda, la descarga sigue donde se quedó.
+    Con processes (o MINKA_PROCESSES) la conversión usa varios procesos y con
+    shards (o MINKA_SHARDS) el rango de ids se descarga en tramos paralelos.
+    """
+    key = (path_obs, params)
+    paths = kept_paths(path_photos)
+    if shards > 1:
+        parts, state = _stream_shards(key, params, shards, headers, processes, paths)
+    else:
+        parts, state = _stream_range(key, params, headers, processes, paths=paths)
+    tmp_obs, tmp_photos = parts
+
+    total_obs, total_photos = state["total_obs"], state["total_photos"]
+    if total_obs > 0:
+        # Solo se sustituyen los ficheros si el contenido ha cambiado
+        _install(tmp_obs, path_obs, state["stats"][0])
+        _install(tmp_photos, path_photos, state["stats"][1])
+    return total_obs, total_photos
+
+
+def fetch_obs(params, ids=(), updated_since=None, headers=None):
+    """
+    (obs, fotos) de las observaciones de params con id en ids o actualizadas
+    desde updated_since
+    """
+    ids = [str(i) for i in ids]
+    queries = [
+        {**params, "id": ",".join(ids[i : i + ID_BATCH])}
+        for i in range(0, len(ids), ID_BATCH)
+    ]
+    if updated_since is not None:
+        queries.append({**params, "updated_since": updated_since})
+
+    def fetch(query):
+        return [get_page_dfs(r) for r in iter_observation_pages(query, headers)]
+
+    frames = [frame for pages in map_concurrent(fetch, queries) for frame in pages]
+    if not frames:
+        return apply_obs_schema(pd.DataFrame()), apply_photos_schema(pd.DataFrame())
+    df_obs = apply_obs_schema(pd.concat([f[0] for f in frames], ignore_index=True))
+    df_photos = pd.concat([f[1] for f in frames], ignore_index=True)
+    # una observación nueva puede estar además entre las actualizadas
+    df_obs = df_obs.drop_duplicates("id")
+    df_photos = df_photos.drop_duplicates(["id", "photos_id"])
+    return df_obs, apply_photos_schema(df_photos)
+
+
+def update_obs(
+    path_obs, path_photos, ids, updated_since=None, headers=None, **params
+) -> int:
+    """
+    Descarga solo las observaciones ids y las actualizadas desde
+    updated_since y las pone en path_obs y path_photos en lugar de las que
+    ya había, sin volver a descargar todo el proyecto. Devuelve cuántas
+    observaciones se han aplicado.
+    """
+    df_new, df_photos_new = fetch_obs(params, ids, updated_since, headers)
+    print(f"Observaciones nuevas o actualizadas: {len(df_new)} ({path_obs})")
+    if not len(df_new):
+        return 0
+
+    df_obs = read_obs(path_obs)
+    df_obs = apply_obs_schema(
+        pd.concat([df_obs[~df_obs["id"].isin(df_new["id"])], df_new])
+    )
+    write_dataset(df_obs, path_obs, sort_by="id", ascending=False)
+
+    df_photos_new = keep_paths(df_photos_new, kept_paths(path_photos))
+    df_photos = read_photos(path_photos)
+    df_photos = pd.concat(
+        [df_photos[~df_photos["id"].isin(df_new["id"])], df_photos_new]
+    )
+    df_photos = df_photos.sort_values("id", ascending=False, kind="stable")
+    write_photos(df_photos, path_photos)
+    return len(df_new)
@@ -0,0 +1,117 @@
+import datetime
+import hashlib
+import json
+import os
+import sys
+
+import pandas as pd
+
+# Manifiesto de la ejecución: qué ficheros se han escrito y cuáles han cambiado
+MANIFEST_PATH = os.getenv("CHANGES_MANIFEST", "changes.json")
+
+_files = {}
+
+
+def serialise_csv(df: pd.DataFrame, sort_by=None, ascending=True) -> bytes:
+    """
+    CSV determinista: orden estable y enteros sin ".0" aunque la columna
+    sea float (p.ej. espècies 21.0 -> 21)
+    """
+    df = df.copy()
+    if sort_by is not None:
+        df = df.sort_values(by=sort_by, ascending=ascending, kind="mergesort")
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_float_dtype(values) and not isinstance(
+            values.dtype, pd.CategoricalDtype
+        ):
+            present = values.dropna()
+            if (present == present.round()).all() and present.abs().max() < 2**53:
+                df[col] = values.astype("Int64")
+    return df.to_csv(index=False, lineterminator="\n").encode()
+
+
+def _record(path, data, changed, rows=None):
+    _files[os.path.normpath(path)] = {
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "changed": changed,
+        "rows": rows,
+    }
+
+
+def _same_content(path, data):
+    if not os.path.exists(path) or os.path.getsize(path) != len(data):
+        return False
+    with open(path, "rb") as f:
+        return f.read() == data
+
+
+def write_bytes(data: bytes, path, rows=None) -> bool:
+    """
+    Escribe data en path solo si el contenido ha cambiado; devuelve si se ha
+    escrito
+    """
+    if _same_content(path, data):
+        _record(path, data, False, rows)
+        return False
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    _record(path, data, True, rows)
+    return True
+
+
+def write_csv(df: pd.DataFrame, path, sort_by=None, ascending=True) -> bool:
+    data = serialise_csv(df, sort_by, ascending)
+    changed = write_bytes(data, path, rows=len(df))
+    if not changed:
+        print(f"Sin cambios: {path}")
+    return changed
+
+
+def replace_file(tmp_path, path, rows=None) -> bool:
+    """
+    Sustituye path por tmp_path (p.ej. un CSV escrito por bloques) solo si el
+    contenido es distinto
+    """
+    with open(tmp_path, "rb") as f:
+        data = f.read()
+    if _same_content(path, data):
+        os.remove(tmp_path)
+        _record(path, data, False, rows)
+        return False
+    os.replace(tmp_path, path)
+    _record(path, data, True, rows)
+    return True
+
+
+def file_info(path):
+    """
+    sha256, filas y si ha cambiado, de un fichero escrito en esta ejecución
+    """
+    return _files.get(os.path.normpath(path))
+
+
+def changed_files():
+    return [path for path, info in _files.items() if info["changed"]]
+
+
+def write_manifest(path=MANIFEST_PATH):
+    manifest = {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "changed": changed_files(),
+        "files": _files,
+    }
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    print(f"{len(manifest['changed'])} ficheros modificados de {len(_files)}")
+
+
+if __name__ == "__main__":
+    # Lista los ficheros modificados para el paso de commit:
+    # python output_writer.py | xargs -r git add
+    path = sys.argv[1] if len(sys.argv) > 1 else MANIFEST_PATH
+    if os.path.exists(path):
+        with open(path) as f:
+            print("\n".join(json.load(f)["changed"]))
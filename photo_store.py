@@ -0,0 +1,110 @@
+"""
+Tabla de fotos {id}_photos.csv y su forma normalizada.
+
+{id}_photos.csv, con todas las columnas, es el único formato que se guarda
+en el repositorio: lo leen las galerías y las fuentes de Datawrapper. La
+forma normalizada (referencias id, photos_id, license_photo,
+attribution_key y extension, y los textos de atribución aparte) solo se
+genera cuando se pide:
+
+    python photo_store.py data/biomarato25/417_photos.csv /tmp/417
+    # -> /tmp/417_photo_refs.csv y /tmp/417_attributions.csv
+"""
+
+import hashlib
+import os
+import sys
+
+import pandas as pd
+
+from schema import (
+    PHOTO_REFS_DTYPES,
+    PHOTOS_DTYPES,
+    apply_photos_schema,
+    apply_schema,
+    read_photos,
+)
+from sidecar import write_dataset
+
+PHOTO_URL = "https://minka-sdg.org/attachments/local_photos/files/"
+
+
+def _attribution_key(attribution):
+    if pd.isna(attribution):
+        return None
+    return hashlib.md5(attribution.encode()).hexdigest()[:10]
+
+
+def split_photos(df_photos: pd.DataFrame):
+    """
+    Separa una tabla de fotos completa en referencias (id, photos_id,
+    license_photo, attribution_key, extension) y la tabla de atribuciones
+    """
+    attribution = df_photos["attribution"].astype(object)
+    keys = attribution.map(_attribution_key)
+    refs = pd.DataFrame(
+        {
+            "id": df_photos["id"],
+            "photos_id": df_photos["photos_id"],
+            "license_photo": df_photos["license_photo"],
+            "attribution_key": keys,
+            "extension": df_photos["photos_medium_url"]
+            .astype(object)
+            .str.rsplit(".", n=1)
+            .str[-1],
+        }
+    )
+    df_attributions = (
+        pd.DataFrame({"attribution_key": keys, "attribution": attribution})
+        .dropna()
+        .drop_duplicates("attribution_key")
+        .sort_values("attribution_key")
+    )
+    return apply_schema(refs, PHOTO_REFS_DTYPES), df_attributions
+
+
+def _stem(df):
+    return df["id"].astype(str) + "_" + df["photos_id"].astype("Int64").astype(str)
+
+
+def kept_paths(path_photos) -> pd.Series:
+    """
+    {id}_{photos_id} -> path de las fotos ya guardadas cuyo path no sigue el
+    formato actual ({id}_{photos_id}.{extensión de la URL}); p.ej. las
+    antiguas, todas con .jpg
+    """
+    if not os.path.exists(path_photos):
+        return pd.Series(dtype=object)
+    df = pd.read_csv(
+        path_photos, usecols=["id", "photos_id", "photos_medium_url", "path"]
+    ).dropna(subset=["photos_id", "path"])
+    stem = _stem(df)
+    extension = df["photos_medium_url"].astype(str).str.rsplit(".", n=1).str[-1]
+    kept = df["path"] != stem + "." + extension
+    paths = pd.Series(df["path"][kept].to_numpy(), index=stem[kept].to_numpy())
+    return paths[~paths.index.duplicated(keep="last")]
+
+
+def keep_paths(df_photos: pd.DataFrame, paths: pd.Series) -> pd.DataFrame:
+    """
+    Mantiene el path guardado de las fotos de paths, para no reescribir
+    filas que no han cambiado
+    """
+    if not len(paths) or not len(df_photos):
+        return df_photos
+    old = _stem(df_photos).map(paths)
+    df_photos = df_photos.copy()
+    df_photos["path"] = old.where(old.notna(), df_photos["path"].astype(object))
+    return df_photos
+
+
+def write_photos(df_photos, path_photos):
+    write_dataset(apply_photos_schema(df_photos)[list(PHOTOS_DTYPES)], path_photos)
+
+
+if __name__ == "__main__":
+    path_photos, prefix = sys.argv[1], sys.argv[2]
+    refs, df_attributions = split_photos(read_photos(path_photos))
+    refs.to_csv(f"{prefix}_photo_refs.csv", index=False)
+    df_attributions.to_csv(f"{prefix}_attributions.csv", index=False)
+    print(f"Normalised {len(refs)} photos to {os.path.abspath(prefix)}_*.csv")
@@ -0,0 +1,257 @@
+"""
+Descarga de las fotos de {id}_photos.csv para las galerías.
+
+Solo se descargan los photos_id que faltan (o, con revalidate, los que han
+cambiado según su ETag), con un pool de hilos acotado. Cada descarga se
+escribe en partial/{photos_id}.part y se reanuda con Range si se corta; al
+terminar se mueve de forma atómica a objects/{sha256[:2]}/{sha256}.{ext}
+(mismo contenido, mismo fichero). index.json guarda photos_id -> sha256 y el
+path de la galería ({id}_{photos_id}.{ext}) es un enlace al objeto.
+
+Con thumbnails se generan miniaturas en thumbs/ en un pool de procesos
+(opcional: necesita Pillow).
+
+    python photo_sync.py data/biomarato25/417_photos.csv --thumbnails
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from instrumentation import record_request
+from minka_api import SESSION
+from photo_store import PHOTO_URL, split_photos
+from schema import read_photos
+
+PHOTOS_DIR = os.getenv("PHOTOS_DIR", "photos")
+# Servidor de las fotos; en los benchmarks, el servidor local de fotos
+PHOTO_HOST = os.getenv("MINKA_PHOTO_URL", PHOTO_URL)
+WORKERS = int(os.getenv("MINKA_PHOTO_WORKERS", "8"))
+THUMBNAIL_SIZE = 320
+CHUNK_SIZE = 64 * 1024
+# El índice se guarda cada tantas descargas para no perderlas si se corta
+SAVE_EVERY = 100
+
+
+def photo_url(photos_id, extension):
+    return f"{PHOTO_HOST}{photos_id}/medium.{extension}"
+
+
+def _index_path(photos_dir):
+    return os.path.join(photos_dir, "index.json")
+
+
+def load_index(photos_dir=PHOTOS_DIR) -> dict:
+    path = _index_path(photos_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_index(index, photos_dir=PHOTOS_DIR):
+    path = _index_path(photos_dir)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def object_path(entry, photos_dir=PHOTOS_DIR):
+    digest = entry["sha256"]
+    return os.path.join(
+        photos_dir, "objects", digest[:2], f"{digest}.{entry['extension']}"
+    )
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download_photo(photos_id, extension, entry=None, photos_dir=PHOTOS_DIR):
+    """
+    Descarga una foto (o comprueba con If-None-Match que no ha cambiado) y
+    devuelve su entrada del índice
+    """
+    url = photo_url(photos_id, extension)
+    part = os.path.join(photos_dir, "partial", f"{photos_id}.part")
+    os.makedirs(os.path.dirname(part), exist_ok=True)
+
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+
+    start = time.monotonic()
+    with SESSION.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            record_request(url, time.monotonic() - start, 304)
+            return entry
+        if response.status_code == 416:
+            # el parcial no corresponde a la foto actual: se empieza de nuevo
+            os.remove(part)
+            return download_photo(photos_id, extension, entry, photos_dir)
+        response.raise_for_status()
+
+        resumed = response.status_code == 206 and response.headers.get(
+            "Content-Range", ""
+        ).startswith(f"bytes {offset}-")
+        nbytes = 0
+        with open(part, "ab" if resumed else "wb") as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                nbytes += len(chunk)
+        record_request(url, time.monotonic() - start, response.status_code, nbytes)
+        etag = response.headers.get("ETag")
+
+    new_entry = {"sha256": _sha256(part), "extension": extension, "etag": etag}
+    target = object_path(new_entry, photos_dir)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(part, target)
+    return new_entry
+
+
+def _link(source, target):
+    """
+    path de la galería como enlace duro al objeto (copia si no se puede)
+    """
+    if os.path.exists(target):
+        if os.path.samefile(source, target):
+            return
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _thumbnail(source, target, size):
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image.thumbnail((size, size))
+        tmp = f"{target}.tmp"
+        image.convert("RGB").save(tmp, "JPEG", quality=80)
+    os.replace(tmp, target)
+
+
+def make_thumbnails(
+    entries, photos_dir=PHOTOS_DIR, size=THUMBNAIL_SIZE, processes=None
+):
+    """
+    Miniaturas (una por contenido) de las entradas que aún no la tienen
+    """
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("Pillow no está instalado: no se generan miniaturas")
+        return 0
+
+    thumbs_dir = os.path.join(photos_dir, "thumbs")
+    os.makedirs(thumbs_dir, exist_ok=True)
+    jobs = {}
+    for entry in entries:
+        target = os.path.join(thumbs_dir, f"{entry['sha256']}.jpg")
+        if not os.path.exists(target):
+            jobs[target] = object_path(entry, photos_dir)
+
+    # sin fork: las descargas dejan hilos en marcha en el proceso principal
+    context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        futures = [
+            pool.submit(_thumbnail, source, target, size)
+            for target, source in jobs.items()
+        ]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error creando miniatura: {e}")
+    return len(jobs)
+
+
+def sync_photos(
+    refs, photos_dir=PHOTOS_DIR, workers=WORKERS, revalidate=False, thumbnails=False
+) -> dict:
+    """
+    Descarga las fotos de refs (referencias de split_photos) que faltan y
+    crea los enlaces de la galería
+    """
+    os.makedirs(photos_dir, exist_ok=True)
+    index = load_index(photos_dir)
+    refs = refs.dropna(subset=["photos_id", "extension"])
+    photos = {
+        str(int(row.photos_id)): (int(row.id), str(row.extension))
+        for row in refs.itertuples(index=False)
+    }
+
+    def present(photos_id):
+        entry = index.get(photos_id)
+        return entry is not None and os.path.exists(object_path(entry, photos_dir))
+
+    todo = [photos_id for photos_id in photos if revalidate or not present(photos_id)]
+    print(f"Fotos: {len(photos)}, a descargar o comprobar: {len(todo)}")
+
+    lock = threading.Lock()
+    done = {"downloaded": 0, "unchanged": 0, "errors": 0}
+
+    def fetch(photos_id):
+        _, extension = photos[photos_id]
+        entry = index.get(photos_id) if present(photos_id) else None
+        try:
+            new_entry = download_photo(photos_id, extension, entry, photos_dir)
+        except Exception as e:
+            print(f"Error descargando la foto {photos_id}: {e}")
+            with lock:
+                done["errors"] += 1
+            return
+        with lock:
+            done["unchanged" if new_entry is entry else "downloaded"] += 1
+            index[photos_id] = new_entry
+            if (done["downloaded"] + done["unchanged"]) % SAVE_EVERY == 0:
+                save_index(index, photos_dir)
+
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(fetch, todo))
+    finally:
+        save_index(index, photos_dir)
+
+    for photos_id, (obs_id, extension) in photos.items():
+        if present(photos_id):
+            _link(
+                object_path(index[photos_id], photos_dir),
+                os.path.join(photos_dir, f"{obs_id}_{photos_id}.{extension}"),
+            )
+
+    if thumbnails:
+        entries = [index[photos_id] for photos_id in photos if present(photos_id)]
+        done["thumbnails"] = make_thumbnails(entries, photos_dir)
+    print(f"Fotos sincronizadas: {done}")
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="{id}_photos.csv")
+    parser.add_argument("--dir", default=PHOTOS_DIR)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--revalidate", action="store_true")
+    parser.add_argument("--thumbnails", action="store_true")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        refs, _ = split_photos(read_photos(path))
+        sync_photos(refs, args.dir, args.workers, args.revalidate, args.thumbnails)
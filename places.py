@@ -0,0 +1,147 @@
+"""
+Asignación de observaciones a lugares (municipios) a partir de sus
+coordenadas, sin consultas place_id a la API.
+
+Los límites de cada place_id se piden una sola vez a /places y se guardan en
+data/places/{place_id}.json (GeoJSON). La asignación es vectorizada: un
+índice de cajas (bbox) descarta los lugares que no pueden contener cada
+punto y la regla par-impar se aplica con numpy a todas las aristas a la vez.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from minka_api import API_PATH, get_json
+from output_writer import write_bytes
+
+PLACES_DIR = "data/places"
+
+# Aristas que se comparan a la vez con todos los puntos candidatos
+EDGE_CHUNK = 256
+
+
+def _as_tuple(place_ids):
+    return place_ids if isinstance(place_ids, tuple) else (place_ids,)
+
+
+def place_geometries(place_ids, headers=None) -> dict:
+    """
+    {place_id: geometría GeoJSON}; solo se consultan los que no están en
+    PLACES_DIR, todos en una petición
+    """
+    geometries = {}
+    missing = []
+    for place_id in place_ids:
+        path = os.path.join(PLACES_DIR, f"{place_id}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                geometries[place_id] = json.load(f)
+        else:
+            missing.append(place_id)
+
+    if missing:
+        print(f"Descargando límites de {len(missing)} lugares")
+        ids = ",".join(map(str, missing))
+        results = get_json(f"{API_PATH}/places/{ids}", headers=headers)["results"]
+        os.makedirs(PLACES_DIR, exist_ok=True)
+        for place in results:
+            geometry = place.get("geometry_geojson")
+            if not geometry:
+                continue
+            geometries[place["id"]] = geometry
+            data = json.dumps(geometry, separators=(",", ":")).encode()
+            write_bytes(data, os.path.join(PLACES_DIR, f"{place['id']}.json"))
+        for place_id in missing:
+            if place_id not in geometries:
+                print(f"Lugar {place_id} sin límites")
+    return geometries
+
+
+def _polygons(geometry):
+    """
+    Lista de polígonos (cada uno, lista de anillos como arrays lon/lat)
+    """
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return []
+    return [[np.asarray(ring, dtype=float) for ring in rings] for rings in polygons]
+
+
+def _in_ring(ring, x, y):
+    """
+    Regla par-impar: qué puntos (x, y) quedan dentro del anillo
+    """
+    inside = np.zeros(len(x), dtype=bool)
+    x1, y1 = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for start in range(0, len(x1), EDGE_CHUNK):
+            end = start + EDGE_CHUNK
+            ex1, ey1 = x1[start:end, None], y1[start:end, None]
+            ex2, ey2 = x2[start:end, None], y2[start:end, None]
+            crosses = ((ey1 > y) != (ey2 > y)) & (
+                x < (ex2 - ex1) * (y - ey1) / (ey2 - ey1) + ex1
+            )
+            inside ^= np.logical_xor.reduce(crosses, axis=0)
+    return inside
+
+
+def contains(geometry, x, y):
+    """
+    Qué puntos están dentro de la geometría (los huecos quedan fuera)
+    """
+    inside = np.zeros(len(x), dtype=bool)
+    for rings in _polygons(geometry):
+        polygon = np.zeros(len(x), dtype=bool)
+        for ring in rings:
+            polygon ^= _in_ring(ring, x, y)
+        inside |= polygon
+    return inside
+
+
+def _bbox(geometry):
+    points = np.concatenate([ring for rings in _polygons(geometry) for ring in rings])
+    return (
+        points[:, 0].min(),
+        points[:, 1].min(),
+        points[:, 0].max(),
+        points[:, 1].max(),
+    )
+
+
+def assign_places(longitude, latitude, places: dict, headers=None) -> pd.Series:
+    """
+    Nombre del lugar de cada punto según places ({place_id o tupla de ids:
+    nombre}); None si no cae en ninguno. Si un punto está en varios gana el
+    primero de places.
+    """
+    x = pd.to_numeric(pd.Series(longitude), errors="coerce").to_numpy(dtype=float)
+    y = pd.to_numeric(pd.Series(latitude), errors="coerce").to_numpy(dtype=float)
+    index = pd.Series(longitude).index
+    names = np.full(len(x), None, dtype=object)
+    pending = ~(np.isnan(x) | np.isnan(y))
+
+    place_ids = [place_id for ids in places for place_id in _as_tuple(ids)]
+    geometries = place_geometries(place_ids, headers)
+
+    for ids, name in places.items():
+        for place_id in _as_tuple(ids):
+            geometry = geometries.get(place_id)
+            if geometry is None or not pending.any():
+                continue
+            min_x, min_y, max_x, max_y = _bbox(geometry)
+            candidates = np.flatnonzero(
+                pending & (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+            )
+            if len(candidates) == 0:
+                continue
+            inside = candidates[contains(geometry, x[candidates], y[candidates])]
+            names[inside] = name
+            pending[inside] = False
+    return pd.Series(names, index=index, dtype=object)
@@ -0,0 +1,109 @@
+"""
+Reconciliación de las observaciones guardadas con las de la API sin volver a
+descargarlas.
+
+Se recorre /observations con only_id=true (solo el id, páginas grandes) y
+se guarda como un array ordenado de ids. Con np.setdiff1d contra los ids
+del CSV salen las bajas (observaciones borradas o que ya no cumplen los
+filtros, p.ej. las que han pasado a casual) y las altas. Las bajas se quitan
+de {id}_obs.csv y {id}_photos.csv; las altas quedan para la descarga. Si la
+lista tiene menos ids que total_results no se quita nada.
+
+    python reconcile.py data/biomarato25/417_obs.csv project_id=417 quality_grade=research
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from minka_api import API_PATH, get_total_results, iter_observation_pages
+from photo_store import write_photos
+from schema import read_obs, read_photos
+from sidecar import write_dataset
+
+ONLY_ID_PER_PAGE = 1000
+
+
+def remote_ids(params, headers=None, per_page=ONLY_ID_PER_PAGE) -> np.ndarray:
+    """
+    Ids ordenados de las observaciones que cumplen params
+    """
+    pages = iter_observation_pages({**params, "only_id": "true"}, headers, per_page)
+    ids = [np.array([r["id"] for r in results], dtype="int64") for results in pages]
+    if not ids:
+        return np.empty(0, dtype="int64")
+    return np.unique(np.concatenate(ids))
+
+
+def local_ids(path_obs) -> np.ndarray:
+    """
+    Ids ordenados de un {id}_obs.csv (solo se lee la columna id)
+    """
+    if not os.path.exists(path_obs):
+        return np.empty(0, dtype="int64")
+    ids = pd.read_csv(path_obs, usecols=["id"], dtype={"id": "int64"})["id"]
+    return np.unique(ids.to_numpy())
+
+
+def diff_ids(local: np.ndarray, remote: np.ndarray):
+    """
+    (bajas, altas): ids solo guardados y ids solo en la API
+    """
+    missing = np.setdiff1d(local, remote, assume_unique=True)
+    new = np.setdiff1d(remote, local, assume_unique=True)
+    return missing, new
+
+
+def drop_ids(path_obs, path_photos, ids):
+    """
+    Quita las observaciones ids y sus fotos de los CSV
+    """
+    df_obs = read_obs(path_obs)
+    write_dataset(df_obs[~df_obs["id"].isin(ids)], path_obs)
+    if os.path.exists(path_photos):
+        df_photos = read_photos(path_photos)
+        write_photos(df_photos[~df_photos["id"].isin(ids)], path_photos)
+
+
+def reconcile_dataset(path_obs, path_photos, params, headers=None):
+    """
+    Quita de los CSV las observaciones que ya no están en la API para params
+    y devuelve (bajas, altas); altas es None si la lista de ids está
+    incompleta
+    """
+    url = f"{API_PATH}/observations"
+    total = get_total_results(url, {**params, "per_page": 1}, headers)
+    remote = remote_ids(params, headers)
+    if len(remote) < total:
+        # lista cortada: las que faltan no son bajas; se descarga todo
+        print(
+            f"Lista de ids incompleta ({len(remote)} de {total}): "
+            f"no se quita nada de {path_obs}"
+        )
+        return np.empty(0, dtype="int64"), None
+    missing, new = diff_ids(local_ids(path_obs), remote)
+    if len(missing):
+        print(f"Quitando {len(missing)} observaciones que ya no están: {path_obs}")
+        drop_ids(path_obs, path_photos, missing)
+    print(f"Reconciliación de {path_obs}: {len(missing)} bajas, {len(new)} altas")
+    return missing, new
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="{id}_obs.csv")
+    parser.add_argument("params", nargs="+", help="filtros de la API, clave=valor")
+    parser.add_argument("--drop", action="store_true", help="quita las bajas")
+    args = parser.parse_args()
+
+    params = dict(param.split("=", 1) for param in args.params)
+    if args.drop:
+        reconcile_dataset(
+            args.path, args.path.replace("_obs.csv", "_photos.csv"), params
+        )
+    else:
+        missing, new = diff_ids(local_ids(args.path), remote_ids(params))
+        print(f"Bajas: {len(missing)}, altas: {len(new)}")
+        print("\n".join(map(str, missing)))
@@ -0,0 +1,136 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Versión del formato de los CSV (columnas y tipos); se guarda en los
+# metadatos de cada dataset (sidecar.py) y al cambiarla se recalculan
+SCHEMA_VERSION = 1
+
+# Tipos de las columnas que produce mecoda_minka.get_dfs
+#
+# Las columnas de texto con muchos valores repetidos (taxonomía, usuarios,
+# licencias, lugares, fechas) se guardan como category. Las coordenadas se
+# mantienen en float64: con float32 se perderían decimales al reescribir los CSV.
+OBS_DTYPES = {
+    "id": "int32",
+    "created_at": "category",
+    "updated_at": "category",
+    "observed_on": "category",
+    "observed_on_time": "category",
+    "iconic_taxon": "category",
+    "taxon_id": "Int32",
+    "taxon_rank": "category",
+    "taxon_name": "category",
+    "latitude": "float64",
+    "longitude": "float64",
+    "obscured": "boolean",
+    "place_name": "category",
+    "quality_grade": "category",
+    "user_id": "Int32",
+    "user_login": "category",
+    "license_obs": "category",
+    "identifications_count": "Int32",
+    "identifiers": "category",
+    "num_identification_agreements": "Int32",
+    "num_identification_disagreements": "Int32",
+    "device": "category",
+    "kingdom": "category",
+    "phylum": "category",
+    "class": "category",
+    "order": "category",
+    "family": "category",
+    "genus": "category",
+}
+
+PHOTOS_DTYPES = {
+    "id": "int32",
+    "photos_id": "Int32",
+    "iconic_taxon": "category",
+    "taxon_name": "category",
+    "photos_medium_url": "object",
+    "user_login": "category",
+    "latitude": "float64",
+    "longitude": "float64",
+    "license_photo": "category",
+    "attribution": "category",
+    "path": "object",
+}
+
+# Referencias de fotos (forma normalizada de photo_store.py, bajo demanda):
+# los campos de la observación se recuperan con un join y la atribución con
+# attribution_key
+PHOTO_REFS_DTYPES = {
+    "id": "int32",
+    "photos_id": "Int32",
+    "license_photo": "category",
+    "attribution_key": "category",
+    "extension": "category",
+}
+
+_NUMERIC = ("int32", "Int32", "float64")
+
+
+def apply_schema(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """
+    Convierte las columnas conocidas de df a los tipos compactos de dtypes
+    """
+    df = df.copy()
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype in _NUMERIC:
+            # get_dfs devuelve taxon_id y photos_id como texto ("" o "nan" si falta)
+            values = pd.to_numeric(df[col], errors="coerce")
+            if dtype == "int32" and values.isna().any():
+                dtype = "Int32"
+            df[col] = values.astype(dtype)
+        elif dtype == "boolean":
+            df[col] = (
+                df[col]
+                .map({True: True, False: False, "True": True, "False": False})
+                .astype("boolean")
+            )
+        elif dtype == "category":
+            values = df[col]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                # Las fechas de get_dfs son objetos date; se guardan como texto
+                values = values.where(values.isna(), values.astype(str))
+            df[col] = values.astype("category")
+    return df
+
+
+def apply_obs_schema(df_obs: pd.DataFrame) -> pd.DataFrame:
+    return apply_schema(df_obs, OBS_DTYPES)
+
+
+def apply_photos_schema(df_photos: pd.DataFrame) -> pd.DataFrame:
+    return apply_schema(df_photos, PHOTOS_DTYPES)
+
+
+def read_csv(path, dtypes, chunksize=20000):
+    # Se lee por bloques para que el parser no mantenga todo el texto en
+    # memoria; las categorías de cada bloque se unifican antes de concatenar
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {col: dtype for col, dtype in dtypes.items() if col in header}
+    chunks = list(pd.read_csv(path, dtype=dtypes, chunksize=chunksize))
+    if not chunks:
+        return pd.read_csv(path, dtype=dtypes)
+    for col, dtype in dtypes.items():
+        if dtype == "category" and len(chunks) > 1:
+            categories = union_categoricals([chunk[col] for chunk in chunks]).categories
+            for chunk in chunks:
+                chunk[col] = chunk[col].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_obs(path) -> pd.DataFrame:
+    """
+    Lee un {id}_obs.csv con los tipos compactos de OBS_DTYPES
+    """
+    return read_csv(path, OBS_DTYPES)
+
+
+def read_photos(path) -> pd.DataFrame:
+    """
+    Lee un {id}_photos.csv con los tipos compactos de PHOTOS_DTYPES
+    """
+    return read_csv(path, PHOTOS_DTYPES)
@@ -0,0 +1,120 @@
+"""
+Metadatos de cada dataset ({id}_obs.csv, {id}_photos.csv) en
+{path}.meta.json: filas, id mínimo y máximo, updated_at máximo, versión del
+esquema y sha256, tamaño y fecha de modificación del CSV.
+
+Las decisiones baratas (si ha cambiado el número de observaciones, desde qué
+id seguir descargando) leen estos metadatos en lugar del CSV entero. Si
+faltan, son de otra versión del esquema o el tamaño o la fecha de
+modificación del CSV no coinciden (p.ej. se ha editado a mano o viene de un
+checkout), se recalculan leyendo el CSV una vez.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from output_writer import file_info, write_bytes, write_csv
+from schema import SCHEMA_VERSION, read_obs
+
+SUFFIX = ".meta.json"
+
+
+def sidecar_path(path):
+    return f"{path}{SUFFIX}"
+
+
+def summarise(df: pd.DataFrame) -> dict:
+    """
+    Filas, ids y updated_at máximo de un DataFrame (o de una página)
+    """
+    stats = {"rows": len(df), "min_id": None, "max_id": None, "max_updated_at": None}
+    if "id" in df.columns and df["id"].notna().any():
+        stats["min_id"] = int(df["id"].min())
+        stats["max_id"] = int(df["id"].max())
+    if "updated_at" in df.columns:
+        updated = df["updated_at"].dropna().astype(str)
+        if len(updated):
+            stats["max_updated_at"] = updated.max()
+    return stats
+
+
+def merge(a: dict, b: dict) -> dict:
+    """
+    Estadísticas de la unión de dos tablas (p.ej. páginas o tramos)
+    """
+    stats = {"rows": a["rows"] + b["rows"]}
+    for field, pick in [("min_id", min), ("max_id", max), ("max_updated_at", max)]:
+        values = [v for v in (a[field], b[field]) if v is not None]
+        stats[field] = pick(values) if values else None
+    return stats
+
+
+def _sha256(path):
+    info = file_info(path)
+    if info is not None:
+        return info["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_sidecar(path, stats: dict):
+    """
+    Escribe los metadatos de path (ya escrito) con las estadísticas stats
+    """
+    meta = {
+        **stats,
+        "schema_version": SCHEMA_VERSION,
+        "bytes": os.path.getsize(path),
+        "mtime_ns": os.stat(path).st_mtime_ns,
+        "sha256": _sha256(path),
+    }
+    data = json.dumps(meta, indent=2, sort_keys=True).encode() + b"\n"
+    write_bytes(data, sidecar_path(path))
+    return meta
+
+
+def read_sidecar(path):
+    """
+    Metadatos de path o None si no hay o no corresponden al CSV actual
+    """
+    meta_path = sidecar_path(path)
+    if not os.path.exists(path) or not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except ValueError:
+        return None
+    if meta.get("schema_version") != SCHEMA_VERSION:
+        return None
+    stat = os.stat(path)
+    if meta.get("bytes") != stat.st_size or meta.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+    return meta
+
+
+def dataset_info(path, reader=read_obs):
+    """
+    Metadatos de path; si no están al día se leen del CSV y se guardan.
+    None si el dataset no existe.
+    """
+    meta = read_sidecar(path)
+    if meta is not None or not os.path.exists(path):
+        return meta
+    print(f"Calculando metadatos de {path}")
+    return write_sidecar(path, summarise(reader(path)))
+
+
+def write_dataset(df: pd.DataFrame, path, sort_by=None, ascending=True) -> bool:
+    """
+    write_csv y sus metadatos
+    """
+    changed = write_csv(df, path, sort_by, ascending)
+    write_sidecar(path, summarise(df))
+    return changed
@@ -0,0 +1,166 @@
+"""
+Agregación de las observaciones guardadas ({id}_obs.csv) en una rejilla de
+celdas de tamaño fijo (grados) para los mapas de Datawrapper.
+
+Por celda, y por día y celda: observaciones, especies y participantes
+distintos. Las especies son taxones hoja (leaf_taxa.py), como species_counts
+filtrando por la celda. Se guarda la celda de cada observación por id, así
+que update() con observaciones cambiadas las sustituye en vez de sumarlas.
+
+Las observaciones con coordenadas ocultas (obscured) no se colocan en la
+rejilla: su posición pública es aleatoria dentro de un área mayor que una
+celda. Se cuentan aparte en obscured.
+
+    python spatial_grid.py data/biodiverciutat25/233_obs.csv --geojson grid.json
+"""
+
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+from leaf_taxa import leaf_counts
+from schema import read_obs
+
+# ~1 km en latitud
+CELL_SIZE = 0.01
+
+KEYS = ["date", "row", "col"]
+
+
+class SpatialGrid:
+    def __init__(self, df_obs=None, size=CELL_SIZE):
+        self.size = size
+        # celda, taxón y usuario de cada observación con coordenadas, por id
+        self.cells = pd.DataFrame(
+            {
+                "date": pd.Series(dtype=object),
+                "row": pd.Series(dtype="int64"),
+                "col": pd.Series(dtype="int64"),
+                "taxon_id": pd.Series(dtype="Int64"),
+                "user_id": pd.Series(dtype="Int64"),
+                "obscured": pd.Series(dtype=bool),
+            },
+            index=pd.Index([], dtype="int64", name="id"),
+        )
+        if df_obs is not None:
+            self.update(df_obs)
+
+    @classmethod
+    def from_csv(cls, path, size=CELL_SIZE):
+        return cls(read_obs(path), size)
+
+    @property
+    def obscured(self) -> int:
+        return int(self.cells["obscured"].sum())
+
+    def _cells(self, df_obs):
+        df = df_obs[df_obs["latitude"].notna() & df_obs["longitude"].notna()]
+        cells = pd.DataFrame(
+            {
+                "date": df["created_at"].astype(str).to_numpy(),
+                "row": np.floor(df["latitude"].astype(float) / self.size)
+                .astype("int64")
+                .to_numpy(),
+                "col": np.floor(df["longitude"].astype(float) / self.size)
+                .astype("int64")
+                .to_numpy(),
+                "taxon_id": df["taxon_id"].astype("Int64").to_numpy(),
+                "user_id": df["user_id"].astype("Int64").to_numpy(),
+                "obscured": df["obscured"].fillna(False).astype(bool).to_numpy(),
+            },
+            index=pd.Index(df["id"].to_numpy(dtype="int64"), name="id"),
+        )
+        return cells[~cells.index.duplicated(keep="last")]
+
+    def update(self, df_obs: pd.DataFrame, removed=()):
+        """
+        Añade o sustituye (por id) las observaciones de df_obs y quita las de
+        ids removed
+        """
+        ids = np.union1d(
+            df_obs["id"].to_numpy(dtype="int64"), np.asarray(removed, dtype="int64")
+        )
+        cells = self._cells(df_obs)
+        kept = self.cells[~self.cells.index.isin(ids)]
+        self.cells = pd.concat([kept, cells]) if len(kept) else cells
+        return self
+
+    def _table(self, keys):
+        cells = self.cells[~self.cells["obscured"]]
+        grouped = cells.groupby(keys)
+        table = grouped.size().rename("observations").to_frame()
+        # groupby numera los grupos en el mismo orden que table
+        species = leaf_counts(grouped.ngroup().to_numpy(), cells["taxon_id"])
+        table["species"] = species.reindex(range(len(table)), fill_value=0).to_numpy()
+        table["participants"] = grouped["user_id"].nunique()
+        table = table.reset_index()
+        # centro de la celda
+        table.insert(len(keys), "latitude", ((table["row"] + 0.5) * self.size).round(6))
+        table.insert(
+            len(keys) + 1, "longitude", ((table["col"] + 0.5) * self.size).round(6)
+        )
+        return table.drop(columns=["row", "col"])
+
+    def cells_table(self) -> pd.DataFrame:
+        """
+        Totales de la campaña por celda
+        """
+        table = self._table(["row", "col"])
+        return table.sort_values(["latitude", "longitude"], ignore_index=True)
+
+    def daily_table(self) -> pd.DataFrame:
+        """
+        Por día y celda, solo las celdas con observaciones ese día
+        """
+        table = self._table(KEYS)
+        return table.sort_values(["date", "latitude", "longitude"], ignore_index=True)
+
+    def to_geojson(self) -> dict:
+        """
+        Celdas como polígonos con los totales de la campaña
+        """
+        half = self.size / 2
+        features = []
+        for cell in self.cells_table().itertuples(index=False):
+            lat, lon = cell.latitude, cell.longitude
+            ring = [
+                [lon - half, lat - half],
+                [lon + half, lat - half],
+                [lon + half, lat + half],
+                [lon - half, lat + half],
+                [lon - half, lat - half],
+            ]
+            features.append(
+                {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [[[round(v, 6) for v in p] for p in ring]],
+                    },
+                    "properties": {
+                        "observations": int(cell.observations),
+                        "species": int(cell.species),
+                        "participants": int(cell.participants),
+                    },
+                }
+            )
+        return {"type": "FeatureCollection", "features": features}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="{id}_obs.csv de uno o más proyectos")
+    parser.add_argument("--size", type=float, default=CELL_SIZE)
+    parser.add_argument("--geojson", help="escribe las celdas como GeoJSON")
+    args = parser.parse_args()
+
+    grid = SpatialGrid(size=args.size)
+    for path in args.paths:
+        grid.update(read_obs(path))
+    print(grid.cells_table().to_string(index=False))
+    print(f"Observaciones con coordenadas ocultas: {grid.obscured}")
+    if args.geojson:
+        with open(args.geojson, "w") as f:
+            json.dump(grid.to_geojson(), f, separators=(",", ":"))
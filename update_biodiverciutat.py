@@ -2,10 +2,20 @@ import datetime
 import math
 
 import pandas as pd
-import requests
-from mecoda_minka import get_dfs, get_obs
 
-API_PATH = "https://api.minka-sdg.org/v1"
+from checkpoints import finish_run, start_run
+from distinct_counts import sync_distinct_counts
+from http_cache import prune
+from identifications import check_identifications
+from instrumentation import stage, write_report
+from leaderboard import sync_leaderboard
+from leaf_taxa import leaf_counts
+from minka_api import API_PATH, SESSION, get_json, get_total_results, map_concurrent
+from obs_stream import stream_obs
+from output_writer import write_csv, write_manifest
+from places import assign_places
+from schema import read_obs
+from spatial_grid import SpatialGrid
 
 main_project_bdc = 233  # Area metropolitana de Barcelona, proyecto paraguas
 
@@ -84,154 +94,80 @@ places_bdc = {
     304: "Santa Coloma de Gramenet",
 }
 
-session = requests.Session()
-observations = f"{API_PATH}/observations?"
-species = f"{API_PATH}/observations/species_counts?"
-observers = f"{API_PATH}/observations/observers?"
+observations = f"{API_PATH}/observations"
+species = f"{API_PATH}/observations/species_counts"
+observers = f"{API_PATH}/observations/observers"
 
 
-def update_main_metrics(proj_id, session=session):
-    results = []
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-
+def update_main_metrics(proj_id):
     # Rango de días de BioDiverCiutat 2025
     day = datetime.date(year=2025, month=4, day=25)
     rango_temporal = (datetime.date(year=2025, month=4, day=29) - day).days
 
     if rango_temporal > 0:
-        for i in range(rango_temporal):
-            print(i)
-            st_day = day.strftime("%Y-%m-%d")
+        days = [
+            (day + datetime.timedelta(days=i)).strftime("%Y-%m-%d")
+            for i in range(rango_temporal)
+        ]
 
+        def fetch_day(st_day):
             params = {
                 "project_id": proj_id,
                 "created_d2": st_day,
                 "order": "desc",
                 "order_by": "created_at",
             }
-
-            # Utilizar la sesión para realizar las solicitudes
-            total_species = session.get(species, params=params).json()["total_results"]
-            total_participants = session.get(observers, params=params).json()[
-                "total_results"
-            ]
-            total_obs = session.get(observations, params=params).json()["total_results"]
-
-            result = {
+            return {
                 "date": st_day,
-                "observations": total_obs,
-                "species": total_species,
-                "participants": total_participants,
+                "observations": get_total_results(observations, params),
+                "species": get_total_results(species, params),
+                "participants": get_total_results(observers, params),
             }
 
-            results.append(result)
-
-            day = day + datetime.timedelta(days=1)
+        results = map_concurrent(fetch_day, days)
 
         result_df = pd.DataFrame(results)
         print("Updated main metrics")
         return result_df
 
 
-def get_metrics_proj(places_bdc, main_project_bdc, session=session):
-
-    results = []
-
-    for place_ids, place_name in places_bdc.items():
-        total_species = 0
-        total_participants = 0
-        total_obs = 0
-
-        if not isinstance(place_ids, tuple):
-            place_ids = (place_ids,)
-
-        for place_id in place_ids:
-            params = {
-                "project_id": main_project_bdc,
-                "place_id": place_id,
-                "order": "desc",
-                "order_by": "created_at",
-            }
-            total_species += (
-                session.get(species, params=params).json().get("total_results", 0)
-            )
-            total_participants += (
-                session.get(observers, params=params).json().get("total_results", 0)
-            )
-            total_obs += (
-                session.get(observations, params=params).json().get("total_results", 0)
-            )
-
-        results.append(
-            {
-                "city": place_name,
-                "observations": total_obs,
-                "species": total_species,
-                "participants": total_participants,
-            }
-        )
-
-    # Imprime o usa los resultados
-    df_results = pd.DataFrame(results)
-    return df_results
+def get_metrics_proj(places_bdc, df_obs):
+    """
+    Observaciones, especies y participantes de cada municipio; las
+    observaciones se asignan por sus coordenadas, sin consultas place_id.
+    Las especies son taxones hoja, como en species_counts de main_metrics
+    """
+    cities = assign_places(df_obs["longitude"], df_obs["latitude"], places_bdc)
+    grouped = df_obs.groupby(cities)
+    df_results = pd.DataFrame(
+        {
+            "observations": grouped.size(),
+            "species": leaf_counts(cities, df_obs["taxon_id"]),
+            "participants": grouped["user_id"].nunique(),
+        }
+    )
+    df_results["species"] = df_results["species"].fillna(0).astype("int64")
+    df_results = df_results.reindex(list(places_bdc.values()), fill_value=0)
+    return df_results.rename_axis("city").reset_index()
 
 
 def get_missing_taxon(taxon_id, rank):
-    url = f"https://api.minka-sdg.org/v1/taxa/{taxon_id}"
-    ancestors = requests.get(url).json()["results"][0]["ancestors"]
+    url = f"{API_PATH}/taxa/{taxon_id}"
+    ancestors = get_json(url)["results"][0]["ancestors"]
     for anc in ancestors:
         if anc["rank"] == rank:
             return anc["name"]
 
 
-def _get_species(user_name, proj_id, session=session):
-    species = f"{API_PATH}/observations/species_counts"
-    params = {"project_id": proj_id, "user_login": user_name}
-    return session.get(species, params=params).json()["total_results"]
-
-
-def _get_identifiers(proj_id: int, session=session) -> pd.DataFrame:
-    url = f"https://api.minka-sdg.org/v1/observations/identifiers?project_id={proj_id}"
-    results = session.get(url).json()["results"]
-    identifiers = []
-    for result in results:
-        identifier = {}
-        identifier["user_id"] = result["user_id"]
-        identifier["user_login"] = result["user"]["login"]
-        identifier["number"] = result["count"]
-        identifiers.append(identifier)
-    return pd.DataFrame(identifiers)
-
-
-def get_number_identifications(user_name, df_identifiers):
-    try:
-        number_id = df_identifiers.loc[
-            df_identifiers.user_login == user_name, "number"
-        ].item()
-    except:
-        number_id = 0
-    return number_id
-
-
 def get_participation_df(main_project):
-    df_obs = pd.read_csv(f"data/biodiverciutat25/{main_project}_obs.csv")
-    pt_users = (
-        df_obs["user_login"]
-        .value_counts()
-        .to_frame()
-        .reset_index(drop=False)
-        .rename(columns={"user_login": "participant", "count": "observacions"})
-    )
-    df_identifiers = _get_identifiers(main_project)
-
-    pt_users["identificacions"] = pt_users["participant"].apply(
-        lambda x: get_number_identifications(x, df_identifiers)
-    )
-    pt_users["espècies"] = pt_users["participant"].apply(
-        lambda x: _get_species(x, main_project)
-    )
+    df_obs = read_obs(f"data/biodiverciutat25/{main_project}_obs.csv")
+    # observaciones, especies e identificaciones por usuario, actualizadas solo
+    # con las observaciones nuevas o cambiadas desde la ejecución anterior
+    leaderboard = sync_leaderboard(f"biodiverciutat25_{main_project}", df_obs)
+    check_identifications(leaderboard.identifications_table(), main_project)
+    pt_users = leaderboard.top()[
+        ["participant", "observacions", "identificacions", "espècies"]
+    ]
     # convertimos nombres de columnas a mayúsculas
     pt_users.columns = pt_users.columns.str.upper()
     return pt_users
@@ -259,28 +195,21 @@ def get_marine_count(df_obs) -> pd.DataFrame:
     return df_marines
 
 
-def get_main_metrics(proj_id, session=session):
-    species = f"{API_PATH}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}"
-    total_species = session.get(url1).json()["total_results"]
-
-    observers = f"{API_PATH}/observations/observers?"
-    url2 = f"{observers}&project_id={proj_id}"
-    total_participants = session.get(url2).json()["total_results"]
-
-    observations = f"{API_PATH}/observations?"
-    url3 = f"{observations}&project_id={proj_id}"
-    total_obs = session.get(url3).json()["total_results"]
+def get_main_metrics(proj_id):
+    params = {"project_id": proj_id}
+    total_species, total_participants, total_obs = map_concurrent(
+        lambda url: get_total_results(url, params), [species, observers, observations]
+    )
 
     return total_species, total_participants, total_obs
 
 
-def get_marine(taxon_name: str, session=session) -> bool:
+def get_marine(taxon_name: str) -> bool:
     """
     Devuelve True/False en base a un taxon_name
     """
     name_clean = taxon_name.replace(" ", "+")
-    status = session.get(
+    status = SESSION.get(
         f"https://www.marinespecies.org/rest/AphiaIDByName/{name_clean}?marine_only=true"
     ).status_code
     if (status == 200) or (status == 206):
@@ -290,21 +219,17 @@ def get_marine(taxon_name: str, session=session) -> bool:
     return result
 
 
-def get_species_df(proj_id, session=session):
+def _get_species_list(proj_id):
     total_sp = []
 
-    species = f"{API_PATH}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}"
-
-    total_num = session.get(url1).json()["total_results"]
+    total_num = get_total_results(species, {"project_id": proj_id})
 
     pages = math.ceil(total_num / 500)
 
-    for i in range(pages):
-        especie = {}
-        page = i + 1
-        url = f"{species}&project_id={proj_id}&page={page}"
-        results = session.get(url).json()["results"]
+    def get_page(page):
+        return get_json(species, {"project_id": proj_id, "page": page})["results"]
+
+    for results in map_concurrent(get_page, range(1, pages + 1)):
         for result in results:
             especie = {}
             especie["taxon_id"] = result["taxon"]["id"]
@@ -313,7 +238,11 @@ def get_species_df(proj_id, session=session):
             especie["ancestry"] = result["taxon"]["ancestry"]
             total_sp.append(especie)
 
-    df_species = pd.DataFrame(total_sp)
+    return pd.DataFrame(total_sp)
+
+
+def get_species_df(proj_id):
+    df_species = _get_species_list(proj_id)
 
     # Añadimos columna de marine
     taxon_url = "https://raw.githubusercontent.com/eosc-cos4cloud/mecoda-minka/refs/heads/master/src/mecoda_minka/data/taxon_tree.csv"
@@ -328,30 +257,8 @@ def get_species_df(proj_id, session=session):
     return df_species
 
 
-def get_marine_species(proj_id, session=session):
-    total_sp = []
-
-    species = f"{API_PATH}/observations/species_counts?"
-    url1 = f"{species}&project_id={proj_id}"
-
-    total_num = session.get(url1).json()["total_results"]
-
-    pages = math.ceil(total_num / 500)
-
-    for i in range(pages):
-        especie = {}
-        page = i + 1
-        url = f"{species}&project_id={proj_id}&page={page}"
-        results = session.get(url).json()["results"]
-        for result in results:
-            especie = {}
-            especie["taxon_id"] = result["taxon"]["id"]
-            especie["taxon_name"] = result["taxon"]["name"]
-            especie["rank"] = result["taxon"]["rank"]
-            especie["ancestry"] = result["taxon"]["ancestry"]
-            total_sp.append(especie)
-
-    df_species = pd.DataFrame(total_sp)
+def get_marine_species(proj_id):
+    df_species = _get_species_list(proj_id)
     taxon_url = "https://raw.githubusercontent.com/eosc-cos4cloud/mecoda-orange/master/mecoda_orange/data/taxon_tree_with_marines.csv"
     taxon_tree = pd.read_csv(taxon_url)
 
@@ -368,72 +275,111 @@ if __name__ == "__main__":
 
     # Datos de BioDiverCiutat
 
-    # Actualiza main metrics
-    main_metrics_df = update_main_metrics(main_project_bdc)
-    main_metrics_df.to_csv(
-        f"data/biodiverciutat25/{main_project_bdc}_main_metrics.csv", index=False
-    )
-    print("Main metrics actualizada")
-
-    # Actualiza métricas de los proyectos
-    df_projs = get_metrics_proj(places_bdc, main_project_bdc)
-    df_projs.to_csv(
-        f"data/biodiverciutat25/{main_project_bdc}_main_metrics_projects.csv",
-        index=False,
-    )
-    print("Main metrics of city projects actualizado")
+    # Si es un reintento de la misma ejecución se reanuda desde los checkpoints
+    start_run()
+    # Respuestas de la API guardadas que llevan días sin usarse
+    prune()
 
-    # Actualiza df_obs y df_photos totales
-    obs = get_obs(id_project=main_project_bdc)
+    # Actualiza main metrics
+    with stage("main_metrics"):
+        main_metrics_df = update_main_metrics(main_project_bdc)
+        write_csv(
+            main_metrics_df,
+            f"data/biodiverciutat25/{main_project_bdc}_main_metrics.csv",
+        )
+        print("Main metrics actualizada")
 
-    # solo si hay observaciones
-    if len(obs) > 0:
+    # Actualiza df_obs y df_photos totales, por páginas directamente a los CSV
+    with stage("observations"):
         print("Sacando df de observaciones totales")
-        df_obs, df_photos = get_dfs(obs)
-        df_obs.to_csv(f"data/biodiverciutat25/{main_project_bdc}_obs.csv", index=False)
-        df_photos.to_csv(
-            f"data/biodiverciutat25/{main_project_bdc}_photos.csv", index=False
+        total_obs, _ = stream_obs(
+            f"data/biodiverciutat25/{main_project_bdc}_obs.csv",
+            f"data/biodiverciutat25/{main_project_bdc}_photos.csv",
+            project_id=main_project_bdc,
         )
 
-        print("Sacando columna marine")
-        df_obs["taxon_id"] = df_obs["taxon_id"].replace("nan", None)
-        df_obs["taxon_id"] = df_obs["taxon_id"].replace("", None)
-        df_filtered = df_obs[df_obs["taxon_id"].notnull()].copy()
-        df_filtered["taxon_id"] = df_filtered["taxon_id"].astype(float).astype(int)
+    # solo si hay observaciones
+    with stage("derived_tables"):
+        if total_obs > 0:
+            df_obs = read_obs(f"data/biodiverciutat25/{main_project_bdc}_obs.csv")
+
+            # Especies y participantes distintos por día (acumulados y semanales),
+            # calculados desde las observaciones sin más peticiones a la API y
+            # aplicando solo las que han cambiado desde la ejecución anterior
+            df_distinct = sync_distinct_counts(
+                f"biodiverciutat25_{main_project_bdc}", df_obs
+            ).daily_table(window=7)
+            write_csv(
+                df_distinct,
+                f"data/biodiverciutat25/{main_project_bdc}_distinct_per_day.csv",
+            )
+
+            # Rejilla de celdas para los mapas (total y por día)
+            grid = SpatialGrid(df_obs)
+            write_csv(
+                grid.cells_table(), f"data/biodiverciutat25/{main_project_bdc}_grid.csv"
+            )
+            write_csv(
+                grid.daily_table(),
+                f"data/biodiverciutat25/{main_project_bdc}_grid_per_day.csv",
+            )
 
-        # sacamos listado de especies incluidas en el proyecto con col marina
-        df_species = get_marine_species(main_project_bdc)
+            # Métricas de los municipios desde las coordenadas de las observaciones
+            df_projs = get_metrics_proj(places_bdc, df_obs)
+            write_csv(
+                df_projs,
+                f"data/biodiverciutat25/{main_project_bdc}_main_metrics_projects.csv",
+            )
+            print("Main metrics of city projects actualizado")
 
-        df_filtered = pd.merge(
-            df_filtered,
-            df_species[["taxon_id", "marine"]],
-            on="taxon_id",
-            how="left",
-        )
+            print("Sacando columna marine")
+            df_filtered = df_obs[df_obs["taxon_id"].notnull()].copy()
 
-        # Dataframe de participantes
-        print("Dataframe de participantes")
-        df_users = get_participation_df(main_project_bdc)
-        df_users.to_csv(
-            f"data/biodiverciutat25/{main_project_bdc}_users.csv", index=False
-        )
+            # sacamos listado de especies incluidas en el proyecto con col marina
+            df_species = get_marine_species(main_project_bdc)
 
-        # Dataframe de marino/terrestre
-        print("Cuenta de marinos/terrestres")
-        df_marine = get_marine_count(df_filtered)
-        df_marine.to_csv(
-            f"data/biodiverciutat25/{main_project_bdc}_marines.csv", index=False
-        )
+            df_filtered = pd.merge(
+                df_filtered,
+                df_species[["taxon_id", "marine"]],
+                on="taxon_id",
+                how="left",
+            )
+
+            # Dataframe de participantes
+            print("Dataframe de participantes")
+            df_users = get_participation_df(main_project_bdc)
+            write_csv(
+                df_users,
+                f"data/biodiverciutat25/{main_project_bdc}_users.csv",
+                sort_by=["OBSERVACIONS", "PARTICIPANT"],
+                ascending=[False, True],
+            )
+
+            # Dataframe de marino/terrestre
+            print("Cuenta de marinos/terrestres")
+            df_marine = get_marine_count(df_filtered)
+            write_csv(
+                df_marine, f"data/biodiverciutat25/{main_project_bdc}_marines.csv"
+            )
 
     # Dataframe métricas totales
-    print("Dataframe métricas tiempo real")
-    total_species, total_participants, total_obs = get_main_metrics(main_project_bdc)
-    df = pd.DataFrame(
-        {
-            "metrics": ["observacions", "espècies", "participants"],
-            "values": [total_obs, total_species, total_participants],
-        }
-    )
-    df.to_csv(
-        f"data/biodiverciutat25/{main_project_bdc}_metrics_tiempo_real.csv", index=False
-    )
+    with stage("metrics_tiempo_real"):
+        print("Dataframe métricas tiempo real")
+        total_species, total_participants, total_obs = get_main_metrics(
+            main_project_bdc
+        )
+        df = pd.DataFrame(
+            {
+                "metrics": ["observacions", "espècies", "participants"],
+                "values": [total_obs, total_species, total_participants],
+            }
+        )
+        write_csv(
+            df, f"data/biodiverciutat25/{main_project_bdc}_metrics_tiempo_real.csv"
+        )
+
+    write_manifest()
+    write_report()
+
+    # Ejecución completa: ya no hace falta reanudar nada
+    finish_run()
@@ -6,6 +6,8 @@ import pandas as pd
 import requests
 from mecoda_minka import get_dfs, get_obs
 
+from campaign_filters import drop_excluded
+
 API_PATH = "https://api.minka-sdg.org/v1"
 
 main_project_bmt = 283
@@ -16,49 +18,6 @@ projects_bmt = {
     282: "Barcelona",
 }
 
-exclude_users = [
-    "xasalva",
-    "bertinhaco",
-    "andrea",
-    "laurabiomar",
-    "guillermoalvarez_fecdas",
-    "mediambient_ajelprat",
-    "fecdas_mediambient",
-    "planctondiving",
-    "marinagm",
-    "CEM",
-    "jaume-piera",
-    "sonialinan",
-    "adrisoacha",
-    "anellides",
-    "irodero",
-    "manelsalvador",
-    "sara_riera",
-    "anomalia",
-    "amaliacardenas",
-    "aluna",
-    "carlosrodero",
-    "lydia",
-    "elibonfill",
-    "marinatorresgi",
-    "meri",
-    "monyant",
-    "ura4dive",
-    "lauracoro",
-    "pirotte_",
-    "oceanicos",
-    "abril",
-    "alba_barrera",
-    "amb_platges",
-    "daniel_palacios",
-    "davidpiquer",
-    "laiamanyer",
-    "rogerpuig",
-    "guillemdavila",
-    # vanessa,
-    # teresa,
-]
-
 
 def get_main_metrics(proj_id):
     species = f"{API_PATH}/observations/species_counts?"
@@ -213,7 +172,7 @@ def get_list_users(id_project):
 
 def get_participation_df(main_project):
     pt_users = get_list_users(main_project)
-    pt_users_clean = pt_users[-pt_users["participant"].isin(exclude_users)]
+    pt_users_clean = drop_excluded(pt_users, "participant")
     # convertimos nombres de columnas a mayúsculas
     pt_users_clean.columns = pt_users_clean.columns.str.upper()
     return pt_users_clean
@@ -3,19 +3,35 @@ import json
 import math
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from bisect import bisect_right
+from itertools import accumulate
 
 import pandas as pd
 import requests
 from dotenv import load_dotenv
-from mecoda_minka import get_dfs, get_obs
 
-load_dotenv()
-
-API_PATH = "https://api.minka-sdg.org/v1"
+from campaign_filters import drop_excluded, exclude_params, exclude_user_ids
+from checkpoints import cached, data_fingerprint, finish_run, start_run
+from distinct_counts import sync_distinct_counts
+from http_cache import prune
+from identifications import check_identifications
+from instrumentation import stage, write_report
+from leaderboard import sync_leaderboard
+from minka_api import (
+    API_PATH,
+    SESSION,
+    get_json,
+    get_total_results,
+    map_concurrent,
+)
+from obs_stream import stream_obs, update_obs
+from output_writer import write_csv, write_manifest
+from reconcile import reconcile_dataset
+from schema import read_obs
+from sidecar import dataset_info
+from spatial_grid import SpatialGrid
 
-# Global session for all requests
-SESSION = requests.Session()
+load_dotenv()
 
 # Global API token
 
@@ -27,49 +43,6 @@ projects_bmt = {
     420: "Barcelona",
 }
 
-exclude_users = [
-    "xasalva",
-    "bertinhaco",
-    "andrea",
-    "laurabiomar",
-    "guillermoalvarez_fecdas",
-    "mediambient_ajelprat",
-    "fecdas_mediambient",
-    "planctondiving",
-    "marinagm",
-    "CEM",
-    "jaume-piera",
-    "sonialinan",
-    "adrisoacha",
-    "anellides",
-    "irodero",
-    "manelsalvador",
-    "sara_riera",
-    "anomalia",
-    "amaliacardenas",
-    "aluna",
-    "carlosrodero",
-    "lydia",
-    "elibonfill",
-    "marinatorresgi",
-    "meri",
-    "monyant",
-    "ura4dive",
-    "lauracoro",
-    "pirotte_",
-    "oceanicos",
-    "abril",
-    "alba_barrera",
-    "amb_platges",
-    "daniel_palacios",
-    "davidpiquer",
-    "laiamanyer",
-    "rogerpuig",
-    "guillemdavila",
-    # vanessa,
-    # teresa,
-]
-
 
 def get_access_token():
     url = "https://www.minka-sdg.org/oauth/token"
@@ -112,119 +85,96 @@ def get_access_token():
 
 def get_main_metrics(proj_id):
     headers = {"Authorization": f"Bearer {access_token}"}
+    params = exclude_params({"project_id": proj_id})
+
+    total_species, total_participants, total_obs = map_concurrent(
+        lambda url: get_total_results(url, params, headers),
+        [
+            f"{API_PATH}/observations/species_counts",
+            f"{API_PATH}/observations/observers",
+            f"{API_PATH}/observations",
+        ],
+    )
 
-    def make_api_request(url, max_retries=3):
-        for attempt in range(max_retries):
-            try:
-                response = SESSION.get(url, headers=headers)
-                response.raise_for_status()
-                json_data = response.json()
-
-                if "total_results" not in json_data:
-                    print(
-                        f"Warning: API response missing 'total_results', retrying... (attempt {attempt + 1})"
-                    )
-                    if attempt < max_retries - 1:
-                        time.sleep(2**attempt)
-                        continue
-                    else:
-                        raise ValueError(
-                            "API response missing 'total_results' after retries"
-                        )
-
-                return json_data["total_results"]
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(
-                        f"API request failed (attempt {attempt + 1}): {e}, retrying after delay..."
-                    )
-                    time.sleep(2**attempt)
-                else:
-                    print(f"API request failed after {max_retries} attempts: {e}")
-                    raise
-
-    species = f"{API_PATH}/observations/species_counts?"
-    url1 = f"{species}project_id={proj_id}"
-    total_species = make_api_request(url1)
+    return total_species, total_participants, total_obs
 
-    observers = f"{API_PATH}/observations/observers?"
-    url2 = f"{observers}project_id={proj_id}"
-    total_participants = make_api_request(url2)
 
-    observations = f"{API_PATH}/observations?"
-    url3 = f"{observations}project_id={proj_id}"
-    total_obs = make_api_request(url3)
+def get_observations_per_day(proj_id, days):
+    """
+    Observaciones acumuladas hasta cada día (lo que daría created_d2=día)
+    con una consulta al histograma diario del proyecto entre el primer y el
+    último día, más el total hasta el día anterior al primero
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    params = exclude_params(
+        {
+            "project_id": proj_id,
+            "date_field": "created",
+            "interval": "day",
+            "created_d1": days[0],
+            "created_d2": days[-1],
+        }
+    )
+    # lo anterior al rango no sale en el histograma
+    day_before = datetime.date.fromisoformat(days[0]) - datetime.timedelta(days=1)
+    base = get_total_results(
+        f"{API_PATH}/observations",
+        exclude_params(
+            {"project_id": proj_id, "created_d2": str(day_before), "per_page": 1}
+        ),
+        headers,
+    )
+    histogram = get_json(f"{API_PATH}/observations/histogram", params, headers)
+    counts = {date[:10]: n for date, n in histogram["results"]["day"].items()}
 
-    return total_species, total_participants, total_obs
+    dates = sorted(counts)
+    cumulative = list(accumulate((counts[date] for date in dates), initial=base))
+    totals = {}
+    for day in days:
+        totals[day] = cumulative[bisect_right(dates, day)]
+    return totals
 
 
-def fetch_day_metrics(proj_id, day_str):
-    """Fetch metrics for a single day"""
+def _fetch_day_totals(proj_id, day_str):
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    def make_api_request(url, max_retries=3):
-        for attempt in range(max_retries):
-            try:
-                response = SESSION.get(url, headers=headers)
-                response.raise_for_status()
-                json_data = response.json()
+    species = f"{API_PATH}/observations/species_counts"
+    observers = f"{API_PATH}/observations/observers"
 
-                if "total_results" not in json_data:
-                    print(
-                        f"Warning: API response missing 'total_results', retrying... (attempt {attempt + 1})"
-                    )
-                    if attempt < max_retries - 1:
-                        time.sleep(2**attempt)
-                        continue
-                    else:
-                        raise ValueError(
-                            "API response missing 'total_results' after retries"
-                        )
-
-                return json_data["total_results"]
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(
-                        f"API request failed (attempt {attempt + 1}): {e}, retrying after delay..."
-                    )
-                    time.sleep(2**attempt)
-                else:
-                    print(f"API request failed after {max_retries} attempts: {e}")
-                    raise
-
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-
-    params = {
-        "project_id": proj_id,
-        "created_d2": day_str,
-        "order": "desc",
-        "order_by": "created_at",
+    params = exclude_params(
+        {
+            "project_id": proj_id,
+            "created_d2": day_str,
+            "order": "desc",
+            "order_by": "created_at",
+        }
+    )
+
+    return {
+        "date": day_str,
+        "species": get_total_results(species, params, headers),
+        "participants": get_total_results(observers, params, headers),
     }
 
+
+def fetch_day_metrics(proj_id, day_str):
+    """Fetch species and participants for a single day"""
     try:
-        # Sequential requests with delay to avoid API rate limiting
-        total_species = make_api_request(
-            f"{species}project_id={proj_id}&created_d2={day_str}&order=desc&order_by=created_at"
-        )
-        total_participants = make_api_request(
-            f"{observers}project_id={proj_id}&created_d2={day_str}&order=desc&order_by=created_at"
-        )
-        total_obs = make_api_request(
-            f"{observations}project_id={proj_id}&created_d2={day_str}&order=desc&order_by=created_at"
+        # los días ya consultados en un intento anterior de esta ejecución
+        # se leen del checkpoint
+        return cached(
+            "day_metrics",
+            (proj_id, day_str),
+            lambda: _fetch_day_totals(proj_id, day_str),
         )
 
     except Exception as e:
         print(f"Error fetching data for {day_str}: {e}")
-        total_species = total_participants = total_obs = 0
-
-    return {
-        "date": day_str,
-        "observations": total_obs,
-        "species": total_species,
-        "participants": total_participants,
-    }
+        return {
+            "date": day_str,
+            "species": 0,
+            "participants": 0,
+        }
 
 
 def update_main_metrics_by_day(proj_id):
@@ -242,96 +192,51 @@ def update_main_metrics_by_day(proj_id):
                 days_to_process.append(day.strftime("%Y-%m-%d"))
                 day = day + datetime.timedelta(days=1)
 
-        print(f"Processing {len(days_to_process)} days in parallel...")
-
-        # Process days in smaller batches with reduced concurrency
-        results = []
-        batch_size = 5  # Reduced batch size to avoid API rate limiting
-
-        for i in range(0, len(days_to_process), batch_size):
-            batch = days_to_process[i : i + batch_size]
-            print(
-                f"Processing batch {i//batch_size + 1}/{(len(days_to_process) + batch_size - 1)//batch_size}"
-            )
-
-            with ThreadPoolExecutor(max_workers=3) as executor:  # Reduced max_workers
-                futures = [
-                    executor.submit(fetch_day_metrics, proj_id, day_str)
-                    for day_str in batch
-                ]
-                for future in as_completed(futures):
-                    try:
-                        result = future.result()
-                        results.append(result)
-                    except Exception as e:
-                        print(f"Error processing day: {e}")
+        # Observaciones de todos los días con una petición al histograma
+        observations = {}
+        try:
+            if days_to_process:
+                observations = cached(
+                    "observations_per_day",
+                    (proj_id, days_to_process[-1]),
+                    lambda: get_observations_per_day(proj_id, days_to_process),
+                )
+        except Exception as e:
+            print(f"Error fetching observations histogram: {e}")
 
-            # Add delay between batches
-            import time
+        print(f"Processing {len(days_to_process)} days in parallel...")
 
-            time.sleep(0.5)
+        # Especies y participantes siguen siendo por día. La concurrencia la
+        # ajusta el controlador de minka_api según la latencia y los 429 de la API
+        results = map_concurrent(
+            lambda day_str: fetch_day_metrics(proj_id, day_str), days_to_process
+        )
+        for result in results:
+            result["observations"] = observations.get(result["date"], 0)
 
         # Sort results by date
         results.sort(key=lambda x: x["date"])
-        result_df = pd.DataFrame(results)
+        result_df = pd.DataFrame(
+            results, columns=["date", "observations", "species", "participants"]
+        )
         print("Updated main metrics")
         return result_df
 
 
 def get_metrics_proj(proj_id, proj_city):
     headers = {"Authorization": f"Bearer {access_token}"}
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
-
-    def make_api_request(url, max_retries=3):
-        for attempt in range(max_retries):
-            try:
-                response = SESSION.get(url, headers=headers)
-                response.raise_for_status()
-                json_data = response.json()
-
-                if "total_results" not in json_data:
-                    print(
-                        f"Warning: API response missing 'total_results', retrying... (attempt {attempt + 1})"
-                    )
-                    if attempt < max_retries - 1:
-                        time.sleep(2**attempt)
-                        continue
-                    else:
-                        raise ValueError(
-                            "API response missing 'total_results' after retries"
-                        )
-
-                return json_data["total_results"]
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(
-                        f"API request failed (attempt {attempt + 1}): {e}, retrying after delay..."
-                    )
-                    time.sleep(2**attempt)
-                else:
-                    print(f"API request failed after {max_retries} attempts: {e}")
-                    raise
-
-    # Parallelize the 3 API calls
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        future_species = executor.submit(
-            make_api_request,
-            f"{species}project_id={proj_id}&order=desc&order_by=created_at",
-        )
-        future_observers = executor.submit(
-            make_api_request,
-            f"{observers}project_id={proj_id}&order=desc&order_by=created_at",
-        )
-        future_observations = executor.submit(
-            make_api_request,
-            f"{observations}project_id={proj_id}&order=desc&order_by=created_at",
-        )
+    params = exclude_params(
+        {"project_id": proj_id, "order": "desc", "order_by": "created_at"}
+    )
 
-        total_species = future_species.result()
-        total_participants = future_observers.result()
-        total_obs = future_observations.result()
+    total_species, total_participants, total_obs = map_concurrent(
+        lambda url: get_total_results(url, params, headers),
+        [
+            f"{API_PATH}/observations/species_counts",
+            f"{API_PATH}/observations/observers",
+            f"{API_PATH}/observations",
+        ],
+    )
 
     result = {
         "project": proj_id,
@@ -357,8 +262,8 @@ def create_df_projs(projects):
 
 def get_missing_taxon(taxon_id, rank):
     headers = {"Authorization": f"Bearer {access_token}"}
-    url = f"https://api.minka-sdg.org/v1/taxa/{taxon_id}"
-    ancestors = SESSION.get(url, headers=headers).json()["results"][0]["ancestors"]
+    url = f"{API_PATH}/taxa/{taxon_id}"
+    ancestors = get_json(url, headers=headers)["results"][0]["ancestors"]
     for anc in ancestors:
         if anc["rank"] == rank:
             return anc["name"]
@@ -368,42 +273,30 @@ def _get_species(user_name, proj_id):
     headers = {"Authorization": f"Bearer {access_token}"}
     species = f"{API_PATH}/observations/species_counts"
     params = {"project_id": proj_id, "user_login": user_name, "rank": "species"}
-    return SESSION.get(species, params=params, headers=headers).json()["total_results"]
+    return get_total_results(species, params, headers)
 
 
-def get_list_users(id_project):
+def get_list_users(id_project, df_obs):
+    # clasificación incremental desde las observaciones descargadas (sin
+    # quitar las de los excluidos, cuyas identificaciones en observaciones de
+    # otros cuentan): solo se aplican las nuevas o cambiadas desde la
+    # ejecución anterior
+    leaderboard = sync_leaderboard(f"biomarato25_{id_project}", df_obs)
+    # con MINKA_RECONCILE_IDENTIFICATIONS=1 se comparan con la API
     headers = {"Authorization": f"Bearer {access_token}"}
-    users = []
-    url1 = f"https://api.minka-sdg.org/v1/observations/observers?project_id={id_project}&quality_grade=research"
-    results = SESSION.get(url1, headers=headers).json()["results"]
-    for result in results:
-        datos = {}
-        datos["user_id"] = result["user_id"]
-        datos["participant"] = result["user"]["login"]
-        datos["observacions"] = result["observation_count"]
-        datos["espècies"] = result["species_count"]
-        users.append(datos)
-    df_users = pd.DataFrame(users)
-
-    identifiers = []
-    url = f"https://api.minka-sdg.org/v1/observations/identifiers?project_id={id_project}&quality_grade=research"
-    results = SESSION.get(url, headers=headers).json()["results"]
-    for result in results:
-        datos = {}
-        datos["user_id"] = result["user_id"]
-        datos["identificacions"] = result["count"]
-        identifiers.append(datos)
-    df_identifiers = pd.DataFrame(identifiers)
-
-    df_users = pd.merge(df_users, df_identifiers, how="left", on="user_id")
-    df_users.fillna(0, inplace=True)
-
-    return df_users[["participant", "observacions", "espècies", "identificacions"]]
-
-
-def get_participation_df(main_project):
-    pt_users = get_list_users(main_project)
-    pt_users_clean = pt_users[-pt_users["participant"].isin(exclude_users)]
+    check_identifications(
+        leaderboard.identifications_table(),
+        id_project,
+        {"quality_grade": "research"},
+        headers,
+    )
+    return leaderboard.top()
+
+
+def get_participation_df(main_project, df_obs):
+    pt_users = get_list_users(main_project, df_obs)
+    # por si algún login no se ha podido resolver a user_id
+    pt_users_clean = drop_excluded(pt_users, "participant")
     # convertimos nombres de columnas a mayúsculas
     pt_users_clean.columns = pt_users_clean.columns.str.upper()
     return pt_users_clean
@@ -445,57 +338,27 @@ def get_marine_species(proj_id):
     headers = {"Authorization": f"Bearer {access_token}"}
     total_sp = []
 
-    species = f"{API_PATH}/observations/species_counts?"
-    url1 = f"{species}project_id={proj_id}"
-
-    def make_api_request(url, max_retries=3):
-        for attempt in range(max_retries):
-            try:
-                response = SESSION.get(url, headers=headers)
-                response.raise_for_status()
-                json_data = response.json()
-
-                if "total_results" not in json_data:
-                    print(
-                        f"Warning: API response missing 'total_results', retrying... (attempt {attempt + 1})"
-                    )
-                    if attempt < max_retries - 1:
-                        time.sleep(2**attempt)
-                        continue
-                    else:
-                        raise ValueError(
-                            "API response missing 'total_results' after retries"
-                        )
-
-                return json_data["total_results"]
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(
-                        f"API request failed (attempt {attempt + 1}): {e}, retrying after delay..."
-                    )
-                    time.sleep(2**attempt)
-                else:
-                    print(f"API request failed after {max_retries} attempts: {e}")
-                    raise
+    species = f"{API_PATH}/observations/species_counts"
 
-    total_num = make_api_request(url1)
+    # sin los excluidos, como get_main_metrics: el recuento y la página 1 son la
+    # misma petición que el total de especies y se hacen una sola vez
+    params = exclude_params({"project_id": proj_id})
+    total_num = get_total_results(species, params, headers)
 
     pages = math.ceil(total_num / 500)
 
-    for i in range(pages):
-        especie = {}
-        page = i + 1
-        url = f"{species}project_id={proj_id}&page={page}"
-        response = SESSION.get(url, headers=headers)
-        json_data = response.json()
+    def get_page(page):
+        params = exclude_params({"project_id": proj_id, "page": page})
+        json_data = get_json(species, params, headers)
         if "results" not in json_data:
             print(
                 f"Warning: API response missing 'results' for page {page}, retrying..."
             )
             time.sleep(1)
-            response = SESSION.get(url, headers=headers)
-            json_data = response.json()
-        results = json_data["results"]
+            json_data = get_json(species, params, headers)
+        return json_data["results"]
+
+    for results in map_concurrent(get_page, range(1, pages + 1)):
         for result in results:
             especie = {}
             especie["taxon_id"] = result["taxon"]["id"]
@@ -549,145 +412,173 @@ def get_number_identifications(user_name, df_identifiers):
 
 
 # update obs for projects
-def get_new_data(project):
-    df_obs = pd.read_csv(f"data/biomarato25/{project}_obs.csv")
-    df_photos = pd.read_csv(f"data/biomarato25/{project}_photos.csv")
-    max_id = df_obs["id"].max()
-
-    # Comprueba si hay observaciones nuevas
-    obs = get_obs(id_project=project, id_above=max_id)
-    if len(obs) > 0:
-        print(f"Add {len(obs)} obs in project {project}")
-        df_obs2, df_photos2 = get_dfs(obs)
-        df_obs = pd.concat([df_obs, df_obs2], ignore_index=True)
-        df_obs.to_csv(f"data/biomarato25/{project}_obs.csv", index=False)
-        df_photos = pd.concat([df_photos, df_photos2], ignore_index=True)
-        df_photos.to_csv(f"data/biomarato25/{project}_photos.csv", index=False)
-
-
-def update_dfs_projects(
-    project,
-    day=(datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d"),
-):
-
-    # updated today
-    obs_nuevas = get_obs(id_project=project, updated_since=day)
-    if len(obs_nuevas) > 0:
-        df_obs_new, df_photos_new = get_dfs(obs_nuevas)
-        df_photos_new["photos_id"] = df_photos_new["photos_id"].astype(int)
-
-        # get downloaded
-        df_obs = pd.read_csv(f"data/biomarato25/{project}_obs.csv")
-        df_photos = pd.read_csv(f"data/biomarato25/{project}_photos.csv")
-        old_obs = df_obs[-df_obs["id"].isin(df_obs_new["id"].to_list())]
-        old_photos = df_photos[
-            -df_photos["photos_id"].isin(df_photos_new["photos_id"].to_list())
-        ]
-
-        # join old and updated
-        df_obs_updated = pd.concat(
-            [old_obs, df_obs_new], ignore_index=True
-        ).sort_values(by="id", ascending=False)
-        df_photo_updated = pd.concat(
-            [old_photos, df_photos_new], ignore_index=True
-        ).sort_values(by="photos_id", ascending=False)
-    else:
-        df_obs_updated = None
-        df_photo_updated = None
-
-    # remove casuals
-    obs_casual = get_obs(grade="casual", updated_since=day)
-    if len(obs_casual) > 0:
-        casual_ids = [ob_casual.id for ob_casual in obs_casual]
-        df_obs_updated = df_obs_updated[-df_obs_updated["id"].isin(casual_ids)]
-        df_photo_updated = df_photo_updated[-df_photo_updated["id"].isin(casual_ids)]
-
-    df_obs_updated.to_csv(f"data/biomarato25/{project}_obs.csv", index=False)
-    df_photo_updated.to_csv(f"data/biomarato25/{project}_photos.csv", index=False)
-
-    print(f"Updated obs and photos for project {project}: {len(df_obs_updated)}")
-
-
 if __name__ == "__main__":
 
     # BioMARató 2024
     start_time = time.time()
 
+    # Si es un reintento de la misma ejecución se reanuda desde los checkpoints
+    start_run()
+    # Respuestas de la API guardadas que llevan días sin usarse
+    prune()
+
     # Obtener access_token de admin
     access_token = get_access_token()
 
+    # Usuarios excluidos de las métricas (equipo y entidades), resueltos una vez
+    exclude_user_ids()
+
     # Actualiza main metrics
-    main_metrics_df = update_main_metrics_by_day(main_project_bmt)
-    if main_metrics_df is not None:
-        main_metrics_df.to_csv(
-            f"data/biomarato25/{main_project_bmt}_main_metrics_per_day.csv", index=False
-        )
-        print("Main metrics actualizada")
+    with stage("main_metrics_per_day"):
+        main_metrics_df = update_main_metrics_by_day(main_project_bmt)
+        if main_metrics_df is not None:
+            write_csv(
+                main_metrics_df,
+                f"data/biomarato25/{main_project_bmt}_main_metrics_per_day.csv",
+            )
+            print("Main metrics actualizada")
 
     # Actualiza métricas de los proyectos
-    df_projs = create_df_projs(projects_bmt)
-    df_projs.to_csv(
-        f"data/biomarato25/{main_project_bmt}_main_metrics_projects.csv", index=False
-    )
-    print("Main metrics of city projects actualizado")
+    with stage("main_metrics_projects"):
+        df_projs = cached(
+            "main_metrics_projects",
+            (
+                projects_bmt,
+                data_fingerprint(
+                    *[f"data/biomarato25/{id_proj}_obs.csv" for id_proj in projects_bmt]
+                ),
+            ),
+            lambda: create_df_projs(projects_bmt),
+        )
+        write_csv(
+            df_projs, f"data/biomarato25/{main_project_bmt}_main_metrics_projects.csv"
+        )
+        print("Main metrics of city projects actualizado")
 
     # Actualiza df_obs y df_photos totales
     for id_proj in [417, 418, 419, 420]:
-        # Update df_proj
-        obs = get_obs(id_project=id_proj, grade="research")
-        try:
-            downloaded_obs = pd.read_csv(f"data/biomarato25/{id_proj}_obs.csv")
-        except:
-            downloaded_obs = pd.DataFrame()
-
-        if (len(obs) > 0) & (len(obs) != len(downloaded_obs)):
-            df_obs, df_photos = get_dfs(obs)
-            df_obs.to_csv(f"data/biomarato25/{id_proj}_obs.csv", index=False)
-            df_photos.to_csv(f"data/biomarato25/{id_proj}_photos.csv", index=False)
-
-            # Sacar columna marino
-            print("Sacando columna marine")
-            df_obs["taxon_id"] = df_obs["taxon_id"].replace("nan", None)
-            df_filtered = df_obs[df_obs["taxon_id"].notnull()].copy()
-            df_filtered["taxon_id"] = df_filtered["taxon_id"].astype(int)
-
-            # sacamos listado de especies incluidas en el proyecto con col marina
-            print("Sacando listado de especies")
-            df_species = get_marine_species(id_proj)
-
-            df_filtered = pd.merge(
-                df_filtered,
-                df_species[["taxon_id", "marine"]],
-                on="taxon_id",
-                how="left",
-            )
-
-            # Dataframe de participantes
-            print("Dataframe de participantes")
-            df_users = get_participation_df(id_proj)
-            df_users.to_csv(f"data/biomarato25/{id_proj}_users.csv", index=False)
-
-            # Dataframe de marino/terrestre
-            print("Cuenta de marinos/terrestres")
-            try:
-                df_marine = get_marine_count(df_filtered)
-                df_marine.to_csv(f"data/biomarato25/{id_proj}_marines.csv", index=False)
-            except:
-                pass
-        else:
-            print("Ninguna observación en proyecto:", id_proj)
+        with stage(f"project_{id_proj}"):
+            # Update df_proj
+            params = {"project_id": id_proj, "quality_grade": "research"}
+            total_obs = get_json(f"{API_PATH}/observations", {**params, "per_page": 1})[
+                "total_results"
+            ]
+            # filas ya descargadas, de los metadatos del CSV
+            info = dataset_info(f"data/biomarato25/{id_proj}_obs.csv")
+            downloaded_obs = info["rows"] if info else 0
+
+            if (total_obs > 0) & (total_obs != downloaded_obs):
+                # Bajas (borradas o que ya no son research) se quitan con la
+                # lista de ids; las altas se piden por id
+                new_ids = None
+                if downloaded_obs:
+                    _, new_ids = reconcile_dataset(
+                        f"data/biomarato25/{id_proj}_obs.csv",
+                        f"data/biomarato25/{id_proj}_photos.csv",
+                        params,
+                    )
+                if new_ids is None:
+                    # Primera descarga o lista de ids incompleta: todo, por
+                    # páginas directamente a los CSV
+                    stream_obs(
+                        f"data/biomarato25/{id_proj}_obs.csv",
+                        f"data/biomarato25/{id_proj}_photos.csv",
+                        **params,
+                    )
+                else:
+                    # Solo las altas y las actualizadas desde la última vez
+                    update_obs(
+                        f"data/biomarato25/{id_proj}_obs.csv",
+                        f"data/biomarato25/{id_proj}_photos.csv",
+                        new_ids,
+                        updated_since=info["max_updated_at"],
+                        **params,
+                    )
+                # Se guardan todas las observaciones; las métricas se calculan
+                # sin las de los excluidos, igual que los totales de la API
+                df_all = read_obs(f"data/biomarato25/{id_proj}_obs.csv")
+                # los checkpoints de las etapas siguientes valen para estos datos
+                data = data_fingerprint(f"data/biomarato25/{id_proj}_obs.csv")
+                df_obs = drop_excluded(df_all, "user_id")
+
+                # Especies y participantes distintos por día (acumulados y semanales),
+                # calculados desde las observaciones sin más peticiones a la API y
+                # aplicando solo las que han cambiado desde la ejecución anterior
+                df_distinct = sync_distinct_counts(
+                    f"biomarato25_{id_proj}", df_obs
+                ).daily_table(window=7)
+                write_csv(
+                    df_distinct, f"data/biomarato25/{id_proj}_distinct_per_day.csv"
+                )
+
+                # Rejilla de celdas para los mapas (total y por día)
+                grid = SpatialGrid(df_obs)
+                write_csv(grid.cells_table(), f"data/biomarato25/{id_proj}_grid.csv")
+                write_csv(
+                    grid.daily_table(), f"data/biomarato25/{id_proj}_grid_per_day.csv"
+                )
+
+                # Sacar columna marino
+                print("Sacando columna marine")
+                df_filtered = df_obs[df_obs["taxon_id"].notnull()].copy()
+
+                # sacamos listado de especies incluidas en el proyecto con col marina
+                print("Sacando listado de especies")
+                df_species = cached(
+                    "marine_species",
+                    (id_proj, data),
+                    lambda: get_marine_species(id_proj),
+                )
+
+                df_filtered = pd.merge(
+                    df_filtered,
+                    df_species[["taxon_id", "marine"]],
+                    on="taxon_id",
+                    how="left",
+                )
+
+                # Dataframe de participantes
+                print("Dataframe de participantes")
+                df_users = cached(
+                    "participation",
+                    (id_proj, data),
+                    lambda: get_participation_df(id_proj, df_all),
+                )
+                write_csv(
+                    df_users,
+                    f"data/biomarato25/{id_proj}_users.csv",
+                    sort_by=["OBSERVACIONS", "PARTICIPANT"],
+                    ascending=[False, True],
+                )
+
+                # Dataframe de marino/terrestre
+                print("Cuenta de marinos/terrestres")
+                try:
+                    df_marine = get_marine_count(df_filtered)
+                    write_csv(df_marine, f"data/biomarato25/{id_proj}_marines.csv")
+                except:
+                    pass
+            else:
+                print("Ninguna observación en proyecto:", id_proj)
 
     # Dataframe métricas totales
-    total_species, total_participants, total_obs = get_main_metrics(main_project_bmt)
-    df = pd.DataFrame(
-        {
-            "metrics": ["observacions", "espècies", "participants"],
-            "values": [total_obs, total_species, total_participants],
-        }
-    )
-    df.to_csv(
-        f"data/biomarato25/{main_project_bmt}_metrics_tiempo_real.csv", index=False
-    )
+    with stage("metrics_tiempo_real"):
+        total_species, total_participants, total_obs = get_main_metrics(
+            main_project_bmt
+        )
+        df = pd.DataFrame(
+            {
+                "metrics": ["observacions", "espècies", "participants"],
+                "values": [total_obs, total_species, total_participants],
+            }
+        )
+        write_csv(df, f"data/biomarato25/{main_project_bmt}_metrics_tiempo_real.csv")
+
+    write_manifest()
+    write_report()
+
+    # Ejecución completa: ya no hace falta reanudar nada
+    finish_run()
 
     end_time = time.time()
 
@@ -6,9 +6,11 @@ import pandas as pd
 import requests
 from dotenv import load_dotenv
 
-load_dotenv()
+from instrumentation import stage, write_report
+from minka_api import API_PATH, get_total_results, map_concurrent
+from output_writer import write_csv, write_manifest
 
-API_PATH = "https://api.minka-sdg.org/v1"
+load_dotenv()
 
 
 def get_access_token():
@@ -52,12 +54,11 @@ def get_access_token():
 
 def get_metrics_proj(proj_ids, access_token=None):
     headers = {"Authorization": f"Bearer {access_token}"} if access_token else {}
-    session = requests.Session()
     total_results = []
 
-    observations = f"{API_PATH}/observations?"
-    species = f"{API_PATH}/observations/species_counts?"
-    observers = f"{API_PATH}/observations/observers?"
+    observations = f"{API_PATH}/observations"
+    species = f"{API_PATH}/observations/species_counts"
+    observers = f"{API_PATH}/observations/observers"
 
     params = {
         "project_id": proj_ids,
@@ -66,15 +67,10 @@ def get_metrics_proj(proj_ids, access_token=None):
     }
 
     try:
-        total_species = session.get(species, headers=headers, params=params).json()[
-            "total_results"
-        ]
-        total_participants = session.get(
-            observers, headers=headers, params=params
-        ).json()["total_results"]
-        total_obs = session.get(observations, headers=headers, params=params).json()[
-            "total_results"
-        ]
+        total_species, total_participants, total_obs = map_concurrent(
+            lambda url: get_total_results(url, params, headers),
+            [species, observers, observations],
+        )
 
         result = {
             "observations": total_obs,
@@ -107,13 +103,14 @@ if __name__ == "__main__":
     # 367, BioMARató 2021 (Catalunya)
     # 417, biomarato-2025-catalunya
 
-    df_total = get_metrics_proj(proj_ids, access_token)
+    with stage("global_counter"):
+        df_total = get_metrics_proj(proj_ids, access_token)
 
     if not df_total.empty:
-        downloaded_data = pd.read_csv("data/biomarato_global_counter.csv")
-        if downloaded_data["observations"].iloc[0] != df_total["observations"].iloc[0]:
-            df_total.to_csv("data/biomarato_global_counter.csv", index=False)
-        else:
+        if not write_csv(df_total, "data/biomarato_global_counter.csv"):
             print("No changes in data.")
     else:
         print("No data retrieved, skipping CSV update.")
+
+    write_manifest()
+    write_report()